@@ -0,0 +1,209 @@
+import ctypes
+import multiprocessing
+
+import numpy as np
+
+from typing import TYPE_CHECKING
+
+from pytracer.intersectables.containers.mesh import Mesh
+from pytracer.intersectables.containers.mesh_instance import MeshInstance
+
+if TYPE_CHECKING:
+    from pytracer import HitRecord, Scene
+    from pytracer.hit_batch import HitBatch
+    from pytracer.ray import Ray
+    from pytracer.ray_batch import RayBatch
+
+
+class AovTable:
+    """
+    Turns primary hits into the per-sample rows of the AovBuffer, see
+    AovBuffer.SAMPLE_CHANNELS. Materials are numbered like the material table of
+    the WhittedWavefrontIntegrator, i.e. in the order of their first item in the
+    container of the scene. Primitives are numbered through all items of the
+    container: spheres, planes and triangles count as one primitive, meshes and
+    mesh instances as all of their triangles in the order of their faces.
+    """
+
+    def __init__(self, scene: 'Scene'):
+        self.materials = []
+        self.material_ids = {}
+        item_material_ids = []
+        is_mesh = []
+        primitive_counts = []
+        for item in scene.intersectable_list.container:
+            if id(item.material) not in self.material_ids:
+                self.material_ids[id(item.material)] = len(self.materials)
+                self.materials.append(item.material)
+            item_material_ids.append(self.material_ids[id(item.material)])
+
+            mesh = item.mesh if isinstance(item, MeshInstance) else item
+            is_mesh.append(isinstance(mesh, Mesh))
+            primitive_counts.append(len(mesh.triangle_buffer) if is_mesh[-1] else 1)
+
+        self.item_material_ids = np.array(item_material_ids, dtype=np.int64)
+        self.is_mesh = np.array(is_mesh, dtype=bool)
+        self.primitive_offsets = np.cumsum([0] + primitive_counts[:-1]).astype(np.int64)
+
+    def primitive_ids(self, item_ids: np.ndarray, face_ids: np.ndarray) -> np.ndarray:
+        """
+        @param item_ids indices of the hit items in the container of the scene
+        @param face_ids face ids of the hit triangles of meshes, see HitRecord.primitive_id and HitBatch.primitive_ids
+        @return the ids of the hit primitives within the scene
+        """
+
+        return self.primitive_offsets[item_ids] + np.where(self.is_mesh[item_ids], face_ids, 0)
+
+    def sample(self, ray: 'Ray', hit_record: 'HitRecord') -> np.ndarray:
+        """
+        @param ray a camera ray
+        @param hit_record the hit of the ray, None or invalid if it missed the scene
+        @return the AovBuffer.SAMPLE_CHANNELS row of the ray
+        """
+
+        sample = AovBuffer.empty_samples(1)[0]
+        if hit_record is None or not hit_record.is_valid():
+            return sample
+
+        sample[AovBuffer.DEPTH] = hit_record.t * ray.direction.length()
+        sample[AovBuffer.NORMAL] = hit_record.normal.tolist()
+        sample[AovBuffer.ALBEDO] = hit_record.material.evaluate_albedo(hit_record).tolist()
+        sample[AovBuffer.MATERIAL_ID] = self.material_ids[id(hit_record.material)]
+        sample[AovBuffer.PRIMITIVE_ID] = self.primitive_ids(np.array([hit_record.item_id]),
+                                                            np.array([hit_record.primitive_id]))[0]
+        return sample
+
+    def samples(self, rays: 'RayBatch', is_hit: np.ndarray, hits: 'HitBatch') -> np.ndarray:
+        """
+        @param rays camera rays
+        @param is_hit (N,) boolean mask of the rays that hit the scene
+        @param hits compacted hits of the rays, see WhittedWavefrontIntegrator.intersect_stage
+        @return (N, AovBuffer.SAMPLE_CHANNELS) rows of the rays
+        """
+
+        samples = AovBuffer.empty_samples(len(rays))
+        hit_samples = samples[is_hit]
+        hit_samples[:, AovBuffer.DEPTH] = hits.t * np.linalg.norm(rays.directions[is_hit], axis=1)
+        hit_samples[:, AovBuffer.NORMAL] = hits.normals
+        for material_id in np.unique(hits.material_ids):
+            mask = hits.material_ids == material_id
+            hit_samples[mask, AovBuffer.ALBEDO] = self.materials[material_id].evaluate_albedo_batch(hits.select(mask))
+        hit_samples[:, AovBuffer.MATERIAL_ID] = hits.material_ids
+        hit_samples[:, AovBuffer.PRIMITIVE_ID] = self.primitive_ids(hits.item_ids, hits.primitive_ids)
+
+        samples[is_hit] = hit_samples
+        return samples
+
+
+class AovBuffer:
+    """
+    Arbitrary output variables (AOVs) of the primary hits, collected during
+    the render next to the Framebuffer instead of in a render of their own:
+
+      depth         distance from the camera to the hit, inf where no sample hit the scene
+      normal        surface normal
+      albedo        color of the surface independent of the lighting, see Material.evaluate_albedo
+      material_id   material of the hit, see AovTable, -1 where the sample missed the scene
+      primitive_id  primitive of the hit within the scene, see AovTable, -1 where the sample missed
+
+    Integrators fill one row of SAMPLE_CHANNELS per camera ray, see
+    Integrator.integrate_batch. Depth, normal and albedo are averaged over the
+    samples of a pixel that hit the scene, the ids are those of the last
+    sample of the pixel that hit the scene. Like the Framebuffer the float32 (height, width, 10)
+    array lives in shared memory, such that all render workers add to it. The
+    ids are exact up to 2 ** 24.
+    """
+
+    # name -> number of channels of the outputs
+    AOVS = {
+        "depth": 1,
+        "normal": 3,
+        "albedo": 3,
+        "material_id": 1,
+        "primitive_id": 1
+    }
+
+    # columns of the rows of the samples
+    SAMPLE_CHANNELS = 9
+    DEPTH = 0
+    NORMAL = slice(1, 4)
+    ALBEDO = slice(4, 7)
+    MATERIAL_ID = 7
+    PRIMITIVE_ID = 8
+
+    # the buffer holds the sums of the first HITS columns of the hit samples,
+    # the number of hit samples and the ids of the last hit sample
+    CHANNELS = 10
+    HITS = 7
+    IDS = slice(8, 10)
+
+    def __init__(self, width: int, height: int, raw_aovs=None):
+        """
+        @param width image width in pixels
+        @param height image height in pixels
+        @param raw_aovs shared ctypes float array of size width * height * 10,
+          a new array without any samples is allocated by default.
+        """
+
+        self.width = width
+        self.height = height
+        self.raw_aovs = raw_aovs
+        if self.raw_aovs is None:
+            self.raw_aovs = multiprocessing.RawArray(ctypes.c_float, width * height * self.CHANNELS)
+            self.map_aovs()[..., self.IDS] = -1.0
+
+        self.aovs = self.map_aovs()
+
+    def map_aovs(self) -> np.ndarray:
+        return np.frombuffer(self.raw_aovs, dtype=np.float32).reshape((self.height, self.width, self.CHANNELS))
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["aovs"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.aovs = self.map_aovs()
+
+    @classmethod
+    def empty_samples(cls, count: int) -> np.ndarray:
+        """
+        @return (count, SAMPLE_CHANNELS) rows of samples that missed the scene
+        """
+
+        samples = np.zeros((count, cls.SAMPLE_CHANNELS))
+        samples[:, cls.MATERIAL_ID] = -1.0
+        samples[:, cls.PRIMITIVE_ID] = -1.0
+        return samples
+
+    def accumulate(self, pixel_indices: np.ndarray, samples: np.ndarray) -> None:
+        """
+        @param pixel_indices (N,) flat pixel indices (row * width + col) of the samples
+        @param samples (N, SAMPLE_CHANNELS) rows of the samples, see Integrator.integrate_batch
+        """
+
+        flat_aovs = self.aovs.reshape((-1, self.CHANNELS))
+        is_hit = samples[:, self.MATERIAL_ID] >= 0
+        np.add.at(flat_aovs[:, :self.HITS], pixel_indices[is_hit], samples[is_hit, :self.HITS])
+        np.add.at(flat_aovs[:, self.HITS], pixel_indices[is_hit], 1.0)
+        # samples are in pixel order, the last assignment to a pixel wins. Misses keep the ids of earlier hits.
+        flat_aovs[pixel_indices[is_hit], self.IDS] = samples[is_hit, self.MATERIAL_ID:]
+
+    def images(self, names: tuple = tuple(AOVS)) -> dict:
+        """
+        @param names outputs to return, see AOVS
+        @return name -> float32 (height, width) image for single channel outputs,
+          (height, width, 3) otherwise
+        """
+
+        hits = self.aovs[..., self.HITS, None]
+        means = self.aovs[..., :self.HITS] / np.maximum(hits, 1.0)
+        images = {
+            "depth": np.where(hits[..., 0] > 0, means[..., self.DEPTH], np.inf).astype(np.float32),
+            "normal": means[..., self.NORMAL],
+            "albedo": means[..., self.ALBEDO],
+            "material_id": self.aovs[..., self.IDS.start],
+            "primitive_id": self.aovs[..., self.IDS.start + 1]
+        }
+        return {name: images[name] for name in names}
@@ -0,0 +1,102 @@
+import json
+import os
+
+import numpy as np
+
+
+class ArrayBundle:
+    """
+    Stores named numpy arrays together with JSON metadata in a single binary
+    file that can be memory-mapped as a whole. Layout:
+
+        [0, 8)              MAGIC
+        [8, 16)             length h of the header as little endian uint64
+        [16, 16 + h)        JSON header {"metadata": ..., "arrays": {name: {"dtype", "shape", "offset"}}}
+        [..., ...)          the array data, every array aligned to ALIGNMENT bytes
+    """
+
+    MAGIC = b"PYTRBNDL"
+    ALIGNMENT = 64
+    PREFIX_SIZE = 16
+
+    @classmethod
+    def write(cls, filepath: str, arrays: dict, metadata: dict = None) -> None:
+        """
+        Write the bundle to a temporary file first and rename it afterwards, such
+        that readers never see a partially written bundle.
+
+        @param filepath target file
+        @param arrays dict of name to numpy array
+        @param metadata JSON serializable dict
+        """
+
+        arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+        header = {"metadata": metadata or {}, "arrays": {}}
+        offset = 0
+        for name, array in arrays.items():
+            header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+            offset = cls.align(offset + array.nbytes)
+
+        header_bytes = json.dumps(header).encode("utf8")
+        data_offset = cls.align(cls.PREFIX_SIZE + len(header_bytes))
+
+        temporary_filepath = f"{filepath}.tmp{os.getpid()}"
+        with open(temporary_filepath, "wb") as file:
+            file.write(cls.MAGIC)
+            file.write(len(header_bytes).to_bytes(8, "little"))
+            file.write(header_bytes)
+            for name, array in arrays.items():
+                file.seek(data_offset + header["arrays"][name]["offset"])
+                file.write(array.tobytes())
+
+            file.truncate(data_offset + offset)
+
+        os.replace(temporary_filepath, filepath)
+
+    @classmethod
+    def read_metadata(cls, filepath: str) -> dict:
+        """
+        @return the metadata of a bundle without mapping its arrays
+        """
+
+        with open(filepath, "rb") as file:
+            return cls.read_header(file)[0]["metadata"]
+
+    @classmethod
+    def read(cls, filepath: str) -> tuple:
+        """
+        @param filepath bundle written by ArrayBundle.write
+        @return (arrays, metadata) where arrays is a dict of read-only arrays mapped from the file
+        """
+
+        with open(filepath, "rb") as file:
+            header, data_offset = cls.read_header(file)
+
+        arrays = {}
+        if os.path.getsize(filepath) > data_offset:
+            data = np.memmap(filepath, dtype=np.uint8, mode="r", offset=data_offset)
+        else:
+            data = np.zeros(0, dtype=np.uint8)
+
+        for name, description in header["arrays"].items():
+            dtype = np.dtype(description["dtype"])
+            shape = tuple(description["shape"])
+            begin = description["offset"]
+            end = begin + dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+            arrays[name] = data[begin:end].view(dtype).reshape(shape)
+
+        return arrays, header["metadata"]
+
+    @classmethod
+    def read_header(cls, file) -> tuple:
+        if file.read(len(cls.MAGIC)) != cls.MAGIC:
+            raise ValueError(f"{file.name} is not an array bundle")
+
+        header_size = int.from_bytes(file.read(8), "little")
+        header = json.loads(file.read(header_size).decode("utf8"))
+        return header, cls.align(cls.PREFIX_SIZE + header_size)
+
+    @classmethod
+    def align(cls, offset: int) -> int:
+        return -(-offset // cls.ALIGNMENT) * cls.ALIGNMENT
@@ -0,0 +1,3 @@
+from pytracer.benchmarks.benchmark import main
+
+main()
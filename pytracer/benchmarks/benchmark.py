@@ -0,0 +1,516 @@
+"""
+Throughput benchmark of the stages of the renderer.
+
+Usage: python -m pytracer.benchmarks [--stages camera,primitives,...] [--compare PREVIOUS_JSON]
+
+Every measurement reports rays per second and all measurements of a run are
+written to a JSON file, such that runs can be compared to catch regressions.
+The backends stage additionally checks that the numpy and the numba backend
+render the same images.
+"""
+
+import glob
+import json
+import logging
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from datetime import datetime
+from optparse import OptionParser
+
+import numpy as np
+
+from pytracer import Renderer, Scene
+from pytracer.benchmarks.synthetic_scenes import SyntheticScenes
+from pytracer.hit_batch import HitBatch
+from pytracer.integrators.numba_kernels import NUMBA_AVAILABLE
+from pytracer.integrators.whitted_integrator import WhittedIntegrator
+from pytracer.integrators.whitted_numba_integrator import WhittedNumbaIntegrator
+from pytracer.integrators.whitted_wavefront_integrator import WhittedWavefrontIntegrator
+from pytracer.intersectables.containers.bvh import BVH
+from pytracer.intersectables.containers.intersectable_list import IntersectableList
+from pytracer.intersectables.containers.mesh import Mesh
+from pytracer.intersectables.geometries.plane import Plane
+from pytracer.intersectables.geometries.sphere import Sphere
+from pytracer.intersectables.geometries.triangle import Triangle
+from pytracer.math.vec3 import Vec3
+from pytracer.ray import Ray
+from pytracer.scene import MATERIALS
+
+ROOT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+# default directory of the results
+RESULTS_PATH = os.path.join(ROOT_PATH, "output", "benchmarks")
+
+STAGES = ("camera", "primitives", "lists", "materials", "integrators", "backends", "renders")
+
+# largest difference of the radiance of a pixel between the backends that is accepted as rounding
+BACKEND_TOLERANCE = 1e-6
+
+# parameters of every material of pytracer.scene.MATERIALS
+MATERIAL_PARAMS = {
+    "blinn": {"diffuse": [0.8, 0.3, 0.1], "specular": [0.4, 0.4, 0.4], "shininess": 50.0},
+    "reflective": {"ks": [1.0, 1.0, 1.0]},
+    "refractive": {"refraction_index": 1.5, "ks": [1.0, 1.0, 1.0]},
+    "diffuse": {"emission": [0.5, 0.5, 0.5]},
+    "grid": {"line_color": [0.0, 0.0, 0.0], "tile_color": [1.0, 1.0, 1.0], "thickness": 0.1,
+             "shift": [0.5, 0.5, 0.5], "scale": 1.0}
+}
+
+
+class Benchmark:
+    """
+    Collects measurements of the form
+    {"stage", "name", "mode", "size", "rays", "seconds", "rays_per_second"}, where
+    mode is scalar for the per-ray code paths, batch for the vectorized ones and
+    render for complete renders. size is the number of objects or triangles of
+    synthetic scenes, None otherwise. seconds is the best of all repetitions.
+    Measurements of the backends stage also hold the max_difference of the
+    radiance rendered by both backends.
+    """
+
+    def __init__(self, width: int, height: int, repeat: int, work_path: str):
+        """
+        @param width, height resolution of the camera that generates the rays of a stage
+        @param repeat number of timed runs of every measurement
+        @param work_path directory the synthetic scenes are written to
+        """
+
+        self.width = width
+        self.height = height
+        self.repeat = repeat
+        self.work_path = work_path
+        self.results = []
+
+    def measure(self, stage: str, name: str, mode: str, rays: int, run, size: int = None) -> dict:
+        """
+        @param rays number of rays traced (or evaluations done) by one call of run
+        @param run function doing the measured work
+        """
+
+        seconds = math.inf
+        for _ in range(self.repeat):
+            start_time = time.perf_counter()
+            run()
+            seconds = min(seconds, time.perf_counter() - start_time)
+
+        result = {
+            "stage": stage,
+            "name": name,
+            "mode": mode,
+            "size": size,
+            "rays": rays,
+            "seconds": seconds,
+            "rays_per_second": rays / max(seconds, 1e-12)
+        }
+        self.results.append(result)
+        print(self.format_result(result), flush=True)
+        return result
+
+    @staticmethod
+    def format_result(result: dict) -> str:
+        size = "" if result["size"] is None else result["size"]
+        return (f"{result['stage']:<12} {result['name']:<38} {result['mode']:<7} {size:>7} "
+                f"{result['rays_per_second']:>14,.0f} rays/s")
+
+    @staticmethod
+    def load_scene(scene_filepath: str, width: int, height: int) -> Scene:
+        return Scene(scene_filepath, width, height, use_bundle=False)
+
+    def synthetic_scene(self, kind: str, size: int, width: int = None, height: int = None) -> Scene:
+        """
+        @param kind spheres or mesh, see SyntheticScenes
+        @param size number of spheres or triangles
+        """
+
+        filepath = os.path.join(self.work_path, f"{kind}_{size}.json")
+        if kind == "spheres":
+            description = SyntheticScenes.spheres(size)
+        else:
+            description = SyntheticScenes.triangle_mesh(os.path.join(self.work_path, f"mesh_{size}.obj"), size)
+
+        SyntheticScenes.write(filepath, description)
+        return self.load_scene(filepath, width or self.width, height or self.height)
+
+    @staticmethod
+    def primary_rays(scene: Scene):
+        """
+        @return (rays, ray_batch) the rays through the centers of all pixels
+        """
+
+        pixel_indices = np.arange(scene.width * scene.height)
+        ray_batch = scene.camera.make_worldspace_rays(pixel_indices // scene.width, pixel_indices % scene.width,
+                                                      [[0.5, 0.5]])
+        return [ray_batch.ray_at(k) for k in range(len(ray_batch))], ray_batch
+
+    def run_camera(self) -> None:
+        camera = self.synthetic_scene("spheres", 1).camera
+        ray_count = self.width * self.height
+        pixel_indices = np.arange(ray_count)
+
+        def scalar():
+            for i in range(self.width):
+                for j in range(self.height):
+                    camera.make_worldspace_ray(i, j, (0.5, 0.5))
+
+        def batch():
+            camera.make_worldspace_rays(pixel_indices // self.width, pixel_indices % self.width, [[0.5, 0.5]])
+
+        self.measure("camera", "make_worldspace_ray", "scalar", ray_count, scalar)
+        self.measure("camera", "make_worldspace_rays", "batch", ray_count, batch)
+
+    def run_primitives(self, triangle_count: int) -> None:
+        rays, ray_batch = self.primary_rays(self.synthetic_scene("spheres", 1))
+        material = MATERIALS["blinn"](MATERIAL_PARAMS["blinn"])
+
+        mesh_filepath = os.path.join(self.work_path, f"mesh_{triangle_count}.obj")
+        SyntheticScenes.write_height_field(mesh_filepath, triangle_count)
+
+        primitives = {
+            "sphere": Sphere(material, Vec3(0.0, 0.0, 0.0), 3.0),
+            "plane": Plane(material, Vec3(0.0, 0.0, 1.0), 4.0),
+            "triangle": Triangle(material, Vec3(-4.0, -4.0, 0.0), Vec3(4.0, -4.0, 0.0), Vec3(0.0, 4.0, 0.0), 0),
+            "mesh": Mesh(material, mesh_filepath)
+        }
+        for name, primitive in primitives.items():
+            size = triangle_count if name == "mesh" else None
+            self.measure("primitives", f"{name}.intersect", "scalar", len(rays),
+                         lambda: [primitive.intersect(ray) for ray in rays], size)
+            self.measure("primitives", f"{name}.intersect_batch", "batch", len(rays),
+                         lambda: primitive.intersect_batch(ray_batch), size)
+
+    def run_lists(self, sizes: list) -> None:
+        for size in sizes:
+            scene = self.synthetic_scene("spheres", size)
+            rays, ray_batch = self.primary_rays(scene)
+
+            intersectable_list = IntersectableList()
+            bvh = BVH()
+            for item in scene.intersectable_list.container:
+                intersectable_list.append(item)
+                bvh.append(item)
+            bvh.build()
+
+            self.measure("lists", "IntersectableList.intersect", "scalar", len(rays),
+                         lambda: [intersectable_list.intersect(ray) for ray in rays], size)
+            self.measure("lists", "BVH.intersect", "scalar", len(rays),
+                         lambda: [bvh.intersect(ray) for ray in rays], size)
+            self.measure("lists", "BVH.intersect_batch_items", "batch", len(rays),
+                         lambda: bvh.intersect_batch_items(ray_batch), size)
+
+    def run_materials(self) -> None:
+        ray_count = self.width * self.height
+        sphere = Sphere(None, Vec3(0.0, 0.0, 0.0), 1.0)
+        hit_record = sphere.intersect(Ray(Vec3(0.2, 0.3, 10.0), Vec3(0.0, 0.0, -1.0), perturbate=False))
+
+        # directions towards light sources, spread over the hemisphere of the hit
+        rng = np.random.default_rng(0)
+        directions = rng.normal(size=(ray_count, 3))
+        directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+        normal = np.asarray(hit_record.normal)
+        directions = np.where((directions @ normal)[:, None] < 0.0, -directions, directions)
+        w_ins = [Vec3.from_array(direction) for direction in directions]
+        w_out = hit_record.w_in
+
+        hits = HitBatch(
+            t=np.full(ray_count, hit_record.t),
+            positions=np.tile(np.asarray(hit_record.position), (ray_count, 1)),
+            normals=np.tile(normal, (ray_count, 1)),
+            w_in=np.tile(np.asarray(w_out), (ray_count, 1)),
+            material_ids=np.zeros(ray_count, dtype=np.int64)
+        )
+
+        for name, make_material in MATERIALS.items():
+            material = make_material(MATERIAL_PARAMS[name])
+            hit_record.material = material
+            self.measure("materials", f"{name}.evaluate_brdf", "scalar", ray_count,
+                         lambda: [material.evaluate_brdf(hit_record, w_out, w_in) for w_in in w_ins])
+            self.measure("materials", f"{name}.evaluate_brdf_batch", "batch", ray_count,
+                         lambda: material.evaluate_brdf_batch(hits, hits.w_in, directions))
+
+    def integrator_scenes(self, scene_filepaths: list, sizes: list, triangle_counts: list) -> list:
+        """
+        @return (name, size, scene) of the scene files and of the synthetic scenes of all sizes
+        """
+
+        scenes = [(os.path.splitext(os.path.basename(filepath))[0], None,
+                   self.load_scene(filepath, self.width, self.height)) for filepath in scene_filepaths]
+        scenes += [("spheres", size, self.synthetic_scene("spheres", size)) for size in sizes]
+        scenes += [("mesh", size, self.synthetic_scene("mesh", size)) for size in triangle_counts]
+        return scenes
+
+    def run_integrators(self, scene_filepaths: list, sizes: list, triangle_counts: list) -> None:
+        for name, size, scene in self.integrator_scenes(scene_filepaths, sizes, triangle_counts):
+            rays, ray_batch = self.primary_rays(scene)
+            whitted = WhittedIntegrator(scene)
+            wavefront = WhittedWavefrontIntegrator(scene)
+            self.measure("integrators", f"{name}:WhittedIntegrator", "scalar", len(rays),
+                         lambda: [whitted.integrate(ray) for ray in rays], size)
+            self.measure("integrators", f"{name}:WhittedWavefrontIntegrator", "batch", len(rays),
+                         lambda: wavefront.integrate_batch(ray_batch), size)
+
+    def run_backends(self, scene_filepaths: list, sizes: list, triangle_counts: list) -> list:
+        """
+        Integrate the primary rays of every scene with the numpy and the numba
+        backend and compare the images.
+
+        @return the names of the scenes whose images differ by more than BACKEND_TOLERANCE
+        """
+
+        if not NUMBA_AVAILABLE:
+            print("backends     skipped, numba is not installed", flush=True)
+            return []
+
+        mismatches = []
+        for name, size, scene in self.integrator_scenes(scene_filepaths, sizes, triangle_counts):
+            _, ray_batch = self.primary_rays(scene)
+            integrators = {"numpy": WhittedIntegrator(scene), "numba": WhittedNumbaIntegrator(scene)}
+
+            # the first batch of the numba backend also compiles the kernels and flattens the scene
+            numpy_image, numba_image = [integrator.integrate_batch(ray_batch) for integrator in integrators.values()]
+            max_difference = float(np.abs(numpy_image - numba_image).max(initial=0.0))
+
+            for backend, integrator in integrators.items():
+                result = self.measure("backends", f"{name}:{backend}", "batch", len(ray_batch),
+                                      lambda: integrator.integrate_batch(ray_batch), size)
+                result["max_difference"] = max_difference
+
+            if max_difference > BACKEND_TOLERANCE:
+                print(f"backends     {name} differs by {max_difference:g} between the backends", flush=True)
+                mismatches.append(name)
+
+        return mismatches
+
+    def run_renders(self, scene_filepaths: list, width: int, height: int, spp: int) -> None:
+        """
+        Complete renders including the start of the worker pool, rays are the
+        primary rays of the image.
+        """
+
+        for scene_filepath in scene_filepaths:
+            name = os.path.splitext(os.path.basename(scene_filepath))[0]
+            scene = self.load_scene(scene_filepath, width, height)
+            output_filename = f"benchmark_{name}"
+            renderer = Renderer(scene, output_filename=output_filename)
+            self.measure("renders", name, "render", width * height * spp,
+                         lambda: renderer.render(spp=spp))
+
+            os.remove(Renderer.output_filepath(f"{output_filename}.png"))
+
+    @staticmethod
+    def metadata() -> dict:
+        return {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        }
+
+    def save(self, filepath: str, options: dict) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+        with open(filepath, "w") as file:
+            json.dump({"metadata": {**self.metadata(), "options": options}, "results": self.results}, file, indent=2)
+
+    @staticmethod
+    def result_key(result: dict) -> tuple:
+        return result["stage"], result["name"], result["mode"], result["size"]
+
+    def compare(self, previous_filepath: str, tolerance: float) -> list:
+        """
+        Print the speedup of every measurement relative to a previous run.
+
+        @param previous_filepath results file of a previous run
+        @param tolerance relative slowdown that is still accepted, e.g. 0.1
+        @return the measurements that are slower than tolerance allows
+        """
+
+        with open(previous_filepath) as file:
+            previous_results = {self.result_key(result): result for result in json.load(file)["results"]}
+
+        regressions = []
+        print(f"\nCompared to {previous_filepath}:")
+        for result in self.results:
+            previous_result = previous_results.get(self.result_key(result))
+            if previous_result is None:
+                continue
+
+            speedup = result["rays_per_second"] / max(previous_result["rays_per_second"], 1e-12)
+            is_regression = speedup < 1.0 - tolerance
+            if is_regression:
+                regressions.append(result)
+
+            print(f"{self.format_result(result)} {speedup:>7.2f}x{'  REGRESSION' if is_regression else ''}")
+
+        return regressions
+
+
+def parse_sizes(text: str) -> list:
+    return [int(size) for size in text.split(",") if size]
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option(
+        "--stages",
+        dest="stages",
+        help=f"Comma separated stages to run, any of {', '.join(STAGES)}. All by default",
+        default=",".join(STAGES)
+    )
+
+    parser.add_option(
+        "-w",
+        "--width",
+        dest="width",
+        type="int",
+        help="Width of the camera generating the rays of the stages",
+        default=64
+    )
+
+    parser.add_option(
+        "-H",
+        "--height",
+        dest="height",
+        type="int",
+        help="Height of the camera generating the rays of the stages",
+        default=48
+    )
+
+    parser.add_option(
+        "--sizes",
+        dest="sizes",
+        help="Comma separated numbers of spheres of the synthetic scenes",
+        default="1,10,100,1000"
+    )
+
+    parser.add_option(
+        "--triangle-counts",
+        dest="triangle_counts",
+        help="Comma separated numbers of triangles of the synthetic meshes",
+        default="100,1000,10000"
+    )
+
+    parser.add_option(
+        "--scenes",
+        dest="scenes",
+        help="Glob pattern of the scene files of the integrator and render stages",
+        default=os.path.join(ROOT_PATH, "scenes", "*.json")
+    )
+
+    parser.add_option(
+        "--render-width",
+        dest="render_width",
+        type="int",
+        help="Width of the images of the render stage",
+        default=160
+    )
+
+    parser.add_option(
+        "--render-height",
+        dest="render_height",
+        type="int",
+        help="Height of the images of the render stage",
+        default=120
+    )
+
+    parser.add_option(
+        "-p",
+        "--spp",
+        dest="spp",
+        type="int",
+        help="Samples per pixel of the render stage",
+        default=1
+    )
+
+    parser.add_option(
+        "-r",
+        "--repeat",
+        dest="repeat",
+        type="int",
+        help="Number of timed runs of every measurement, the best run is reported",
+        default=3
+    )
+
+    parser.add_option(
+        "-o",
+        "--output",
+        dest="output_filepath",
+        help="JSON file the results are written to, by default a new file in output/benchmarks",
+        metavar="FILE"
+    )
+
+    parser.add_option(
+        "-c",
+        "--compare",
+        dest="previous_filepath",
+        help="Results of a previous run to compare with. Exits with status 1 if a measurement regressed",
+        metavar="FILE"
+    )
+
+    parser.add_option(
+        "--tolerance",
+        dest="tolerance",
+        type="float",
+        help="Relative slowdown compared to the previous run that is not reported as regression",
+        default=0.1
+    )
+
+    (options, _) = parser.parse_args()
+
+    stages = [stage for stage in options.stages.split(",") if stage]
+    for stage in stages:
+        if stage not in STAGES:
+            parser.error(f"unknown stage {stage}, expected any of {', '.join(STAGES)}")
+
+    # the renderer logs its progress, only show problems
+    logging.basicConfig(level=logging.WARNING)
+
+    sizes = parse_sizes(options.sizes)
+    triangle_counts = parse_sizes(options.triangle_counts)
+    scene_filepaths = sorted(glob.glob(options.scenes))
+
+    # the synthetic scenes are written anew by every run, only the results are kept
+    with tempfile.TemporaryDirectory(prefix="pytracer_benchmark_") as work_path:
+        benchmark = Benchmark(options.width, options.height, options.repeat, work_path)
+        mismatches = []
+        if "camera" in stages:
+            benchmark.run_camera()
+        if "primitives" in stages:
+            benchmark.run_primitives(max(triangle_counts, default=1000))
+        if "lists" in stages:
+            benchmark.run_lists(sizes)
+        if "materials" in stages:
+            benchmark.run_materials()
+        if "integrators" in stages:
+            benchmark.run_integrators(scene_filepaths, sizes, triangle_counts)
+        if "backends" in stages:
+            mismatches = benchmark.run_backends(scene_filepaths, sizes, triangle_counts)
+        if "renders" in stages:
+            benchmark.run_renders(scene_filepaths, options.render_width, options.render_height, options.spp)
+
+    output_filepath = options.output_filepath
+    if output_filepath is None:
+        output_filepath = os.path.join(RESULTS_PATH, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+
+    benchmark.save(output_filepath, vars(options))
+    print(f"\nWrote {output_filepath}")
+
+    failed = len(mismatches) > 0
+    if failed:
+        print(f"The backends render different images of {', '.join(mismatches)}")
+
+    if options.previous_filepath is not None:
+        regressions = benchmark.compare(options.previous_filepath, options.tolerance)
+        if len(regressions) > 0:
+            print(f"{len(regressions)} measurements regressed by more than {100 * options.tolerance:.0f}%")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import json
+import math
+import os
+
+import numpy as np
+
+
+class SyntheticScenes:
+    """
+    Scene descriptions of a configurable size, to measure how the render cost
+    scales with the number of objects. All scenes look at the origin from
+    eye = (0, 0, 10) and are lit by a single point light next to the camera.
+    """
+
+    CAMERA = {
+        "eye": [0.0, 0.0, 10.0],
+        "look_at": [0.0, 0.0, 0.0],
+        "up": [0.0, 1.0, 0.0],
+        "fov": 60
+    }
+
+    LIGHTS = [
+        {"point_light": {"position": [2.0, 3.0, 8.0], "emission": [1.0, 1.0, 1.0]}}
+    ]
+
+    MATERIAL = {
+        "blinn": {"diffuse": [0.8, 0.3, 0.1], "specular": [0.4, 0.4, 0.4], "shininess": 50.0}
+    }
+
+    # background plane behind all objects, such that every primary ray hits something
+    BACKGROUND = {
+        "normal": [0.0, 0.0, 1.0],
+        "distance": 4.0,
+        "material": {"diffuse": {"emission": [0.5, 0.5, 0.5]}}
+    }
+
+    # half the edge length of the square the objects are spread over, it fills most of the view
+    EXTENT = 4.0
+
+    @classmethod
+    def description(cls, objects: dict, integrator: str) -> dict:
+        return {
+            "camera": cls.CAMERA,
+            "objects": {"meshes": [], "triangles": [], "spheres": [], "planes": [cls.BACKGROUND], **objects},
+            "lights": cls.LIGHTS,
+            "integrator": integrator
+        }
+
+    @classmethod
+    def spheres(cls, count: int, integrator: str = "whitted") -> dict:
+        """
+        @param count number of spheres, placed on a square grid in the z = 0 plane
+        @param integrator one of pytracer.scene.INTEGRATORS
+        @return the scene description
+        """
+
+        per_row = max(1, math.ceil(math.sqrt(count)))
+        spacing = 2.0 * cls.EXTENT / per_row
+        spheres = []
+        for idx in range(count):
+            row, col = divmod(idx, per_row)
+            spheres.append({
+                "center": [-cls.EXTENT + (col + 0.5) * spacing, -cls.EXTENT + (row + 0.5) * spacing, 0.0],
+                "radius": 0.4 * spacing,
+                "material": cls.MATERIAL
+            })
+
+        return cls.description({"spheres": spheres}, integrator)
+
+    @classmethod
+    def triangle_mesh(cls, obj_filepath: str, count: int, integrator: str = "whitted") -> dict:
+        """
+        @param obj_filepath where the mesh is written to, see write_height_field
+        @param count number of triangles of the mesh
+        @param integrator one of pytracer.scene.INTEGRATORS
+        @return the scene description
+        """
+
+        cls.write_height_field(obj_filepath, count)
+        mesh = {"filepath": os.path.abspath(obj_filepath), "material": cls.MATERIAL}
+        return cls.description({"meshes": [mesh]}, integrator)
+
+    @classmethod
+    def write_height_field(cls, obj_filepath: str, count: int) -> None:
+        """
+        Write a wavy square of count triangles facing the camera as OBJ file.
+        The square is split into a grid of quads of two triangles each, surplus
+        triangles of the last quads are dropped.
+        """
+
+        quads_per_row = max(1, math.ceil(math.sqrt(count / 2.0)))
+        coordinates = np.linspace(-cls.EXTENT, cls.EXTENT, quads_per_row + 1)
+        x, y = np.meshgrid(coordinates, coordinates)
+        z = 0.5 * np.sin(2.0 * x) * np.cos(2.0 * y)
+        vertices = np.stack([x, y, z], axis=-1).reshape((-1, 3))
+
+        # one based vertex indices of the lower left corner of every quad
+        corners = (np.arange(quads_per_row)[:, None] * (quads_per_row + 1) + np.arange(quads_per_row)[None, :]).ravel() + 1
+        right = corners + 1
+        up = corners + quads_per_row + 1
+        faces = np.stack([
+            np.stack([corners, right, up + 1], axis=1),
+            np.stack([corners, up + 1, up], axis=1)
+        ], axis=1).reshape((-1, 3))[:count]
+
+        os.makedirs(os.path.dirname(os.path.abspath(obj_filepath)), exist_ok=True)
+        with open(obj_filepath, "w") as file:
+            file.write("".join(f"v {vx:.6f} {vy:.6f} {vz:.6f}\n" for vx, vy, vz in vertices.tolist()))
+            file.write("".join(f"f {a} {b} {c}\n" for a, b, c in faces.tolist()))
+
+    @staticmethod
+    def write(filepath: str, description: dict) -> str:
+        """
+        @return the path of the written scene file
+        """
+
+        os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+        with open(filepath, "w") as file:
+            json.dump(description, file, indent=2)
+
+        return filepath
@@ -0,0 +1,89 @@
+"""
+Micro-benchmark of the per-operation cost of Vec3 compared to the former
+numpy based vector, a np.ndarray subclass of shape (3,).
+
+Usage: python -m pytracer.benchmarks.vec3_benchmark [--repeat N]
+"""
+
+import timeit
+
+from optparse import OptionParser
+
+import numpy as np
+
+from pytracer.math.vec3 import Vec3
+
+
+class NdarrayVec3(np.ndarray):
+    """
+    The numpy based vector Vec3 replaced, kept as the baseline of this benchmark.
+    """
+
+    def __new__(cls, *args):
+        x, y, z, *_ = args
+        return np.asarray([x, y, z]).view(cls)
+
+    def dotted(self) -> float:
+        return self.dot(self)
+
+    def reflected_on(self, normal: 'NdarrayVec3') -> 'NdarrayVec3':
+        cos_theta_i = normal.dot(self)
+        return 2.0 * cos_theta_i * normal - self
+
+    def incident_direction(self) -> 'NdarrayVec3':
+        return -NdarrayVec3(*self).normalized()
+
+    def cross(self, other: 'NdarrayVec3') -> 'NdarrayVec3':
+        return NdarrayVec3(*np.cross(self, other))
+
+    def normalized(self) -> 'NdarrayVec3':
+        return NdarrayVec3(*self / np.linalg.norm(self))
+
+
+OPERATIONS = {
+    "construct": lambda vec3, a, b: vec3(0.1, 0.2, 0.3),
+    "add": lambda vec3, a, b: a + b,
+    "scale": lambda vec3, a, b: 0.5 * a,
+    "multiply": lambda vec3, a, b: a * b,
+    "dot": lambda vec3, a, b: a.dot(b),
+    "cross": lambda vec3, a, b: a.cross(b),
+    "normalized": lambda vec3, a, b: a.normalized(),
+    "reflected_on": lambda vec3, a, b: a.reflected_on(b),
+    "incident_direction": lambda vec3, a, b: a.incident_direction(),
+    # the ray point computation of every intersection, origin + t * direction
+    "point_at": lambda vec3, a, b: 1.5 * b + a
+}
+
+
+def time_operation(operation, vec3: type, repeat: int) -> float:
+    """
+    @return the best time of one operation in seconds
+    """
+
+    a = vec3(0.3, -0.4, 0.5)
+    b = vec3(0.0, 0.6, 0.8)
+    timer = timeit.Timer(lambda: operation(vec3, a, b))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option(
+        "--repeat",
+        dest="repeat",
+        type="int",
+        help="Number of timing runs per operation, the best run is reported",
+        default=5
+    )
+    (options, _) = parser.parse_args()
+
+    print(f"{'operation':<20} {'ndarray [ns]':>14} {'Vec3 [ns]':>12} {'speedup':>9}")
+    for name, operation in OPERATIONS.items():
+        ndarray_time = time_operation(operation, NdarrayVec3, options.repeat)
+        vec3_time = time_operation(operation, Vec3, options.repeat)
+        print(f"{name:<20} {ndarray_time * 1e9:>14.0f} {vec3_time * 1e9:>12.0f} {ndarray_time / vec3_time:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import numpy as np
 import math
 
 from pytracer.ray import Ray
+from pytracer.ray_batch import RayBatch
 from pytracer.math.vec3 import Vec3
 
 
@@ -72,6 +73,8 @@ class Camera:
         self.right = aspect_ratio * self.top
         self.left = -self.right
 
+        self._direction_table = None
+
     #
     def make_worldspace_ray(self, i: int, j: int, samples: list) -> Ray:
         """
@@ -97,3 +100,69 @@ class Camera:
         p_uvw = Vec3(*self.matrix.dot(v))
 
         return Ray(self.eye.copy(), p_uvw, i, j, perturbate=False)
+
+    def direction_table(self) -> np.ndarray:
+        """
+        Directions of the rays through the lower left corner of every pixel, i.e.
+        the rays for the sample (0, 0). Any other sample (s1, s2) is a constant
+        offset s1 * du + s2 * dv of this table (see pixel_steps), so the table is
+        computed once per camera and reused for all samples of all pixels.
+
+        @return float array of shape (height, width, 3), indexed by [i, j]
+        """
+
+        if self._direction_table is None:
+            i = np.arange(self.height, dtype=np.float64)
+            j = np.arange(self.width, dtype=np.float64)
+
+            u_ij = self.left + (self.right - self.left) * i / self.width
+            v_ij = self.bottom + (self.top - self.bottom) * j / self.height
+
+            p_uvw = np.empty((self.height, self.width, 3))
+            p_uvw[:, :, 0] = u_ij[:, None]
+            p_uvw[:, :, 1] = v_ij[None, :]
+            p_uvw[:, :, 2] = -1.0
+
+            self._direction_table = p_uvw.dot(self.matrix[:3, :3].T)
+
+        return self._direction_table
+
+    def pixel_steps(self) -> tuple:
+        """
+        @return the direction offsets (du, dv) of moving one pixel along i and along j
+        """
+
+        du = self.matrix[:3, 0] * (self.right - self.left) / self.width
+        dv = self.matrix[:3, 1] * (self.top - self.bottom) / self.height
+        return du, dv
+
+    def make_worldspace_rays(self, rows: np.ndarray, cols: np.ndarray, samples) -> RayBatch:
+        """
+        Vectorized version of make_worldspace_ray: generate the rays of all given
+        pixels and all their samples in one go.
+
+        @param rows (P,) int array of row indices i, start counting at 0.
+        @param cols (P,) int array of column indices j, start counting at 0.
+        @param samples float array of shape (S, 2) with the samples shared by all
+          pixels or of shape (P, S, 2) with individual samples per pixel.
+        @return batch of P * S rays in world coordinates. The S rays of a pixel are
+          stored next to each other.
+        """
+
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        samples = np.asarray(samples, dtype=np.float64)
+        if samples.ndim == 2:
+            samples = np.broadcast_to(samples[None], (len(rows), *samples.shape))
+
+        du, dv = self.pixel_steps()
+        base_directions = self.direction_table()[rows, cols]
+        directions = (base_directions[:, None, :]
+                      + samples[:, :, 0, None] * du
+                      + samples[:, :, 1, None] * dv).reshape((-1, 3))
+
+        sample_count = samples.shape[1]
+        pixel_indices = np.repeat(rows * self.width + cols, sample_count)
+        origins = np.broadcast_to(np.asarray(self.eye, dtype=np.float64), directions.shape)
+
+        return RayBatch(origins=origins, directions=directions, pixel_indices=pixel_indices)
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+from typing import Optional, TYPE_CHECKING
+
+from pytracer.framebuffer import Framebuffer
+from pytracer.scene_bundle import SceneBundle
+
+if TYPE_CHECKING:
+    from pytracer import Scene
+
+
+class Checkpoint:
+    """
+    Keeps the progress of a progressive render on disk, such that a pre-empted
+    render can be resumed from its last completed pass. A checkpoint directory
+    contains
+
+      accumulation.npy      the memory-mapped framebuffer the workers render into
+      pixels_<spp>.npy      a copy of the framebuffer after spp samples per pixel
+      state.json            the size of the image, the fingerprint of the scene and
+                            the completed samples per pixel, refers to the matching
+                            pixels file
+
+    The accumulation file also contains the samples of an unfinished pass,
+    therefore only the copies written at the end of a pass are used to resume.
+    Every file is written to a temporary file first and then renamed, such that
+    the state always refers to a complete copy. A checkpoint is only resumed by
+    a render of the same scene, see fingerprint.
+
+    Resuming renames the pixels file of the state to the accumulation file and
+    maps it, such that it costs a file open rather than a copy of the image.
+    Until the next checkpoint the state refers to the accumulation file, a
+    render interrupted before then resumes with the samples of the unfinished
+    pass, which the sample counts of the pixels account for.
+    """
+
+    STATE_FILENAME = "state.json"
+    ACCUMULATION_FILENAME = "accumulation.npy"
+
+    def __init__(self, directory: str, scene: 'Scene'):
+        """
+        @param directory holds the files of the checkpoint
+        @param scene the rendered scene
+        """
+
+        self.directory = directory
+        self.scene = scene
+        # fingerprint of the scene and of its mesh files, see fingerprint. Computed when resuming
+        # or saving the first time, such that the meshes are only hashed if a checkpoint is used.
+        self.scene_fingerprint = None
+        self.mesh_fingerprints = None
+
+    @property
+    def state_filepath(self) -> str:
+        return os.path.join(self.directory, self.STATE_FILENAME)
+
+    @property
+    def accumulation_filepath(self) -> str:
+        return os.path.join(self.directory, self.ACCUMULATION_FILENAME)
+
+    def read_state(self) -> Optional[dict]:
+        """
+        @return the state of the last completed pass or None if there is no checkpoint
+        """
+
+        if not os.path.exists(self.state_filepath):
+            return None
+
+        with open(self.state_filepath) as file:
+            return json.load(file)
+
+    def fingerprint(self, previous_mesh_fingerprints: list = None) -> tuple:
+        """
+        @param previous_mesh_fingerprints mesh fingerprints of a previous state, the
+          hashes of unchanged mesh files are reused, see SceneBundle.mesh_fingerprints
+        @return (scene_fingerprint, mesh_fingerprints), the scene fingerprint hashes
+          the scene description, the content of its mesh files, the sampler and the integrator
+        """
+
+        with open(self.scene.filepath, "rb") as file:
+            bundle = SceneBundle(self.scene.filepath, file.read(), self.scene.mesh_filepaths)
+
+        mesh_fingerprints = bundle.mesh_fingerprints(previous_mesh_fingerprints)
+        settings = [bundle.scene_hash, [fingerprint["hash"] for fingerprint in mesh_fingerprints],
+                    type(self.scene.sampler).__name__, type(self.scene.integrator).__name__]
+        scene_fingerprint = hashlib.blake2b(json.dumps(settings).encode("utf8"), digest_size=20).hexdigest()
+        return scene_fingerprint, mesh_fingerprints
+
+    def open_framebuffer(self, width: int, height: int, resume: bool) -> tuple:
+        """
+        @param width image width in pixels
+        @param height image height in pixels
+        @param resume continue from the last completed pass if there is one,
+          start from scratch otherwise
+        @return (framebuffer, spp) the memory-mapped framebuffer to render into
+          and the samples per pixel it already contains
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        state = self.read_state()
+        if state is None or not resume:
+            if resume:
+                logging.info(f"No checkpoint found in {self.directory}, starting from scratch")
+            elif state is not None and state["pixels"] == self.ACCUMULATION_FILENAME:
+                # the accumulation is started over, the state of the resumed render would refer to it
+                os.remove(self.state_filepath)
+
+            return Framebuffer.create_file(self.accumulation_filepath, width, height), 0
+
+        if (state["width"], state["height"]) != (width, height):
+            raise ValueError(f"Cannot resume the {state['width']} x {state['height']} checkpoint in "
+                             f"{self.directory} at a resolution of {width} x {height} pixels")
+        self.scene_fingerprint, self.mesh_fingerprints = self.fingerprint(state.get("meshes"))
+        if state.get("scene") != self.scene_fingerprint:
+            raise ValueError(f"Cannot resume the checkpoint in {self.directory}, it was rendered from another scene "
+                             f"or with another sampler, integrator or meshes than {self.scene.filepath}")
+
+        if state["pixels"] != self.ACCUMULATION_FILENAME:
+            os.replace(os.path.join(self.directory, state["pixels"]), self.accumulation_filepath)
+            state["pixels"] = self.ACCUMULATION_FILENAME
+            self.write_atomically(self.STATE_FILENAME, lambda file: file.write(json.dumps(state).encode("utf8")))
+
+        logging.info(f"Resuming from checkpoint with {state['spp']} samples per pixel")
+        return Framebuffer(width, height, filepath=self.accumulation_filepath), state["spp"]
+
+    def save(self, framebuffer: Framebuffer, spp: int) -> None:
+        """
+        @param framebuffer the framebuffer at the end of a pass
+        @param spp samples per pixel contained in the framebuffer
+        """
+
+        previous_state = self.read_state()
+        if self.scene_fingerprint is None:
+            self.scene_fingerprint, self.mesh_fingerprints = self.fingerprint(
+                None if previous_state is None else previous_state.get("meshes"))
+
+        pixels_filename = f"pixels_{spp}.npy"
+        self.write_atomically(pixels_filename, lambda file: np.save(file, framebuffer.pixels))
+
+        state = {"width": framebuffer.width, "height": framebuffer.height, "spp": spp, "pixels": pixels_filename,
+                 "scene": self.scene_fingerprint, "meshes": self.mesh_fingerprints}
+        self.write_atomically(self.STATE_FILENAME, lambda file: file.write(json.dumps(state).encode("utf8")))
+
+        if previous_state is not None and previous_state["pixels"] not in (pixels_filename, self.ACCUMULATION_FILENAME):
+            os.remove(os.path.join(self.directory, previous_state["pixels"]))
+
+    def write_atomically(self, filename: str, write) -> None:
+        filepath = os.path.join(self.directory, filename)
+        with open(f"{filepath}.tmp", "wb") as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(f"{filepath}.tmp", filepath)
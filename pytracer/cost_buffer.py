@@ -0,0 +1,120 @@
+import ctypes
+import multiprocessing
+
+import numpy as np
+
+
+class CostBuffer:
+    """
+    Accumulates the render cost of every pixel in a shared float64
+    (height, width, 3) array: the seconds spent tracing the samples of a pixel,
+    the number of rays traced for them and the number of samples. Like the
+    Framebuffer it is shared with all render workers.
+
+    The costs per sample estimate how expensive a pixel is to render, which
+    drives the cost-aware tile schedule, see CostScheduling.schedule_tiles.
+    """
+
+    CHANNELS = 3
+    SECONDS = 0
+    RAYS = 1
+    SAMPLES = 2
+
+    def __init__(self, width: int, height: int, raw_costs=None):
+        """
+        @param width image width in pixels
+        @param height image height in pixels
+        @param raw_costs shared ctypes double array of size width * height * 3,
+          a new zero initialized array is allocated by default.
+        """
+
+        self.width = width
+        self.height = height
+        self.raw_costs = raw_costs
+        if self.raw_costs is None:
+            self.raw_costs = multiprocessing.RawArray(ctypes.c_double, width * height * self.CHANNELS)
+
+        self.costs = self.map_costs()
+
+    def map_costs(self) -> np.ndarray:
+        return np.frombuffer(self.raw_costs, dtype=np.float64).reshape((self.height, self.width, self.CHANNELS))
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["costs"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.costs = self.map_costs()
+
+    def accumulate(self, pixel_indices: np.ndarray, costs: np.ndarray) -> None:
+        """
+        @param pixel_indices (N,) flat pixel indices (row * width + col) of the samples
+        @param costs (N, 2) seconds and number of rays of every sample, see Integrator.integrate_batch
+        """
+
+        flat_costs = self.costs.reshape((-1, self.CHANNELS))
+        np.add.at(flat_costs[:, self.SECONDS], pixel_indices, costs[:, 0])
+        np.add.at(flat_costs[:, self.RAYS], pixel_indices, costs[:, 1])
+        np.add.at(flat_costs[:, self.SAMPLES], pixel_indices, 1.0)
+
+    def reset(self) -> None:
+        self.costs[...] = 0.0
+
+    def per_sample(self) -> np.ndarray:
+        """
+        @return (height, width, 2) mean seconds and rays per sample of every
+          pixel, zero for pixels without samples.
+        """
+
+        samples = self.costs[..., self.SAMPLES, None]
+        return self.costs[..., :self.SAMPLES] / np.maximum(samples, 1.0)
+
+    def estimate(self, stride: int = 1) -> np.ndarray:
+        """
+        Spread the costs of sparsely sampled pixels, e.g. of a pre-pass that
+        sampled every stride-th pixel (see RenderTask), over the image.
+
+        @param stride the distance between two sampled pixels
+        @return (height, width) estimated seconds per sample of every pixel
+        """
+
+        seconds = self.per_sample()[..., 0]
+        if stride == 1:
+            return seconds
+
+        # every pixel gets the cost of the first pixel of its stride x stride block
+        rows = np.arange(self.height) // stride * stride
+        cols = np.arange(self.width) // stride * stride
+        return seconds[rows[:, None], cols[None, :]]
+
+    def save(self, filepath: str, scene_filepath: str) -> None:
+        """
+        Store the costs per sample as (height, width, 2) float32 array in a .npz
+        file, such that the next render of the same scene can schedule its tiles
+        with them.
+
+        @param scene_filepath the rendered scene, see load_estimate
+        """
+
+        np.savez(filepath, costs=self.per_sample().astype(np.float32), scene_filepath=np.array(scene_filepath))
+
+    @staticmethod
+    def load_estimate(filepath: str, width: int, height: int, scene_filepath: str):
+        """
+        @return (height, width) seconds per sample of a file written by save or
+          None if there is no such file for this scene and image size.
+        """
+
+        try:
+            with np.load(filepath) as arrays:
+                costs = arrays["costs"]
+                is_same_scene = str(arrays["scene_filepath"]) == scene_filepath
+        except (OSError, ValueError, KeyError):
+            return None
+
+        if not is_same_scene or costs.shape != (height, width, 2):
+            return None
+
+        return costs[..., 0].astype(np.float64)
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import struct
+
+from typing import BinaryIO
+
+# every message starts with the sizes of its JSON header and of its binary payload
+MESSAGE_PREFIX = struct.Struct("!IQ")
+
+DEFAULT_PORT = 7878
+
+
+def encode_message(header: dict, payload: bytes = b"") -> bytes:
+    """
+    Messages between the coordinator and the workers are a JSON object followed
+    by an optional binary payload, e.g. the pickled scene or the float buffer of
+    a rendered tile:
+
+        [0, 12)             size h of the header and size p of the payload, big endian
+        [12, 12 + h)        UTF-8 encoded JSON header, its "type" names the message
+        [12 + h, 12 + h + p) payload
+
+    @param header JSON serializable message, must have a "type"
+    @param payload raw bytes sent after the header
+    """
+
+    encoded_header = json.dumps(header).encode("utf8")
+    return MESSAGE_PREFIX.pack(len(encoded_header), len(payload)) + encoded_header + payload
+
+
+def decode_header(encoded_header: bytes) -> dict:
+    header = json.loads(encoded_header.decode("utf8"))
+    if not isinstance(header, dict) or "type" not in header:
+        raise ValueError("Received a message without type")
+
+    return header
+
+
+async def read_message(reader: asyncio.StreamReader) -> tuple:
+    """
+    @return (header, payload) of the next message of a stream
+    @raise asyncio.IncompleteReadError if the connection was closed
+    """
+
+    header_size, payload_size = MESSAGE_PREFIX.unpack(await reader.readexactly(MESSAGE_PREFIX.size))
+    header = decode_header(await reader.readexactly(header_size))
+    payload = await reader.readexactly(payload_size)
+    return header, payload
+
+
+def receive_message(file: BinaryIO) -> tuple:
+    """
+    Blocking counterpart of read_message for a file object of a socket.
+
+    @return (header, payload) of the next message
+    @raise ConnectionError if the connection was closed
+    """
+
+    def read_exactly(size: int) -> bytes:
+        data = file.read(size)
+        if len(data) != size:
+            raise ConnectionError("Connection closed by the coordinator")
+        return data
+
+    header_size, payload_size = MESSAGE_PREFIX.unpack(read_exactly(MESSAGE_PREFIX.size))
+    header = decode_header(read_exactly(header_size))
+    payload = read_exactly(payload_size)
+    return header, payload
+
+
+def parse_address(address: str, default_port: int = DEFAULT_PORT) -> tuple:
+    """
+    @param address HOST:PORT, HOST or :PORT
+    @return (host, port), localhost and default_port by default
+    """
+
+    host, _, port = address.rpartition(":") if ":" in address else (address, "", "")
+    return host or "localhost", int(port) if port else default_port
@@ -0,0 +1,229 @@
+import asyncio
+import collections
+import logging
+import pickle
+import time
+
+import numpy as np
+
+from typing import TYPE_CHECKING
+
+from pytracer.distributed.protocol import encode_message, read_message
+from pytracer.framebuffer import Framebuffer
+from pytracer.render_statistics import RenderStatistics
+
+if TYPE_CHECKING:
+    from pytracer import Scene
+
+# tasks sent to a worker ahead of its results, such that it does not idle while its result is on the way
+TASKS_IN_FLIGHT = 2
+
+# seconds after which the tile of an unresponsive worker is handed to another worker as well
+TASK_TIMEOUT = 300.0
+
+# seconds the workers get to receive the end of the frame before their connections are closed
+FINISH_TIMEOUT = 5.0
+
+
+class RenderCoordinator:
+    """
+    Serves the tiles of a frame to RenderWorkers over TCP, see protocol for the
+    message format. Every worker receives the pickled scene once when it
+    connects and then pulls tasks, a tile and its samples per pixel, until all
+    tasks are done. The float buffers of the rendered tiles are added to the
+    framebuffer of the coordinator.
+
+    Tasks of a worker whose connection is lost are handed out again. So are
+    tasks a worker did not answer within task_timeout seconds, the first result
+    of a task is used, later ones are dropped. Workers may connect and leave at
+    any time during a render.
+    """
+
+    def __init__(self, scene: 'Scene', tasks: list, host: str, port: int,
+                 collect_statistics: bool = False, task_timeout: float = TASK_TIMEOUT):
+        """
+        @param scene the scene to render
+        @param tasks the RenderTasks of the frame
+        @param host address the coordinator listens on, e.g. 0.0.0.0 for all interfaces
+        @param port TCP port the coordinator listens on
+        @param collect_statistics let the workers collect RenderStatistics, merged into self.statistics
+        @param task_timeout seconds after which an unanswered task is handed out again
+        """
+
+        self.scene = scene
+        self.tasks = tasks
+        self.host = host
+        self.port = port
+        self.collect_statistics = collect_statistics
+        self.task_timeout = task_timeout
+
+        self.framebuffer = Framebuffer(scene.width, scene.height)
+        self.statistics = RenderStatistics()
+        self.scene_data = pickle.dumps(scene, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self.pending = collections.deque(range(len(tasks)))
+        self.completed = set()
+        # task id -> time it was last handed out
+        self.assigned = {}
+        # the coroutines serving the connected workers
+        self.connections = set()
+
+        self.changed = None
+        self.done = None
+
+    def next_task(self):
+        """
+        @return the id of the next task to hand out or None if no task is pending
+        """
+
+        while self.pending:
+            task_id = self.pending.popleft()
+            if task_id not in self.completed:
+                self.assigned[task_id] = time.monotonic()
+                return task_id
+
+        return None
+
+    def requeue(self, task_ids) -> int:
+        """
+        Hand out the given tasks again before all other pending tasks.
+
+        @return the number of requeued tasks
+        """
+
+        task_ids = [task_id for task_id in task_ids if task_id not in self.completed and task_id not in self.pending]
+        self.pending.extendleft(reversed(task_ids))
+        if task_ids:
+            self.notify()
+        return len(task_ids)
+
+    def notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def complete(self, task_id: int, header: dict, payload: bytes) -> None:
+        if task_id in self.completed:
+            return
+
+        row_begin, row_end, col_begin, col_end = self.tasks[task_id].tile
+        # a buffer of the wrong size raises a ValueError before anything is added
+        pixels = np.frombuffer(payload, dtype=np.float32).reshape(
+            (row_end - row_begin, col_end - col_begin, Framebuffer.CHANNELS))
+        self.statistics.merge(header.get("statistics"))
+        self.framebuffer.pixels[row_begin:row_end, col_begin:col_end] += pixels
+
+        self.completed.add(task_id)
+        self.assigned.pop(task_id, None)
+        if len(self.completed) == len(self.tasks):
+            self.done.set()
+            self.notify()
+
+    async def send_task(self, writer: asyncio.StreamWriter, task_id: int) -> None:
+        task = self.tasks[task_id]
+        writer.write(encode_message({
+            "type": "task",
+            "id": task_id,
+            "tile": list(task.tile),
+            "width": task.width,
+            "spp": task.spp
+        }))
+        await writer.drain()
+
+    async def serve_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        name = str(writer.get_extra_info("peername"))
+        worker_tasks = set()
+        connection = asyncio.current_task()
+        try:
+            header, _ = await read_message(reader)
+            if header["type"] != "hello":
+                raise ValueError(f"Expected hello, received '{header['type']}'")
+
+            name = header.get("name", name)
+            writer.write(encode_message({"type": "scene", "collect_statistics": self.collect_statistics}, self.scene_data))
+            await writer.drain()
+            self.connections.add(connection)
+            logging.info(f"Worker {name} connected, {len(self.connections)} workers")
+
+            while not self.done.is_set():
+                while len(worker_tasks) < TASKS_IN_FLIGHT:
+                    task_id = self.next_task()
+                    if task_id is None:
+                        break
+                    worker_tasks.add(task_id)
+                    await self.send_task(writer, task_id)
+
+                if not worker_tasks:
+                    # wait for tasks of lost workers or for the end of the frame
+                    await self.changed.wait()
+                    continue
+
+                header, payload = await read_message(reader)
+                if header["type"] != "result":
+                    raise ValueError(f"Expected a result, received '{header['type']}'")
+
+                task_id = header.get("id")
+                if type(task_id) is not int or task_id not in worker_tasks:
+                    raise ValueError(f"Received a result for task {task_id!r}, which was not sent to this worker")
+
+                self.complete(task_id, header, payload)
+                worker_tasks.discard(task_id)
+
+            writer.write(encode_message({"type": "done"}))
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError) as error:
+            logging.warning(f"Lost worker {name} ({type(error).__name__}: {error})")
+        finally:
+            # also after unexpected errors, such that the frame does not wait for the tiles of this worker forever
+            requeued = self.requeue(worker_tasks)
+            if requeued:
+                logging.warning(f"Handing out the {requeued} tiles of worker {name} again")
+            self.connections.discard(connection)
+            writer.close()
+
+    async def watch_tasks(self) -> None:
+        """
+        Log the progress every second and hand out tasks again that were not answered in time.
+        """
+
+        while not self.done.is_set():
+            try:
+                await asyncio.wait_for(self.done.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+
+            now = time.monotonic()
+            expired = [task_id for task_id, assign_time in self.assigned.items() if now - assign_time > self.task_timeout]
+            for task_id in expired:
+                del self.assigned[task_id]
+            if self.requeue(expired):
+                logging.warning(f"Handing out {len(expired)} tiles again that were not rendered within {self.task_timeout} seconds")
+
+            logging.info(f"=> Progress: {int(100 * len(self.completed) / max(len(self.tasks), 1))}% "
+                         f"of {len(self.tasks)} tiles, {len(self.connections)} workers")
+
+    async def serve(self) -> None:
+        self.changed = asyncio.Event()
+        self.done = asyncio.Event()
+        if not self.tasks:
+            return
+
+        server = await asyncio.start_server(self.serve_worker, self.host, self.port)
+        logging.info(f"Waiting for workers on {self.host}:{self.port}, "
+                     f"every worker receives {len(self.scene_data) / 2 ** 20:.2f} MiB of scene data")
+        async with server:
+            await self.watch_tasks()
+
+            # workers still rendering a task that was handed out twice are not waited for
+            if self.connections:
+                await asyncio.wait(self.connections, timeout=FINISH_TIMEOUT)
+
+    def render(self) -> Framebuffer:
+        """
+        Serve the tasks until all of them are rendered.
+
+        @return the framebuffer holding the samples of all tasks
+        """
+
+        asyncio.run(self.serve())
+        return self.framebuffer
+
@@ -0,0 +1,108 @@
+import logging
+import multiprocessing
+import os
+import pickle
+import socket
+import time
+
+from pytracer import RenderTask
+from pytracer.distributed.protocol import encode_message, receive_message
+from pytracer.render_statistics import STATISTICS
+from pytracer.renderer import render_tile
+
+# seconds a worker keeps trying to reach a coordinator that is not listening yet
+CONNECT_TIMEOUT = 30.0
+CONNECT_RETRY_INTERVAL = 0.5
+
+
+class RenderWorker:
+    """
+    Renders tiles for a RenderCoordinator. The worker connects to the
+    coordinator, receives the scene once and then renders the tiles it is sent
+    one after another until the coordinator reports the frame as done. Every
+    tile is answered with its float32 (rows, cols, Framebuffer.CHANNELS) buffer.
+
+    The scene arrives pickled, a worker must therefore only connect to a
+    coordinator it trusts.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.scene = None
+
+    def connect(self) -> socket.socket:
+        deadline = time.monotonic() + CONNECT_TIMEOUT
+        while True:
+            try:
+                return socket.create_connection((self.host, self.port))
+            except ConnectionRefusedError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(CONNECT_RETRY_INTERVAL)
+
+    def run(self) -> int:
+        """
+        Render tiles until the coordinator is done or the connection is closed.
+
+        @return the number of rendered tiles
+        """
+
+        tile_count = 0
+        with self.connect() as connection, connection.makefile("rwb") as stream:
+            stream.write(encode_message({"type": "hello", "name": self.name}))
+            stream.flush()
+
+            header, payload = receive_message(stream)
+            if header["type"] != "scene":
+                raise ValueError(f"Expected the scene, received '{header['type']}'")
+
+            self.scene = pickle.loads(payload)
+            STATISTICS.enabled = header.get("collect_statistics", False)
+            STATISTICS.reset()
+            logging.info(f"Worker {self.name} received the scene from {self.host}:{self.port}")
+
+            while True:
+                header, _ = receive_message(stream)
+                if header["type"] == "done":
+                    break
+                if header["type"] != "task":
+                    raise ValueError(f"Expected a task, received '{header['type']}'")
+
+                render_task = RenderTask(tile=tuple(header["tile"]), width=header["width"], spp=header["spp"])
+                pixels = render_tile(self.scene, render_task)
+                stream.write(encode_message({
+                    "type": "result",
+                    "id": header["id"],
+                    "statistics": STATISTICS.pop()
+                }, pixels.tobytes()))
+                stream.flush()
+                tile_count += 1
+
+        logging.info(f"Worker {self.name} rendered {tile_count} tiles")
+        return tile_count
+
+
+def run_worker(host: str, port: int) -> None:
+    try:
+        RenderWorker(host, port).run()
+    except ConnectionError as error:
+        logging.warning(f"Worker lost the connection to {host}:{port}: {error}")
+
+
+def run_workers(host: str, port: int, process_count: int = None) -> None:
+    """
+    Start one worker process per thread of this machine and wait until all of
+    them are done.
+
+    @param process_count the number of worker processes, the number of available threads by default
+    """
+
+    process_count = process_count or multiprocessing.cpu_count()
+    logging.info(f"Starting {process_count} render workers for {host}:{port}")
+    processes = [multiprocessing.Process(target=run_worker, args=(host, port)) for _ in range(process_count)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
@@ -0,0 +1,148 @@
+import ctypes
+import multiprocessing
+
+import numpy as np
+
+
+class Framebuffer:
+    """
+    Accumulates the radiance samples of all pixels in one interleaved float32
+    (height, width, 5) array: the first three channels hold the sum of the RGB
+    samples of a pixel, followed by the number of samples taken and the sum of
+    the squared luminances of the samples. The latter gives a running estimate
+    of the variance of every pixel, see Framebuffer.relative_errors.
+
+    The array lives either in shared memory or in a memory-mapped .npy file,
+    such that all render workers can add their samples to the same
+    framebuffer.
+    """
+
+    CHANNELS = 5
+    COUNT = 3
+    SQUARED_LUMINANCE = 4
+
+    # Rec. 709 luminance of linear RGB
+    LUMINANCE_WEIGHTS = np.array([0.2126, 0.7152, 0.0722])
+
+    # relative errors of pixels darker than this are measured relative to this luminance
+    LUMINANCE_FLOOR = 0.05
+
+    def __init__(self, width: int, height: int, raw_pixels=None, filepath: str = None):
+        """
+        @param width image width in pixels
+        @param height image height in pixels
+        @param raw_pixels shared ctypes float array of size width * height * 5,
+          e.g. the raw_pixels of another framebuffer. A new zero initialized
+          array is allocated by default.
+        @param filepath .npy file holding the pixels, see Framebuffer.create_file.
+          Takes precedence over raw_pixels.
+        """
+
+        self.width = width
+        self.height = height
+        self.filepath = filepath
+        self.raw_pixels = raw_pixels
+        if self.filepath is None and self.raw_pixels is None:
+            self.raw_pixels = multiprocessing.RawArray(ctypes.c_float, width * height * self.CHANNELS)
+
+        self.pixels = self.map_pixels()
+
+    @classmethod
+    def create_file(cls, filepath: str, width: int, height: int) -> 'Framebuffer':
+        """
+        @return an empty framebuffer stored in a new memory-mapped .npy file
+        """
+
+        pixels = np.lib.format.open_memmap(filepath, mode="w+", dtype=np.float32,
+                                           shape=(height, width, cls.CHANNELS))
+        del pixels
+        return Framebuffer(width, height, filepath=filepath)
+
+    def map_pixels(self) -> np.ndarray:
+        if self.filepath is not None:
+            pixels = np.load(self.filepath, mmap_mode="r+")
+            if pixels.shape != (self.height, self.width, self.CHANNELS) or pixels.dtype != np.float32:
+                raise ValueError(f"{self.filepath} does not hold a {self.width} x {self.height} framebuffer")
+
+            return pixels
+
+        return np.frombuffer(self.raw_pixels, dtype=np.float32).reshape((self.height, self.width, self.CHANNELS))
+
+    def __getstate__(self) -> dict:
+        # the pixels are mapped again when the framebuffer is sent to a worker
+        state = self.__dict__.copy()
+        del state["pixels"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.pixels = self.map_pixels()
+
+    def flush(self) -> None:
+        """
+        Write the pixels of a file backed framebuffer to disk.
+        """
+
+        if isinstance(self.pixels, np.memmap):
+            self.pixels.flush()
+
+    def accumulate(self, pixel_indices: np.ndarray, spectrum: np.ndarray) -> None:
+        """
+        @param pixel_indices (N,) flat pixel indices (row * width + col) of the samples
+        @param spectrum (N, 3) radiance samples
+        """
+
+        flat_pixels = self.pixels.reshape((-1, self.CHANNELS))
+        luminance = spectrum @ self.LUMINANCE_WEIGHTS
+        np.add.at(flat_pixels[:, :self.COUNT], pixel_indices, spectrum)
+        np.add.at(flat_pixels[:, self.COUNT], pixel_indices, 1.0)
+        np.add.at(flat_pixels[:, self.SQUARED_LUMINANCE], pixel_indices, luminance * luminance)
+
+    def sample_counts(self) -> np.ndarray:
+        """
+        @return (height, width) number of samples taken per pixel
+        """
+
+        return self.pixels[..., self.COUNT]
+
+    def sample_count(self) -> int:
+        """
+        @return the total number of samples taken
+        """
+
+        return int(self.sample_counts().sum(dtype=np.float64))
+
+    def radiance(self) -> np.ndarray:
+        """
+        @return (height, width, 3) float32 mean radiance per pixel, black for
+          pixels without samples.
+        """
+
+        counts = self.sample_counts()[..., None]
+        return self.pixels[..., :self.COUNT] / np.maximum(counts, 1.0)
+
+    def relative_errors(self, pixel_indices: np.ndarray = None) -> np.ndarray:
+        """
+        Estimate the relative standard error of the mean luminance of pixels
+        from the running sums of their samples:
+
+            mean = sum(L) / n
+            variance = (sum(L^2) / n - mean^2) * n / (n - 1)
+            error = sqrt(variance / n) / max(mean, LUMINANCE_FLOOR)
+
+        @param pixel_indices optional flat pixel indices (row * width + col), all pixels by default
+        @return float64 errors of the selected pixels, flattened if pixel_indices are given,
+          (height, width) otherwise. Pixels with less than two samples have an infinite error.
+        """
+
+        pixels = self.pixels if pixel_indices is None else self.pixels.reshape((-1, self.CHANNELS))[pixel_indices]
+        pixels = pixels.astype(np.float64)
+
+        counts = pixels[..., self.COUNT]
+        safe_counts = np.maximum(counts, 2.0)
+        mean = (pixels[..., :self.COUNT] @ self.LUMINANCE_WEIGHTS) / safe_counts
+        variance = np.maximum(pixels[..., self.SQUARED_LUMINANCE] / safe_counts - mean * mean, 0.0)
+        variance *= safe_counts / (safe_counts - 1.0)
+
+        errors = np.sqrt(variance / safe_counts) / np.maximum(mean, self.LUMINANCE_FLOOR)
+        return np.where(counts < 2.0, np.inf, errors)
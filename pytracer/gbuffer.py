@@ -0,0 +1,330 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+
+import numpy as np
+
+from typing import Optional, TYPE_CHECKING
+
+from pytracer.hit_batch import HitBatch
+from pytracer.integrators.whitted_wavefront_integrator import WhittedWavefrontIntegrator
+from pytracer.ray_batch import RayBatch
+
+if TYPE_CHECKING:
+    from pytracer import Scene
+
+
+class GBuffer:
+    """
+    Geometry buffer of the primary hits of a render, such that a render of the
+    same scene with changed materials or light sources does not intersect the
+    camera rays again. For every sample of every pixel a directory next to the
+    rendered image holds in memory-mapped .npy files
+
+      t, positions, normals, w_in   the primary hit, see HitBatch
+      material_ids                  the material slot of the hit, see
+                                    WhittedWavefrontIntegrator.build_material_table,
+                                    -1 if the camera ray missed the scene
+      primitive_ids, item_ids       the hit primitive and the item of the scene containing it
+      radiance                      the radiance of the sample in the last render
+      path_materials                bitsets of the material slots hit along the path of
+                                    the sample, see WhittedWavefrontIntegrator.integrate_paths
+
+    and in state.json the fingerprints of the geometry, materials and light
+    sources of the last render. Sample s of pixel p is the entry
+    s * width * height + p.
+
+    If the geometry fingerprint (camera, objects, meshes, image size, sampler
+    and samples per pixel) matches the scene, the render reuses the buffer:
+    samples whose path hit a material with a changed fingerprint are shaded
+    again from their primary hit, the radiance of all other samples is taken
+    from the buffer. A change of the light sources or of which materials cast
+    shadows shades all samples again. Otherwise the buffer is recorded anew.
+
+    Shading uses the stages of the WhittedWavefrontIntegrator, whatever
+    whitted integrator the scene uses.
+    """
+
+    STATE_FILENAME = "state.json"
+
+    # name -> (dtype, channels) of the arrays, channels of 0 denote scalars
+    ARRAYS = {
+        "t": (np.float64, 0),
+        "positions": (np.float64, 3),
+        "normals": (np.float64, 3),
+        "w_in": (np.float64, 3),
+        "material_ids": (np.int32, 0),
+        "primitive_ids": (np.int64, 0),
+        "item_ids": (np.int32, 0),
+        "radiance": (np.float32, 3)
+    }
+
+    def __init__(self, directory: str, width: int, height: int, spp: int):
+        """
+        @param directory holds the arrays and the state of the buffer
+        @param width image width in pixels
+        @param height image height in pixels
+        @param spp samples per pixel of the render
+        """
+
+        self.directory = directory
+        self.width = width
+        self.height = height
+        self.spp = spp
+
+        self.is_recording = True
+        # shade every sample again instead of only the ones whose path hit a changed material
+        self.shade_all = False
+        # bitset of the changed material slots
+        self.changed_materials = None
+        self.material_words = 1
+        self.state = None
+
+        self.arrays = None
+        self.integrator = None
+
+    @property
+    def size(self) -> int:
+        """
+        @return the number of samples in the buffer
+        """
+
+        return self.spp * self.width * self.height
+
+    @property
+    def state_filepath(self) -> str:
+        return os.path.join(self.directory, self.STATE_FILENAME)
+
+    def array_filepath(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.npy")
+
+    def array_shapes(self) -> dict:
+        """
+        @return name -> (dtype, shape) of all arrays of the buffer
+        """
+
+        shapes = {name: (dtype, (self.size, channels) if channels else (self.size,))
+                  for name, (dtype, channels) in self.ARRAYS.items()}
+        shapes["path_materials"] = (np.uint64, (self.size, self.material_words))
+        return shapes
+
+    def __getstate__(self) -> dict:
+        # the arrays are mapped again when the buffer is sent to a worker, the integrator is created per worker
+        state = self.__dict__.copy()
+        state["arrays"] = None
+        state["integrator"] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.arrays = self.map_arrays()
+
+    def map_arrays(self) -> dict:
+        return {name: np.load(self.array_filepath(name), mmap_mode="r+") for name in self.array_shapes()}
+
+    def create_arrays(self) -> dict:
+        os.makedirs(self.directory, exist_ok=True)
+        for name, (dtype, shape) in self.array_shapes().items():
+            array = np.lib.format.open_memmap(self.array_filepath(name), mode="w+", dtype=dtype, shape=shape)
+            del array
+
+        return self.map_arrays()
+
+    @staticmethod
+    def fingerprint(value) -> str:
+        return hashlib.blake2b(pickle.dumps(value, protocol=4), digest_size=16).hexdigest()
+
+    @classmethod
+    def geometry_fingerprint(cls, scene: 'Scene', spp: int) -> str:
+        """
+        @return fingerprint of everything but the materials and light sources that determines the primary hits
+        """
+
+        with open(scene.filepath, "rb") as file:
+            scene_description = json.loads(file.read())
+
+        objects = {kind: [{key: value for key, value in object_params.items() if key != "material"}
+                          for object_params in object_params_list]
+                   for kind, object_params_list in scene_description["objects"].items()}
+        meshes = []
+        for filepath in scene.mesh_filepaths:
+            stat = os.stat(filepath)
+            meshes.append((filepath, stat.st_size, stat.st_mtime_ns))
+
+        return cls.fingerprint((scene_description["camera"], objects, meshes, scene.width, scene.height,
+                                type(scene.sampler).__name__, spp))
+
+    def read_state(self) -> Optional[dict]:
+        try:
+            with open(self.state_filepath) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def open(self, scene: 'Scene') -> None:
+        """
+        Compare the buffer on disk with the scene and either prepare to reuse it
+        or create an empty buffer to record. The state on disk is removed until
+        save_state is called, such that an interrupted render is recorded anew.
+        """
+
+        integrator = WhittedWavefrontIntegrator(scene)
+        integrator.build_material_table()
+        self.material_words = integrator.material_words
+        self.state = {
+            "width": self.width,
+            "height": self.height,
+            "spp": self.spp,
+            "geometry": self.geometry_fingerprint(scene, self.spp),
+            "materials": [self.fingerprint(material) for material in integrator.materials],
+            "casts_shadows": [material.does_cast_shadows() for material in integrator.materials],
+            "lights": self.fingerprint(scene.light_sources)
+        }
+
+        previous_state = self.read_state()
+        if os.path.exists(self.state_filepath):
+            os.remove(self.state_filepath)
+
+        is_reusable = (previous_state is not None
+                       and all(previous_state.get(key) == self.state[key] for key in ("width", "height", "spp", "geometry"))
+                       and len(previous_state.get("materials", [])) == len(self.state["materials"]))
+        if is_reusable:
+            try:
+                self.arrays = self.map_arrays()
+            except (OSError, ValueError):
+                is_reusable = False
+
+        if not is_reusable:
+            self.is_recording = True
+            self.arrays = self.create_arrays()
+            logging.info(f"Recording a G-buffer of the primary hits to {self.directory}")
+            return
+
+        self.is_recording = False
+        self.shade_all = (previous_state["lights"] != self.state["lights"]
+                          or previous_state["casts_shadows"] != self.state["casts_shadows"])
+
+        changed = [slot for slot, (previous, current) in enumerate(zip(previous_state["materials"], self.state["materials"]))
+                   if previous != current]
+        self.changed_materials = np.zeros(self.material_words, dtype=np.uint64)
+        for slot in changed:
+            self.changed_materials[slot // WhittedWavefrontIntegrator.WORD_BITS] |= np.uint64(1) << np.uint64(
+                slot % WhittedWavefrontIntegrator.WORD_BITS)
+
+        if self.shade_all:
+            logging.info("Reusing the primary hits of the G-buffer, all samples are shaded again since the light "
+                         "sources or the shadows changed")
+        else:
+            logging.info(f"Reusing the G-buffer, {len(changed)} of {len(self.state['materials'])} materials changed")
+
+    def save_state(self) -> None:
+        """
+        Mark the buffer as complete for the materials and light sources of the render.
+        """
+
+        for array in self.arrays.values():
+            array.flush()
+
+        temporary_filepath = f"{self.state_filepath}.tmp"
+        with open(temporary_filepath, "w") as file:
+            json.dump(self.state, file)
+        os.replace(temporary_filepath, self.state_filepath)
+
+    def slots(self, pixel_indices: np.ndarray, sample_offset: int, spp: int) -> np.ndarray:
+        """
+        @param pixel_indices flat pixel indices of the rays of Camera.make_worldspace_rays,
+          which generates the spp samples of a pixel one after another
+        @param sample_offset index of the first sample of the rays, e.g. the samples per pixel of the completed passes
+        @param spp samples per pixel of the rays
+        @return the entries of the rays in the buffer
+        """
+
+        samples = sample_offset + np.arange(len(pixel_indices)) % spp
+        return samples * (self.width * self.height) + pixel_indices
+
+    def store_hits(self, slots: np.ndarray, is_hit: np.ndarray, hits: HitBatch) -> None:
+        hit_slots = slots[is_hit]
+        self.arrays["material_ids"][slots] = -1
+        self.arrays["t"][hit_slots] = hits.t
+        self.arrays["positions"][hit_slots] = hits.positions
+        self.arrays["normals"][hit_slots] = hits.normals
+        self.arrays["w_in"][hit_slots] = hits.w_in
+        self.arrays["material_ids"][hit_slots] = hits.material_ids
+        self.arrays["primitive_ids"][hit_slots] = hits.primitive_ids
+        self.arrays["item_ids"][hit_slots] = hits.item_ids
+
+    def load_hits(self, slots: np.ndarray) -> tuple:
+        """
+        @return (is_hit, hits) of the given entries, see WhittedWavefrontIntegrator.intersect_stage
+        """
+
+        material_ids = self.arrays["material_ids"][slots]
+        is_hit = material_ids >= 0
+        hit_slots = slots[is_hit]
+        hits = HitBatch(
+            t=self.arrays["t"][hit_slots],
+            positions=self.arrays["positions"][hit_slots],
+            normals=self.arrays["normals"][hit_slots],
+            w_in=self.arrays["w_in"][hit_slots],
+            material_ids=material_ids[is_hit].astype(np.int64),
+            primitive_ids=self.arrays["primitive_ids"][hit_slots],
+            item_ids=self.arrays["item_ids"][hit_slots].astype(np.int64)
+        )
+        return is_hit, hits
+
+    def integrate(self, scene: 'Scene', rays: RayBatch, slots: np.ndarray, costs: np.ndarray = None,
+                  aovs: np.ndarray = None) -> np.ndarray:
+        """
+        Integrator.integrate_batch that records the primary hits of the rays or
+        shades them from the recorded hits.
+
+        @param scene the rendered scene
+        @param rays camera rays
+        @param slots entries of the rays in the buffer, see slots
+        @param costs see Integrator.integrate_batch, zero for samples that are not shaded again
+        @param aovs see Integrator.integrate_batch, taken from the recorded hits when the buffer is reused
+        @return (N, 3) radiance of the rays
+        """
+
+        if self.integrator is None:
+            self.integrator = scene.integrator
+            if not isinstance(self.integrator, WhittedWavefrontIntegrator):
+                self.integrator = WhittedWavefrontIntegrator(scene)
+
+        if self.is_recording:
+            radiance, (is_hit, hits), path_materials = self.integrator.integrate_paths(rays, costs, record_paths=True)
+            self.store_hits(slots, is_hit, hits)
+            self.arrays["radiance"][slots] = radiance
+            self.arrays["path_materials"][slots] = path_materials
+            if aovs is not None:
+                aovs[...] = self.integrator.make_aov_table().samples(rays, is_hit, hits)
+            return radiance
+
+        if aovs is not None:
+            aovs[...] = self.integrator.make_aov_table().samples(rays, *self.load_hits(slots))
+
+        radiance = self.arrays["radiance"][slots].astype(np.float64)
+        if self.shade_all:
+            is_changed = np.ones(len(slots), dtype=bool)
+        else:
+            is_changed = np.any(self.arrays["path_materials"][slots] & self.changed_materials, axis=1)
+
+        if costs is not None:
+            costs[...] = 0.0
+        if not is_changed.any():
+            return radiance
+
+        changed_slots = slots[is_changed]
+        changed_costs = None if costs is None else np.zeros((len(changed_slots), 2))
+        changed_radiance, _, path_materials = self.integrator.integrate_paths(
+            rays.select(is_changed), changed_costs, self.load_hits(changed_slots), record_paths=True)
+
+        radiance[is_changed] = changed_radiance
+        self.arrays["radiance"][changed_slots] = changed_radiance
+        self.arrays["path_materials"][changed_slots] = path_materials
+        if costs is not None:
+            costs[is_changed] = changed_costs
+
+        return radiance
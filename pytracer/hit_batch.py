@@ -0,0 +1,78 @@
+import numpy as np
+
+from pytracer.hit_record import HitRecord
+from pytracer.math.vec3 import Vec3
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pytracer import Material
+
+
+class HitBatch:
+    """
+    Structure-of-arrays counterpart of HitRecord: the k-th entry of every array
+    describes the hit of the k-th ray of a RayBatch.
+    """
+
+    def __init__(self,
+                 t: np.ndarray,
+                 positions: np.ndarray,
+                 normals: np.ndarray,
+                 w_in: np.ndarray,
+                 material_ids: np.ndarray,
+                 primitive_ids: np.ndarray = None,
+                 item_ids: np.ndarray = None):
+        """
+        @param t (N,) ray parameters where the hits occurred
+        @param positions (N, 3) hit positions
+        @param normals (N, 3) surface normals at the hit positions
+        @param w_in (N, 3) normalized incident directions, pointing away from the surface
+        @param material_ids (N,) index of the hit material in the material table of the integrator
+        @param primitive_ids optional (N,) id of the hit primitive within its item, e.g. the face of a mesh
+        @param item_ids optional (N,) index of the hit item in the container of the scene
+        """
+
+        self.t = t
+        self.positions = positions
+        self.normals = normals
+        self.w_in = w_in
+        self.material_ids = material_ids
+        self.primitive_ids = primitive_ids
+        self.item_ids = item_ids
+
+    def __len__(self) -> int:
+        return len(self.t)
+
+    def select(self, mask: np.ndarray) -> 'HitBatch':
+        """
+        @param mask boolean mask or index array selecting the hits to keep
+        @return a compacted batch that only contains the selected hits
+        """
+
+        return HitBatch(
+            t=self.t[mask],
+            positions=self.positions[mask],
+            normals=self.normals[mask],
+            w_in=self.w_in[mask],
+            material_ids=self.material_ids[mask],
+            primitive_ids=None if self.primitive_ids is None else self.primitive_ids[mask],
+            item_ids=None if self.item_ids is None else self.item_ids[mask]
+        )
+
+    def hit_record_at(self, k: int, material: 'Material' = None) -> HitRecord:
+        """
+        @param k index of a hit in this batch
+        @param material the material of the hit surface
+        @return the k-th hit of this batch as a regular HitRecord
+        """
+
+        return HitRecord(
+            t=float(self.t[k]),
+            position=Vec3.from_array(self.positions[k]),
+            normal=Vec3.from_array(self.normals[k]),
+            tangent=Vec3.zero(),
+            w_in=Vec3.from_array(self.w_in[k]),
+            material=material,
+            intersectable=None
+        )
@@ -14,7 +14,9 @@ class HitRecord:
                  intersectable: Intersectable,
                  i=0,  # TODO: rename to u
                  j=0,  # j TODO: rename to v texture lookup coordinates in plane space
-                 is_null=False):
+                 is_null=False,
+                 item_id=-1,
+                 primitive_id=-1):
         """
         @param t parameter on ray where the hit occurred.
         @param position where the ray hit the surface
@@ -26,6 +28,8 @@ class HitRecord:
         @param intersectable the object that was hit
         @param i [int]
         @param j [int]
+        @param item_id index of the hit item in the container of the scene, -1 if unknown
+        @param primitive_id id of the hit primitive within its item, e.g. the face of a mesh, -1 if unknown
         """
 
         self.t = t
@@ -38,6 +42,8 @@ class HitRecord:
         self.i = i
         self.j = j
         self.is_null = is_null
+        self.item_id = item_id
+        self.primitive_id = primitive_id
 
     @classmethod
     def make_empty(cls):
@@ -83,7 +89,9 @@ class HitRecord:
             intersectable=other_hit_record.intersectable,
             i=other_hit_record.i,
             j=other_hit_record.j,
-            is_null=other_hit_record.is_null
+            is_null=other_hit_record.is_null,
+            item_id=other_hit_record.item_id,
+            primitive_id=other_hit_record.primitive_id
         )
         return hit_record
 
@@ -0,0 +1,146 @@
+import io
+
+import numpy as np
+
+from PIL import Image
+
+
+class ImageWriter:
+    """
+    Converts the linear radiance of a rendered image into output files. All
+    conversions operate on whole images at once.
+    """
+
+    TONE_MAPPINGS = ("clamp", "reinhard")
+    FLOAT_FORMATS = ("pfm", "npy")
+    IMAGE_FORMATS = ("png",) + FLOAT_FORMATS
+
+    # colors of the heatmaps from the lowest to the highest value, see write_heatmap
+    HEATMAP_COLORS = np.array([
+        [0.0, 0.0, 0.02],
+        [0.34, 0.06, 0.43],
+        [0.73, 0.21, 0.33],
+        [0.98, 0.55, 0.04],
+        [0.99, 1.0, 0.64]
+    ])
+
+    # resolution of the lookup table used for the 8 bit sRGB encoding
+    SRGB_TABLE_SIZE = 1 << 16
+    _srgb_table = None
+
+    @staticmethod
+    def tone_map(radiance: np.ndarray, tone_mapping: str = "clamp") -> np.ndarray:
+        """
+        @param radiance (height, width, 3) linear radiance
+        @param tone_mapping one of TONE_MAPPINGS: 'clamp' cuts off all values
+          above one, 'reinhard' compresses them with L / (1 + L) per channel.
+        @return (height, width, 3) linear values in [0, 1]
+        """
+
+        if tone_mapping not in ImageWriter.TONE_MAPPINGS:
+            raise ValueError(f"Unknown tone mapping '{tone_mapping}', expected one of {ImageWriter.TONE_MAPPINGS}")
+
+        linear = np.maximum(radiance, np.float32(0.0), dtype=np.float32)
+        if tone_mapping == "reinhard":
+            linear /= linear + np.float32(1.0)
+
+        return np.minimum(linear, np.float32(1.0), out=linear)
+
+    @staticmethod
+    def encode_srgb(linear: np.ndarray) -> np.ndarray:
+        """
+        Apply the sRGB transfer function to linear values in [0, 1].
+        https://en.wikipedia.org/wiki/SRGB#Transfer_function_(%22gamma%22)
+        """
+
+        return np.where(
+            linear <= 0.0031308,
+            12.92 * linear,
+            1.055 * np.power(linear, 1.0 / 2.4) - 0.055
+        )
+
+    @staticmethod
+    def to_8bit(radiance: np.ndarray, tone_mapping: str = "clamp") -> np.ndarray:
+        """
+        @param radiance (height, width, 3) linear radiance
+        @param tone_mapping see ImageWriter.tone_map
+        @return (height, width, 3) sRGB encoded uint8 image
+        """
+
+        if ImageWriter._srgb_table is None:
+            linear = np.linspace(0.0, 1.0, ImageWriter.SRGB_TABLE_SIZE)
+            ImageWriter._srgb_table = np.rint(ImageWriter.encode_srgb(linear) * 255.0).astype(np.uint8)
+
+        linear = ImageWriter.tone_map(radiance, tone_mapping)
+        linear *= np.float32(ImageWriter.SRGB_TABLE_SIZE - 1)
+        linear += np.float32(0.5)
+        return ImageWriter._srgb_table[linear.astype(np.uint16)]
+
+    @staticmethod
+    def write_png(filepath: str, radiance: np.ndarray, tone_mapping: str = "clamp") -> None:
+        Image.fromarray(ImageWriter.to_8bit(radiance, tone_mapping)).save(filepath)
+
+    @staticmethod
+    def write_pfm(filepath: str, radiance: np.ndarray) -> None:
+        """
+        Write the linear radiance as little endian RGB Portable Float Map, a
+        (height, width) image as greyscale map. PFM stores the rows bottom to top.
+        http://www.pauldebevec.com/Research/HDR/PFM/
+        """
+
+        with open(filepath, "wb") as file:
+            file.write(ImageWriter.encode_pfm(radiance))
+
+    @staticmethod
+    def encode_pfm(radiance: np.ndarray) -> bytes:
+        height, width = radiance.shape[:2]
+        identifier = "PF" if radiance.ndim == 3 else "Pf"
+        header = f"{identifier}\n{width} {height}\n-1.0\n".encode("ascii")
+        return header + np.ascontiguousarray(radiance[::-1], dtype="<f4").tobytes()
+
+    @staticmethod
+    def write_npy(filepath: str, radiance: np.ndarray) -> None:
+        np.save(filepath, np.asarray(radiance, dtype=np.float32))
+
+    @staticmethod
+    def encode(radiance: np.ndarray, image_format: str, tone_mapping: str = "clamp") -> bytes:
+        """
+        Encode an image in memory instead of writing it to a file, e.g. to send it over a socket.
+
+        @param radiance (height, width, 3) linear radiance
+        @param image_format one of IMAGE_FORMATS
+        @param tone_mapping see ImageWriter.tone_map, only applies to png
+        @return the content the file written by write_<image_format> would have
+        """
+
+        if image_format == "pfm":
+            return ImageWriter.encode_pfm(radiance)
+
+        buffer = io.BytesIO()
+        if image_format == "png":
+            Image.fromarray(ImageWriter.to_8bit(radiance, tone_mapping)).save(buffer, format="PNG")
+        elif image_format == "npy":
+            np.save(buffer, np.asarray(radiance, dtype=np.float32))
+        else:
+            raise ValueError(f"Unknown image format '{image_format}', expected one of {ImageWriter.IMAGE_FORMATS}")
+
+        return buffer.getvalue()
+
+    @staticmethod
+    def write_heatmap(filepath: str, values: np.ndarray) -> None:
+        """
+        Write non-negative values, e.g. the render cost of every pixel, as PNG
+        colored with HEATMAP_COLORS. The values are normalized by their 99th
+        percentile, such that a few outliers do not make all other pixels dark.
+
+        @param values (height, width) float array
+        """
+
+        scale = np.percentile(values, 99) if values.size > 0 else 0.0
+        normalized = np.clip(values / scale, 0.0, 1.0) if scale > 0.0 else np.zeros_like(values)
+
+        positions = normalized * (len(ImageWriter.HEATMAP_COLORS) - 1)
+        control_points = np.arange(len(ImageWriter.HEATMAP_COLORS))
+        colors = np.stack([np.interp(positions, control_points, ImageWriter.HEATMAP_COLORS[:, channel])
+                           for channel in range(3)], axis=-1)
+        Image.fromarray(np.rint(colors * 255.0).astype(np.uint8)).save(filepath)
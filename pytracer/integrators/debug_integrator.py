@@ -13,7 +13,9 @@ class DebugIntegrator(Integrator):
         self.scene = scene
 
     def integrate(self, ray: Ray) -> Vec3:
+        self.traced_rays += 1
         hit_record = self.scene.intersectable_list.intersect(ray)
+        self.primary_hit_record = hit_record
         if not hit_record.is_valid():
             return Vec3.zero()
 
@@ -1,10 +1,64 @@
+import time
+
 from abc import ABC, abstractmethod
 
+import numpy as np
+
+from pytracer.aov_buffer import AovTable
 from pytracer.ray import Ray
+from pytracer.ray_batch import RayBatch
 from pytracer.math.vec3 import Vec3
 
 
 class Integrator(ABC):
+    # number of rays traced by integrate so far, including secondary and shadow rays
+    traced_rays = 0
+
+    # hit record of the last camera ray passed to integrate, None if the integrator does not keep it
+    primary_hit_record = None
+
+    # numbering of the materials and primitives of the scene for the AOVs, see make_aov_table
+    aov_table = None
+
     @abstractmethod
     def integrate(self, ray: Ray) -> Vec3:
         pass
+
+    def make_aov_table(self) -> AovTable:
+        """
+        @return the AovTable of the scene of the integrator, created on first use
+        """
+
+        if self.aov_table is None:
+            self.aov_table = AovTable(self.scene)
+
+        return self.aov_table
+
+    def integrate_batch(self, rays: RayBatch, costs: np.ndarray = None, aovs: np.ndarray = None) -> np.ndarray:
+        """
+        @param rays batch of rays
+        @param costs optional (N, 2) float array, receives the seconds spent on
+          every ray of the batch and the number of rays traced for it, see CostBuffer
+        @param aovs optional (N, AovBuffer.SAMPLE_CHANNELS) float array, receives
+          the output variables of the primary hit of every ray, see AovBuffer
+        @return (N, 3) float array, the radiance carried by every ray of the batch
+        """
+
+        radiance = np.zeros((len(rays), 3))
+        if costs is None and aovs is None:
+            for k in range(len(rays)):
+                radiance[k] = self.integrate(rays.ray_at(k))
+
+            return radiance
+
+        for k in range(len(rays)):
+            ray = rays.ray_at(k)
+            traced_rays = self.traced_rays
+            start_time = time.perf_counter()
+            radiance[k] = self.integrate(ray)
+            if costs is not None:
+                costs[k] = time.perf_counter() - start_time, self.traced_rays - traced_rays
+            if aovs is not None:
+                aovs[k] = self.make_aov_table().sample(ray, self.primary_hit_record)
+
+        return radiance
@@ -0,0 +1,919 @@
+"""
+Compiled counterpart of the scalar WhittedIntegrator path: sphere, plane and
+triangle intersection, the traversal of the scene and mesh hierarchies and the
+shading of all materials of pytracer.scene.MATERIALS. The kernels follow the
+scalar code operation by operation, such that both backends render the same
+image up to rounding.
+
+The scene is flattened into the arrays of a CompiledScene by compile_scene.
+Items are the entries of the container of the scene BVH:
+
+  + item_types (n,) one of SPHERE, PLANE, TRIANGLE, MESH, INSTANCE
+  + item_indices (n,) row of the item in spheres, planes or triangles for
+    spheres, planes and triangles, the mesh index for meshes and the row in
+    the instance_* arrays for mesh instances
+  + item_materials (n,) row of the material of the item in the material table
+
+Triangles of all meshes are numbered in hierarchy order behind the triangles
+of the scene, the hierarchies of all meshes are concatenated into the
+mesh_node_* arrays. mesh_node_bases and mesh_triangle_bases are the first node
+and the first triangle of every mesh, the node offsets stay relative to their
+mesh. mesh_face_ids holds the face id of triangle k of the meshes in row
+k - len(triangles). Like their TriangleBuffers the triangles of meshes are stored indexed:
+mesh_indices holds the vertices of triangle k of the meshes in row
+k - len(triangles), its corners are read from mesh_vertices and, if
+mesh_has_normals is set, its normals from mesh_normals. Meshes shared by
+several instances are stored once.
+"""
+
+import math
+
+from collections import namedtuple
+
+import numpy as np
+
+from typing import TYPE_CHECKING
+
+from pytracer.intersectables.containers.mesh import Mesh
+from pytracer.intersectables.containers.mesh_instance import MeshInstance
+from pytracer.intersectables.geometries.plane import Plane
+from pytracer.intersectables.geometries.sphere import Sphere
+from pytracer.intersectables.geometries.triangle import MeshTriangle, Triangle
+from pytracer.light_sources.point_light import PointLight
+from pytracer.materials.blinn_material import BlinnMaterial
+from pytracer.materials.diffuse_material import DiffuseMaterial
+from pytracer.materials.grid_textured_material import GridTexturedMaterial
+from pytracer.materials.reflective_material import ReflectiveMaterial
+from pytracer.materials.refractive_material import RefractiveMaterial
+from pytracer.ray import Ray
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+if TYPE_CHECKING:
+    from pytracer import Scene
+
+NUMBA_AVAILABLE = numba is not None
+
+
+def jit(function):
+    """
+    Compile a kernel in nopython mode. Without numba the kernels stay plain
+    python functions, they are never called then, see WhittedNumbaIntegrator.
+    """
+
+    if numba is None:
+        return function
+
+    return numba.njit(cache=True)(function)
+
+
+SPHERE = 0
+PLANE = 1
+TRIANGLE = 2
+MESH = 3
+INSTANCE = 4
+
+BLINN = 0
+REFLECTIVE = 1
+REFRACTIVE = 2
+DIFFUSE = 3
+GRID = 4
+
+# material_params columns of the material types
+# BLINN: diffuse (0:3), specular (3:6), shininess (6)
+# REFLECTIVE: ks (0:3)
+# REFRACTIVE: ks (0:3), refraction index (3)
+# DIFFUSE: brdf (0:3)
+# GRID: brdf (0:3), line color (3:6), tile color (6:9), shift (9:12), thickness (12), scale (13)
+MATERIAL_PARAM_COUNT = 14
+
+# entries of the counters array filled by integrate_rays
+KERNEL_COUNTERS = (
+    "shadow_rays",
+    "reflection_rays",
+    "refraction_rays",
+    "intersection_tests",
+    "bvh_node_visits",
+    "material_evaluations"
+)
+SHADOW_RAYS = 0
+REFLECTION_RAYS = 1
+REFRACTION_RAYS = 2
+INTERSECTION_TESTS = 3
+BVH_NODE_VISITS = 4
+MATERIAL_EVALUATIONS = 5
+
+MAX_BOUNCES = 5
+# a specular hit pushes at most two rays, one of which is popped next
+RAY_STACK_SIZE = 2 * (MAX_BOUNCES + 1) + 1
+ESP = Ray.ESP
+TRIANGLE_EPS = 1e-12
+PLANE_EPS = 0.000001
+
+CompiledScene = namedtuple("CompiledScene", [
+    "node_bounds", "node_offsets", "node_counts", "node_axes", "ordered_item_ids", "unbounded_item_ids",
+    "item_types", "item_indices", "item_materials",
+    "spheres", "planes",
+    "triangles", "face_normals", "vertex_normals", "has_vertex_normals",
+    "mesh_vertices", "mesh_normals", "mesh_indices", "mesh_has_normals",
+    "mesh_node_bounds", "mesh_node_offsets", "mesh_node_counts", "mesh_node_axes",
+    "mesh_node_bases", "mesh_node_sizes", "mesh_triangle_bases", "mesh_face_ids",
+    "instance_inverses", "instance_normal_matrices", "instance_meshes",
+    "material_types", "material_params", "casts_shadows",
+    "lights"
+])
+
+
+def material_row(material) -> tuple:
+    """
+    @return (material type, parameters) of a material, see MATERIAL_PARAM_COUNT
+    @raise NotImplementedError for materials without a compiled counterpart
+    """
+
+    params = np.zeros(MATERIAL_PARAM_COUNT)
+    material_type = type(material)
+    if material_type is BlinnMaterial:
+        params[0:3] = material.diffuse.tolist()
+        params[3:6] = material.specular.tolist()
+        params[6] = material.shininess
+        return BLINN, params
+    if material_type is ReflectiveMaterial:
+        params[0:3] = material.ks.tolist()
+        return REFLECTIVE, params
+    if material_type is RefractiveMaterial:
+        params[0:3] = material.ks.tolist()
+        params[3] = material.refraction_index
+        return REFRACTIVE, params
+    if material_type is DiffuseMaterial:
+        params[0:3] = material.emission.tolist()
+        return DIFFUSE, params
+    if material_type is GridTexturedMaterial:
+        params[0:3] = material.diffuse.emission.tolist()
+        params[3:6] = material.line_color.tolist()
+        params[6:9] = material.tile_color.tolist()
+        params[9:12] = material.shift.tolist()
+        params[12] = material.thickness
+        params[13] = material.scale
+        return GRID, params
+
+    raise NotImplementedError(f"the numba backend does not support {material_type.__name__}")
+
+
+def compile_scene(scene: 'Scene') -> CompiledScene:
+    """
+    Flatten the intersectables, materials and light sources of a scene into the
+    arrays used by the kernels.
+
+    @raise NotImplementedError if the scene contains an intersectable, material or light
+      source without a compiled counterpart
+    """
+
+    bvh = scene.intersectable_list
+    if not bvh.is_built:
+        bvh.build()
+
+    materials = []
+    material_ids = {}
+    item_types = []
+    item_indices = []
+    item_materials = []
+    spheres = []
+    planes = []
+    triangles = []
+    face_normals = []
+    vertex_normals = []
+    has_vertex_normals = []
+    meshes = []
+    mesh_ids = {}
+    instances = []
+
+    def mesh_index(mesh: Mesh) -> int:
+        if id(mesh) not in mesh_ids:
+            mesh_ids[id(mesh)] = len(meshes)
+            meshes.append(mesh)
+        return mesh_ids[id(mesh)]
+
+    for item in bvh.container:
+        if id(item.material) not in material_ids:
+            material_ids[id(item.material)] = len(materials)
+            materials.append(item.material)
+        item_materials.append(material_ids[id(item.material)])
+
+        if type(item) is Sphere:
+            item_types.append(SPHERE)
+            item_indices.append(len(spheres))
+            spheres.append(item.center.tolist() + [item.radius])
+        elif type(item) is Plane:
+            item_types.append(PLANE)
+            item_indices.append(len(planes))
+            planes.append(item.normal.tolist() + [item.distance])
+        elif type(item) in (Triangle, MeshTriangle):
+            item_types.append(TRIANGLE)
+            item_indices.append(len(triangles))
+            triangles.append(list(item._a + item._ba + item._ca))
+            face_normals.append(item.face_normal.tolist())
+            if type(item) is MeshTriangle:
+                vertex_normals.append(item.nx.tolist() + item.ny.tolist() + item.nz.tolist())
+                has_vertex_normals.append(True)
+            else:
+                vertex_normals.append([0.0] * 9)
+                has_vertex_normals.append(False)
+        elif type(item) is Mesh:
+            item_types.append(MESH)
+            item_indices.append(mesh_index(item))
+        elif type(item) is MeshInstance:
+            item_types.append(INSTANCE)
+            item_indices.append(len(instances))
+            instances.append((item._inverse, item._normal_matrix, mesh_index(item.mesh)))
+        else:
+            raise NotImplementedError(f"the numba backend does not support {type(item).__name__}")
+
+    mesh_triangle_bases = []
+    mesh_vertex_rows = []
+    mesh_normal_rows = []
+    mesh_index_rows = []
+    mesh_has_normal_rows = []
+    triangle_count = len(triangles)
+    vertex_count = 0
+    has_normals = any(mesh.triangle_buffer.normals is not None for mesh in meshes)
+    for mesh in meshes:
+        buffer = mesh.triangle_buffer
+        mesh_triangle_bases.append(triangle_count)
+        triangle_count += len(buffer)
+        mesh_vertex_rows.append(buffer.positions)
+        mesh_index_rows.append(buffer.indices + np.uint32(vertex_count))
+        mesh_has_normal_rows.append(np.full(len(buffer), buffer.normals is not None))
+        if has_normals:
+            mesh_normal_rows.append(buffer.normals if buffer.normals is not None else np.zeros_like(buffer.positions))
+        vertex_count += len(buffer.positions)
+
+    mesh_node_bases = np.cumsum([0] + [len(mesh.node_counts) for mesh in meshes])
+    material_rows = [material_row(material) for material in materials]
+    for light_source in scene.light_sources:
+        if type(light_source) is not PointLight:
+            raise NotImplementedError(f"the numba backend does not support {type(light_source).__name__}")
+
+    def concatenate(arrays: list, shape: tuple, dtype) -> np.ndarray:
+        arrays = [np.asarray(array, dtype=dtype).reshape(shape) for array in arrays]
+        if len(arrays) == 0:
+            return np.zeros(tuple(max(size, 0) for size in shape), dtype=dtype)
+
+        return np.ascontiguousarray(np.concatenate(arrays))
+
+    return CompiledScene(
+        node_bounds=np.ascontiguousarray(bvh.node_bounds.reshape((-1, 6)), dtype=np.float64),
+        node_offsets=np.ascontiguousarray(bvh.node_offsets, dtype=np.int64),
+        node_counts=np.ascontiguousarray(bvh.node_counts, dtype=np.int64),
+        node_axes=np.ascontiguousarray(bvh.node_axes, dtype=np.int64),
+        ordered_item_ids=np.ascontiguousarray(bvh.ordered_item_ids, dtype=np.int64),
+        unbounded_item_ids=np.ascontiguousarray(bvh.unbounded_item_ids, dtype=np.int64),
+        item_types=np.array(item_types, dtype=np.int64),
+        item_indices=np.array(item_indices, dtype=np.int64),
+        item_materials=np.array(item_materials, dtype=np.int64),
+        spheres=np.array(spheres, dtype=np.float64).reshape((-1, 4)),
+        planes=np.array(planes, dtype=np.float64).reshape((-1, 4)),
+        triangles=np.array(triangles, dtype=np.float64).reshape((-1, 9)),
+        face_normals=np.array(face_normals, dtype=np.float64).reshape((-1, 3)),
+        vertex_normals=np.array(vertex_normals, dtype=np.float64).reshape((-1, 9)),
+        has_vertex_normals=np.array(has_vertex_normals, dtype=bool),
+        mesh_vertices=concatenate(mesh_vertex_rows, (-1, 3), np.float32),
+        mesh_normals=concatenate(mesh_normal_rows, (-1, 3), np.float32),
+        mesh_indices=concatenate(mesh_index_rows, (-1, 3), np.uint32),
+        mesh_has_normals=concatenate(mesh_has_normal_rows, (-1,), bool),
+        mesh_node_bounds=concatenate([mesh.node_bounds for mesh in meshes], (-1, 6), np.float64),
+        mesh_node_offsets=concatenate([mesh.node_offsets for mesh in meshes], (-1,), np.int64),
+        mesh_node_counts=concatenate([mesh.node_counts for mesh in meshes], (-1,), np.int64),
+        mesh_node_axes=concatenate([mesh.node_axes for mesh in meshes], (-1,), np.int64),
+        mesh_node_bases=np.array(mesh_node_bases[:-1], dtype=np.int64),
+        mesh_node_sizes=np.array(np.diff(mesh_node_bases), dtype=np.int64),
+        mesh_triangle_bases=np.array(mesh_triangle_bases, dtype=np.int64),
+        mesh_face_ids=concatenate([mesh.ordered_item_ids for mesh in meshes], (-1,), np.int64),
+        instance_inverses=np.array([instance[0] for instance in instances], dtype=np.float64).reshape((-1, 12)),
+        instance_normal_matrices=np.array([instance[1] for instance in instances], dtype=np.float64).reshape((-1, 9)),
+        instance_meshes=np.array([instance[2] for instance in instances], dtype=np.int64),
+        material_types=np.array([row[0] for row in material_rows], dtype=np.int64),
+        material_params=np.array([row[1] for row in material_rows], dtype=np.float64).reshape((-1, MATERIAL_PARAM_COUNT)),
+        casts_shadows=np.array([material.does_cast_shadows() for material in materials], dtype=bool),
+        lights=np.array([light.position.tolist() + light.emission.tolist()
+                         for light in scene.light_sources], dtype=np.float64).reshape((-1, 6))
+    )
+
+
+@jit
+def intersect_sphere(sphere, ox, oy, oz, dx, dy, dz, t_max):
+    """
+    @return t of the closest hit with 0 < t < t_max or inf, see Sphere.closest_hit
+    """
+
+    ocx = ox - sphere[0]
+    ocy = oy - sphere[1]
+    ocz = oz - sphere[2]
+    a = dx * dx + dy * dy + dz * dz
+    b = 2.0 * (dx * ocx + dy * ocy + dz * ocz)
+    c = ocx * ocx + ocy * ocy + ocz * ocz - sphere[3] ** 2.0
+    discriminant = b * b - 4.0 * a * c
+    if discriminant < 0.0:
+        return math.inf
+
+    root = math.sqrt(discriminant)
+    t1 = (-b + root) / (2.0 * a)
+    t2 = (-b - root) / (2.0 * a)
+    t = min(t1, t2)
+    if t < 0:
+        t = max(t1, t2)
+        if t < 0:
+            return math.inf
+
+    if t <= 0.0 or t >= t_max:
+        return math.inf
+
+    return t
+
+
+@jit
+def intersect_plane(plane, ox, oy, oz, dx, dy, dz, t_max):
+    """
+    @return t of the hit with 0 < t < t_max or inf, see Plane.closest_hit
+    """
+
+    cos_theta = plane[0] * dx + plane[1] * dy + plane[2] * dz
+    if abs(cos_theta) <= PLANE_EPS:
+        return math.inf
+
+    t = -(plane[3] + (ox * plane[0] + oy * plane[1] + oz * plane[2])) / cos_theta
+    if t <= 0 or t >= t_max:
+        return math.inf
+
+    return t
+
+
+@jit
+def intersect_triangle(triangle, ox, oy, oz, dx, dy, dz, t_max):
+    """
+    @param triangle the 9 floats of a, b - a and c - a
+    @return (t, u, v) of the hit with 0 < t < t_max, t is inf without hit. See Triangle.closest_hit
+    """
+
+    return intersect_corners(triangle[0], triangle[1], triangle[2], triangle[3], triangle[4], triangle[5],
+                             triangle[6], triangle[7], triangle[8], ox, oy, oz, dx, dy, dz, t_max)
+
+
+@jit
+def mesh_triangle_corners(scene, triangle):
+    """
+    @param triangle row of the triangle in mesh_indices
+    @return a, b - a and c - a of a triangle of a mesh as 9 floats, see TriangleBuffer.corner_floats
+    """
+
+    corners = scene.mesh_indices[triangle]
+    a = scene.mesh_vertices[corners[0]]
+    b = scene.mesh_vertices[corners[1]]
+    c = scene.mesh_vertices[corners[2]]
+    # float() of a float32 stays float32 in numba, the edges are computed in float64 like TriangleBuffer.corners
+    ax, ay, az = np.float64(a[0]), np.float64(a[1]), np.float64(a[2])
+    return (ax, ay, az, np.float64(b[0]) - ax, np.float64(b[1]) - ay, np.float64(b[2]) - az,
+            np.float64(c[0]) - ax, np.float64(c[1]) - ay, np.float64(c[2]) - az)
+
+
+@jit
+def intersect_corners(ax, ay, az, e1x, e1y, e1z, e2x, e2y, e2z, ox, oy, oz, dx, dy, dz, t_max):
+    """
+    @return (t, u, v) of the hit with 0 < t < t_max with the triangle a, a + e1, a + e2, see intersect_triangle
+    """
+
+    px = dy * e2z - dz * e2y
+    py = dz * e2x - dx * e2z
+    pz = dx * e2y - dy * e2x
+    det = e1x * px + e1y * py + e1z * pz
+    if -TRIANGLE_EPS < det < TRIANGLE_EPS:
+        return math.inf, 0.0, 0.0
+
+    inv_det = 1.0 / det
+    tx = ox - ax
+    ty = oy - ay
+    tz = oz - az
+    u = (tx * px + ty * py + tz * pz) * inv_det
+    if u < 0.0 or u > 1.0:
+        return math.inf, 0.0, 0.0
+
+    qx = ty * e1z - tz * e1y
+    qy = tz * e1x - tx * e1z
+    qz = tx * e1y - ty * e1x
+    v = (dx * qx + dy * qy + dz * qz) * inv_det
+    if v < 0.0 or u + v > 1.0:
+        return math.inf, 0.0, 0.0
+
+    t = (e2x * qx + e2y * qy + e2z * qz) * inv_det
+    if t <= 0.0 or t >= t_max:
+        return math.inf, 0.0, 0.0
+
+    return t, u, v
+
+
+@jit
+def is_box_hit(bounds, ox, oy, oz, inv_x, inv_y, inv_z, t_max):
+    """
+    Slab test of a node box, see BVH.closest_hit.
+
+    @return true if the ray enters the box before t_max
+    """
+
+    t0 = (bounds[0] - ox) * inv_x
+    t1 = (bounds[3] - ox) * inv_x
+    if t0 < t1:
+        t_near, t_far = t0, t1
+    else:
+        t_near, t_far = t1, t0
+
+    t0 = (bounds[1] - oy) * inv_y
+    t1 = (bounds[4] - oy) * inv_y
+    if t0 > t1:
+        t0, t1 = t1, t0
+    if t0 > t_near:
+        t_near = t0
+    if t1 < t_far:
+        t_far = t1
+
+    t0 = (bounds[2] - oz) * inv_z
+    t1 = (bounds[5] - oz) * inv_z
+    if t0 > t1:
+        t0, t1 = t1, t0
+    if t0 > t_near:
+        t_near = t0
+    if t1 < t_far:
+        t_far = t1
+
+    return not (t_near > t_far or t_far < 0.0 or t_near > t_max)
+
+
+@jit
+def inverse_component(d):
+    # a huge value instead of infinity avoids 0 * inf = nan in the slab test, see BVH.inverse_direction
+    return 1.0 / d if d != 0.0 else 1e32
+
+
+@jit
+def intersect_mesh(scene, mesh, ox, oy, oz, dx, dy, dz, t_max, any_hit, stack, counters):
+    """
+    Closest hit of a ray with the triangles of a mesh, see BVH.closest_hit. An
+    any-hit query stops at the first hit found.
+
+    @return (t, u, v, triangle) of the hit, t is inf without hit
+    """
+
+    min_t = t_max
+    closest_u = 0.0
+    closest_v = 0.0
+    closest_triangle = -1
+    if scene.mesh_node_sizes[mesh] == 0:
+        return math.inf, 0.0, 0.0, -1
+
+    node_base = scene.mesh_node_bases[mesh]
+    triangle_base = scene.mesh_triangle_bases[mesh]
+    row_base = triangle_base - len(scene.triangles)
+    inv_x = inverse_component(dx)
+    inv_y = inverse_component(dy)
+    inv_z = inverse_component(dz)
+
+    stack[0] = 0
+    stack_size = 1
+    while stack_size > 0:
+        stack_size -= 1
+        node = stack[stack_size]
+        counters[BVH_NODE_VISITS] += 1
+        if not is_box_hit(scene.mesh_node_bounds[node_base + node], ox, oy, oz, inv_x, inv_y, inv_z, min_t):
+            continue
+
+        count = scene.mesh_node_counts[node_base + node]
+        offset = scene.mesh_node_offsets[node_base + node]
+        if count > 0:
+            counters[INTERSECTION_TESTS] += count
+            for row in range(row_base + offset, row_base + offset + count):
+                ax, ay, az, e1x, e1y, e1z, e2x, e2y, e2z = mesh_triangle_corners(scene, row)
+                t, u, v = intersect_corners(ax, ay, az, e1x, e1y, e1z, e2x, e2y, e2z, ox, oy, oz, dx, dy, dz, min_t)
+                if t < min_t:
+                    min_t = t
+                    closest_u = u
+                    closest_v = v
+                    closest_triangle = triangle_base + row - row_base
+                    if any_hit:
+                        return min_t, closest_u, closest_v, closest_triangle
+        else:
+            axis = scene.mesh_node_axes[node_base + node]
+            direction = dx if axis == 0 else (dy if axis == 1 else dz)
+            if direction < 0.0:
+                stack[stack_size] = node + 1
+                stack[stack_size + 1] = offset
+            else:
+                stack[stack_size] = offset
+                stack[stack_size + 1] = node + 1
+            stack_size += 2
+
+    if closest_triangle < 0:
+        return math.inf, 0.0, 0.0, -1
+
+    return min_t, closest_u, closest_v, closest_triangle
+
+
+@jit
+def intersect_item(scene, item, ox, oy, oz, dx, dy, dz, t_max, any_hit, mesh_stack, counters):
+    """
+    @return (t, u, v, triangle) of the hit of the ray with an item, t is inf
+      without hit and triangle is -1 for spheres and planes. Mesh instances
+      intersect the ray in object space, see MeshInstance.
+    """
+
+    item_type = scene.item_types[item]
+    index = scene.item_indices[item]
+    if item_type == SPHERE:
+        return intersect_sphere(scene.spheres[index], ox, oy, oz, dx, dy, dz, t_max), 0.0, 0.0, -1
+    if item_type == PLANE:
+        return intersect_plane(scene.planes[index], ox, oy, oz, dx, dy, dz, t_max), 0.0, 0.0, -1
+    if item_type == TRIANGLE:
+        t, u, v = intersect_triangle(scene.triangles[index], ox, oy, oz, dx, dy, dz, t_max)
+        return t, u, v, index
+
+    if item_type == MESH:
+        return intersect_mesh(scene, index, ox, oy, oz, dx, dy, dz, t_max, any_hit, mesh_stack, counters)
+
+    m = scene.instance_inverses[index]
+    return intersect_mesh(scene, scene.instance_meshes[index],
+                          m[0] * ox + m[1] * oy + m[2] * oz + m[3],
+                          m[4] * ox + m[5] * oy + m[6] * oz + m[7],
+                          m[8] * ox + m[9] * oy + m[10] * oz + m[11],
+                          m[0] * dx + m[1] * dy + m[2] * dz,
+                          m[4] * dx + m[5] * dy + m[6] * dz,
+                          m[8] * dx + m[9] * dy + m[10] * dz,
+                          t_max, any_hit, mesh_stack, counters)
+
+
+@jit
+def intersect_scene(scene, ox, oy, oz, dx, dy, dz, t_max, any_hit, stack, mesh_stack, counters):
+    """
+    Closest hit of a ray with the items of the scene. An any-hit query ignores
+    items that do not cast shadows and stops at the first hit found, see
+    BVH.closest_hit and BVH.occluded.
+
+    @return (t, item, u, v, triangle), item is -1 without hit
+    """
+
+    min_t = t_max
+    closest_item = -1
+    closest_u = 0.0
+    closest_v = 0.0
+    closest_triangle = -1
+
+    for k in range(len(scene.unbounded_item_ids)):
+        item = scene.unbounded_item_ids[k]
+        counters[INTERSECTION_TESTS] += 1
+        if any_hit and not scene.casts_shadows[scene.item_materials[item]]:
+            continue
+
+        t, u, v, triangle = intersect_item(scene, item, ox, oy, oz, dx, dy, dz, min_t, any_hit, mesh_stack, counters)
+        if t < min_t:
+            min_t, closest_item, closest_u, closest_v, closest_triangle = t, item, u, v, triangle
+            if any_hit:
+                return min_t, closest_item, closest_u, closest_v, closest_triangle
+
+    if len(scene.node_counts) == 0:
+        return min_t, closest_item, closest_u, closest_v, closest_triangle
+
+    inv_x = inverse_component(dx)
+    inv_y = inverse_component(dy)
+    inv_z = inverse_component(dz)
+
+    stack[0] = 0
+    stack_size = 1
+    while stack_size > 0:
+        stack_size -= 1
+        node = stack[stack_size]
+        counters[BVH_NODE_VISITS] += 1
+        if not is_box_hit(scene.node_bounds[node], ox, oy, oz, inv_x, inv_y, inv_z, min_t):
+            continue
+
+        count = scene.node_counts[node]
+        offset = scene.node_offsets[node]
+        if count > 0:
+            counters[INTERSECTION_TESTS] += count
+            for idx in range(offset, offset + count):
+                item = scene.ordered_item_ids[idx]
+                if any_hit and not scene.casts_shadows[scene.item_materials[item]]:
+                    continue
+
+                t, u, v, triangle = intersect_item(scene, item, ox, oy, oz, dx, dy, dz, min_t, any_hit,
+                                                   mesh_stack, counters)
+                if t < min_t:
+                    min_t, closest_item, closest_u, closest_v, closest_triangle = t, item, u, v, triangle
+                    if any_hit:
+                        return min_t, closest_item, closest_u, closest_v, closest_triangle
+        else:
+            axis = scene.node_axes[node]
+            direction = dx if axis == 0 else (dy if axis == 1 else dz)
+            if direction < 0.0:
+                stack[stack_size] = node + 1
+                stack[stack_size + 1] = offset
+            else:
+                stack[stack_size] = offset
+                stack[stack_size + 1] = node + 1
+            stack_size += 2
+
+    return min_t, closest_item, closest_u, closest_v, closest_triangle
+
+
+@jit
+def normalized(x, y, z):
+    length = math.sqrt(x * x + y * y + z * z)
+    inv_length = 1.0 / length if length > 0.0 else math.nan
+    return x * inv_length, y * inv_length, z * inv_length
+
+
+@jit
+def triangle_normal(scene, triangle, u, v):
+    """
+    @return the face normal or the normalized interpolated vertex normal, see Triangle.compute_normal
+    """
+
+    if triangle >= len(scene.triangles):
+        return mesh_triangle_normal(scene, triangle - len(scene.triangles), u, v)
+
+    if not scene.has_vertex_normals[triangle]:
+        normal = scene.face_normals[triangle]
+        return normal[0], normal[1], normal[2]
+
+    normals = scene.vertex_normals[triangle]
+    w = 1 - u - v
+    return normalized(normals[0] * w + normals[3] * u + normals[6] * v,
+                      normals[1] * w + normals[4] * u + normals[7] * v,
+                      normals[2] * w + normals[5] * u + normals[8] * v)
+
+
+@jit
+def mesh_triangle_normal(scene, triangle, u, v):
+    """
+    @param triangle row of the triangle in mesh_indices
+    @return the face normal or the normalized interpolated vertex normal, see TriangleView.compute_normal
+    """
+
+    if not scene.mesh_has_normals[triangle]:
+        _, _, _, e1x, e1y, e1z, e2x, e2y, e2z = mesh_triangle_corners(scene, triangle)
+        return normalized(e1y * e2z - e1z * e2y, e1z * e2x - e1x * e2z, e1x * e2y - e1y * e2x)
+
+    corners = scene.mesh_indices[triangle]
+    na = scene.mesh_normals[corners[0]]
+    nb = scene.mesh_normals[corners[1]]
+    nc = scene.mesh_normals[corners[2]]
+    w = 1 - u - v
+    return normalized(np.float64(na[0]) * w + np.float64(nb[0]) * u + np.float64(nc[0]) * v,
+                      np.float64(na[1]) * w + np.float64(nb[1]) * u + np.float64(nc[1]) * v,
+                      np.float64(na[2]) * w + np.float64(nb[2]) * u + np.float64(nc[2]) * v)
+
+
+@jit
+def surface_normal(scene, item, triangle, px, py, pz, u, v):
+    """
+    @return the normalized surface normal at a hit, see the hit_record methods of the intersectables
+    """
+
+    item_type = scene.item_types[item]
+    index = scene.item_indices[item]
+    if item_type == SPHERE:
+        sphere = scene.spheres[index]
+        return normalized(px - sphere[0], py - sphere[1], pz - sphere[2])
+    if item_type == PLANE:
+        plane = scene.planes[index]
+        return plane[0], plane[1], plane[2]
+
+    nx, ny, nz = triangle_normal(scene, triangle, u, v)
+    if item_type != INSTANCE:
+        return nx, ny, nz
+
+    m = scene.instance_normal_matrices[index]
+    return normalized(m[0] * nx + m[1] * ny + m[2] * nz,
+                      m[3] * nx + m[4] * ny + m[5] * nz,
+                      m[6] * nx + m[7] * ny + m[8] * nz)
+
+
+@jit
+def grid_color(params, px, py, pz):
+    """
+    @return the line or tile color of a grid textured material at a hit position, see GridTexturedMaterial
+    """
+
+    inv_scale = 1.0 / params[13]
+    relative_thickness = params[12] / params[13]
+    x = abs((px + params[9]) * inv_scale - np.rint(px * inv_scale))
+    y = abs((py + params[10]) * inv_scale - np.rint(py * inv_scale))
+    z = abs((pz + params[11]) * inv_scale - np.rint(pz * inv_scale))
+    if x < relative_thickness or y < relative_thickness or z < relative_thickness:
+        return params[3], params[4], params[5]
+
+    return params[6], params[7], params[8]
+
+
+@jit
+def fresnel_factor(refraction_index, nx, ny, nz, wx, wy, wz):
+    """
+    @param refraction_index refraction index of the material
+    @param nx, ny, nz surface normal
+    @param wx, wy, wz normalized incident direction w_in of the hit
+    @return (r, sin_sq_theta_t, phase_velocity, cos_theta_i, sign) where sign flips
+      the normal to the side of the incident ray, see RefractiveMaterial.fresnel_factor
+    """
+
+    # direction of the incoming ray, normalized once more like in the scalar code
+    ix, iy, iz = -wx, -wy, -wz
+    length = math.sqrt(ix * ix + iy * iy + iz * iz)
+    inv_length = 1.0 / length if length > 0.0 else math.nan
+    ix, iy, iz = ix * inv_length, iy * inv_length, iz * inv_length
+
+    n1 = 1.0
+    n2 = refraction_index
+    sign = 1.0
+    if nx * wx + ny * wy + nz * wz <= 0.0:
+        n1 = refraction_index
+        n2 = 1.0
+        sign = -1.0
+
+    cos_theta_i = -(ix * (sign * nx) + iy * (sign * ny) + iz * (sign * nz))
+    phase_velocity = n1 / n2
+    sin_sq_theta_t = math.pow(phase_velocity, 2.0) * (1.0 - math.pow(cos_theta_i, 2.0))
+
+    if sin_sq_theta_t > 1.0:
+        return 1.0, sin_sq_theta_t, phase_velocity, cos_theta_i, sign
+
+    r0 = ((n1 - n2) / (n1 + n2)) ** 2.0
+    if n1 <= n2:
+        x = 1.0 - cos_theta_i
+    else:
+        x = 1.0 - math.sqrt(1.0 - sin_sq_theta_t)
+
+    return r0 + (1.0 - r0) * math.pow(x, 5.0), sin_sq_theta_t, phase_velocity, cos_theta_i, sign
+
+
+@jit
+def integrate_rays(scene, origins, directions, bounces, radiance, traced_rays, counters, primary_hits):
+    """
+    Whitted integration of a batch of rays, see WhittedIntegrator.integrate.
+    The recursion over specular bounces is replaced by a stack of pending rays
+    carrying the product of the specular BRDFs along their path.
+
+    @param scene CompiledScene
+    @param origins (N, 3) float array of ray origins
+    @param directions (N, 3) float array of ray directions
+    @param bounces (N,) int array, bounces already taken by the rays
+    @param radiance (N, 3) float array, receives the radiance of every ray
+    @param traced_rays (N,) int array, receives the number of rays traced for every ray
+    @param counters (len(KERNEL_COUNTERS),) int array, incremented by the work done
+    @param primary_hits (N, 6) float array, receives t, item, triangle and the normal of the
+      first hit of every ray and is left untouched for rays that miss the scene. An empty
+      (0, 6) array skips the recording.
+    """
+
+    stack = np.empty(len(scene.node_counts) + 1, dtype=np.int64)
+    mesh_stack = np.empty(max(scene.mesh_node_sizes.max() if len(scene.mesh_node_sizes) > 0 else 0, 1) + 1,
+                          dtype=np.int64)
+    # origin, direction, throughput weight and bounces of the pending rays
+    rays = np.empty((RAY_STACK_SIZE, 10))
+
+    for k in range(len(origins)):
+        rays[0, 0:3] = origins[k]
+        rays[0, 3:6] = directions[k]
+        rays[0, 6:9] = 1.0
+        rays[0, 9] = bounces[k]
+        ray_count = 1
+        is_primary = len(primary_hits) > 0
+
+        while ray_count > 0:
+            ray_count -= 1
+            ox, oy, oz = rays[ray_count, 0], rays[ray_count, 1], rays[ray_count, 2]
+            dx, dy, dz = rays[ray_count, 3], rays[ray_count, 4], rays[ray_count, 5]
+            weight_x, weight_y, weight_z = rays[ray_count, 6], rays[ray_count, 7], rays[ray_count, 8]
+            ray_bounces = rays[ray_count, 9]
+
+            traced_rays[k] += 1
+            t, item, u, v, triangle = intersect_scene(scene, ox, oy, oz, dx, dy, dz, math.inf, False,
+                                                      stack, mesh_stack, counters)
+            if item < 0:
+                continue
+
+            px = dx * t + ox
+            py = dy * t + oy
+            pz = dz * t + oz
+            nx, ny, nz = surface_normal(scene, item, triangle, px, py, pz, u, v)
+            if is_primary:
+                is_primary = False
+                primary_hits[k, 0] = t
+                primary_hits[k, 1] = item
+                primary_hits[k, 2] = triangle
+                primary_hits[k, 3] = nx
+                primary_hits[k, 4] = ny
+                primary_hits[k, 5] = nz
+
+            length = math.sqrt(dx * dx + dy * dy + dz * dz)
+            inv_length = -(1.0 / length if length > 0.0 else math.nan)
+            wx, wy, wz = dx * inv_length, dy * inv_length, dz * inv_length
+
+            material = scene.item_materials[item]
+            material_type = scene.material_types[material]
+            params = scene.material_params[material]
+
+            if material_type == REFLECTIVE or material_type == REFRACTIVE:
+                if ray_bounces >= MAX_BOUNCES:
+                    continue
+
+                reflection_brdf_x, reflection_brdf_y, reflection_brdf_z = params[0], params[1], params[2]
+                r, sin_sq_theta_t, phase_velocity, cos_theta_i, sign = 0.0, 0.0, 1.0, 0.0, 1.0
+                if material_type == REFRACTIVE:
+                    r, sin_sq_theta_t, phase_velocity, cos_theta_i, sign = fresnel_factor(
+                        params[3], nx, ny, nz, wx, wy, wz)
+                    reflection_brdf_x, reflection_brdf_y, reflection_brdf_z = r, r, r
+
+                # reflected ray
+                counters[MATERIAL_EVALUATIONS] += 1
+                counters[REFLECTION_RAYS] += 1
+                cos_theta = 2.0 * (nx * wx + ny * wy + nz * wz)
+                rx = cos_theta * nx - wx
+                ry = cos_theta * ny - wy
+                rz = cos_theta * nz - wz
+                rays[ray_count, 0] = rx * ESP + px
+                rays[ray_count, 1] = ry * ESP + py
+                rays[ray_count, 2] = rz * ESP + pz
+                rays[ray_count, 3] = rx
+                rays[ray_count, 4] = ry
+                rays[ray_count, 5] = rz
+                rays[ray_count, 6] = weight_x * reflection_brdf_x
+                rays[ray_count, 7] = weight_y * reflection_brdf_y
+                rays[ray_count, 8] = weight_z * reflection_brdf_z
+                rays[ray_count, 9] = ray_bounces + 1
+                ray_count += 1
+
+                if material_type != REFRACTIVE:
+                    continue
+
+                # refracted ray, none on total internal reflection
+                counters[MATERIAL_EVALUATIONS] += 1
+                if sin_sq_theta_t > 1.0:
+                    continue
+
+                counters[REFRACTION_RAYS] += 1
+                length = math.sqrt(wx * wx + wy * wy + wz * wz)
+                inv_length = 1.0 / length if length > 0.0 else math.nan
+                scale = phase_velocity * cos_theta_i - math.sqrt(1.0 - sin_sq_theta_t)
+                rx = -wx * inv_length * phase_velocity + scale * (sign * nx)
+                ry = -wy * inv_length * phase_velocity + scale * (sign * ny)
+                rz = -wz * inv_length * phase_velocity + scale * (sign * nz)
+                rays[ray_count, 0] = rx * ESP + px
+                rays[ray_count, 1] = ry * ESP + py
+                rays[ray_count, 2] = rz * ESP + pz
+                rays[ray_count, 3] = rx
+                rays[ray_count, 4] = ry
+                rays[ray_count, 5] = rz
+                rays[ray_count, 6] = weight_x * ((1.0 - r) * params[0])
+                rays[ray_count, 7] = weight_y * ((1.0 - r) * params[1])
+                rays[ray_count, 8] = weight_z * ((1.0 - r) * params[2])
+                rays[ray_count, 9] = ray_bounces + 1
+                ray_count += 1
+                continue
+
+            # direct illumination by all point lights, see WhittedIntegrator.contribution_of
+            for light in range(len(scene.lights)):
+                lx = scene.lights[light, 0] - px
+                ly = scene.lights[light, 1] - py
+                lz = scene.lights[light, 2] - pz
+                d2 = lx * lx + ly * ly + lz * lz
+
+                traced_rays[k] += 1
+                counters[SHADOW_RAYS] += 1
+                shadow_t, blocker, _, _, _ = intersect_scene(
+                    scene, lx * ESP + px, ly * ESP + py, lz * ESP + pz, lx, ly, lz, 1.0 - ESP, True,
+                    stack, mesh_stack, counters)
+                if blocker >= 0:
+                    continue
+
+                counters[MATERIAL_EVALUATIONS] += 1
+                if material_type == BLINN:
+                    cos_theta = lx * nx + ly * ny + lz * nz
+                    hx, hy, hz = lx + wx, ly + wy, lz + wz
+                    length = math.sqrt(hx * hx + hy * hy + hz * hz)
+                    inv_length = 1.0 / length if length > 0.0 else math.nan
+                    cos_theta_half = hx * inv_length * nx + hy * inv_length * ny + hz * inv_length * nz
+                    specular = math.pow(cos_theta_half, params[6])
+                    brdf_x = params[0] + params[0] * cos_theta + params[3] * specular
+                    brdf_y = params[1] + params[1] * cos_theta + params[4] * specular
+                    brdf_z = params[2] + params[2] * cos_theta + params[5] * specular
+                elif material_type == GRID:
+                    color_x, color_y, color_z = grid_color(params, px, py, pz)
+                    brdf_x = params[0] * color_x
+                    brdf_y = params[1] * color_y
+                    brdf_z = params[2] * color_z
+                else:
+                    brdf_x, brdf_y, brdf_z = params[0], params[1], params[2]
+
+                cos_theta = max(nx * lx + ny * ly + nz * lz, 0.0)
+                geometry = 1.0 / math.sqrt(d2)
+                radiance[k, 0] += weight_x * (brdf_x * geometry * scene.lights[light, 3] * cos_theta)
+                radiance[k, 1] += weight_y * (brdf_y * geometry * scene.lights[light, 4] * cos_theta)
+                radiance[k, 2] += weight_z * (brdf_z * geometry * scene.lights[light, 5] * cos_theta)
@@ -1,10 +1,12 @@
-import numpy as np
+import math
+import time
 
 from typing import TYPE_CHECKING
 
 from pytracer.integrators.integrator import Integrator
 from pytracer.ray import Ray
 from pytracer.math.vec3 import Vec3
+from pytracer.render_statistics import STATISTICS
 
 if TYPE_CHECKING:
     from pytracer import HitRecord, Scene
@@ -18,56 +20,77 @@ class WhittedIntegrator(Integrator):
     def __init__(self, scene: 'Scene'):
         self.scene = scene
 
-    def is_occluded(self, hit_position: Vec3, light_dir: Vec3, tolerance: float) -> bool:
+    def intersect(self, ray: Ray) -> 'HitRecord':
+        if not STATISTICS.enabled:
+            return self.scene.intersectable_list.intersect(ray)
+
+        start_time = time.perf_counter()
+        hit_record = self.scene.intersectable_list.intersect(ray)
+        STATISTICS.add_time("intersect", time.perf_counter() - start_time)
+        return hit_record
+
+    def is_occluded(self, hit_position: Vec3, light_dir: Vec3) -> bool:
+        """
+        @param hit_position the shaded point
+        @param light_dir unnormalized direction from the shaded point to the light source
+        @return true if a surface casting shadows lies between the point and the light source
+        """
+
         shadow_ray = Ray(
-            origin=Vec3.from_other(hit_position),
+            origin=hit_position,
             direction=light_dir
         )
-        shadow_hit = self.scene.intersectable_list.intersect(shadow_ray)
-
-        if not shadow_hit.is_valid():
-            return False
+        self.traced_rays += 1
 
-        dist_between_shadow_and_hit = shadow_hit.position - hit_position
-        has_shadow_hit = shadow_hit.material.does_cast_shadows() and (
-                dist_between_shadow_and_hit.dot(dist_between_shadow_and_hit) < tolerance)
+        # the light source is at t = 1 - Ray.ESP, since the origin of the shadow ray is perturbed along light_dir
+        if not STATISTICS.enabled:
+            return self.scene.intersectable_list.occluded(shadow_ray, 1.0 - Ray.ESP)
 
-        return has_shadow_hit
+        start_time = time.perf_counter()
+        is_occluded = self.scene.intersectable_list.occluded(shadow_ray, 1.0 - Ray.ESP)
+        STATISTICS.add_time("intersect", time.perf_counter() - start_time)
+        STATISTICS.count("shadow_rays")
+        return is_occluded
 
     def contribution_of(self, light_source: Vec3, hit_record: 'HitRecord') -> Vec3:
         light_hit = light_source.sample()
         light_direction = light_hit.position - hit_record.position
         d2 = light_direction.dot(light_direction)
 
-        if self.is_occluded(hit_record.position, light_direction, d2):
+        if self.is_occluded(hit_record.position, light_direction):
             return Vec3.zero()
 
         brdf = hit_record.material.evaluate_brdf(hit_record, hit_record.w_in, light_direction)
+        if STATISTICS.enabled:
+            STATISTICS.count("material_evaluations")
         light_emission = light_hit.material.evaluate_emission(light_hit, -light_direction)
 
         angle = 1.0
-        if np.linalg.norm(light_hit.normal) > 0:
+        if light_hit.normal.dotted() > 0:
             angle = light_hit.normal.dot(light_direction)
 
-        cos_theta_light = np.max([angle, 0])
+        cos_theta_light = max(angle, 0.0)
 
         cos_theta = hit_record.normal.dot(light_direction)
-        cos_theta = np.max([cos_theta, 0])
+        cos_theta = max(cos_theta, 0.0)
 
         # Multiply together factors relevant for shading, that is, brdf * light_emission * cos_theta_light * geometry term
-        contribution = (1.0 / np.sqrt(d2)) * brdf * light_emission * cos_theta_light * cos_theta
+        contribution = (1.0 / math.sqrt(d2)) * brdf * light_emission * cos_theta_light * cos_theta
 
         return contribution
 
     def integrate(self, ray: Ray) -> Vec3:
         MAX_BOUNCES = 5
 
-        hit_record = self.scene.intersectable_list.intersect(ray)
+        self.traced_rays += 1
+        hit_record = self.intersect(ray)
+        if ray.bounces == 0:
+            self.primary_hit_record = hit_record
 
         if not hit_record.is_valid():
             return Vec3.zero()
 
-        emission = hit_record.material.evaluate_emission(hit_record, hit_record.w_in[:3])
+        emission = hit_record.material.evaluate_emission(hit_record, hit_record.w_in)
         if emission is None:
             return emission
 
@@ -76,27 +99,33 @@ class WhittedIntegrator(Integrator):
 
         if hit_record.material.has_specular_reflection() and ray.bounces < MAX_BOUNCES:
             sample = hit_record.material.evaluate_specular_reflection(hit_record)
+            if STATISTICS.enabled:
+                STATISTICS.count("material_evaluations")
+                STATISTICS.count("reflection_rays", sample.is_valid)
             if sample.is_valid:
-                reflection_contribution = np.copy(sample.brdf)
+                reflection_contribution = sample.brdf
                 reflected_ray = Ray(
-                    origin=np.copy(hit_record.position),
+                    origin=hit_record.position,
                     direction=sample.w,
                     bounces=ray.bounces + 1
                 )
                 spec = self.integrate(reflected_ray)
-                reflection_contribution *= spec
+                reflection_contribution = reflection_contribution * spec
 
         if hit_record.material.has_specular_refraction() and ray.bounces < MAX_BOUNCES:
             sample = hit_record.material.evaluate_specular_refraction(hit_record)
+            if STATISTICS.enabled:
+                STATISTICS.count("material_evaluations")
+                STATISTICS.count("refraction_rays", sample.is_valid)
             if sample.is_valid:
-                refraction_contribution = np.copy(sample.brdf)
+                refraction_contribution = sample.brdf
                 refracted_ray = Ray(
-                    origin=np.copy(hit_record.position),
+                    origin=hit_record.position,
                     direction=sample.w,
                     bounces=ray.bounces + 1
                 )
                 spec = self.integrate(refracted_ray)
-                refraction_contribution *= spec
+                refraction_contribution = refraction_contribution * spec
 
         if hit_record.material.has_specular_reflection() or hit_record.material.has_specular_refraction():
             return reflection_contribution + refraction_contribution
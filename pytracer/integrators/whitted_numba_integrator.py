@@ -0,0 +1,135 @@
+import logging
+import time
+
+import numpy as np
+
+from typing import TYPE_CHECKING
+
+from pytracer.hit_batch import HitBatch
+from pytracer.integrators import numba_kernels
+from pytracer.integrators.whitted_integrator import WhittedIntegrator
+from pytracer.math.vec3 import Vec3
+from pytracer.ray import Ray
+from pytracer.ray_batch import RayBatch
+from pytracer.render_statistics import STATISTICS
+
+if TYPE_CHECKING:
+    from pytracer import Scene
+
+
+class WhittedNumbaIntegrator(WhittedIntegrator):
+    """
+    The WhittedIntegrator compiled with numba, see numba_kernels. A batch of
+    rays is integrated by a single call into the compiled code, which follows
+    every ray and its specular bounces one after another.
+
+    The scene is flattened into arrays on the first batch, i.e. once per render
+    worker. Scenes with intersectables, materials or light sources the kernels
+    do not support are rendered by the WhittedIntegrator instead.
+
+    The compiled code cannot be timed per stage, all of its time counts as
+    shade time, see RenderStatistics.
+    """
+
+    def __init__(self, scene: 'Scene'):
+        super().__init__(scene)
+        self.compiled_scene = None
+        self.is_supported = True
+
+    def __getstate__(self) -> dict:
+        # the compiled scene duplicates the arrays of the scene, every process flattens its own copy
+        state = self.__dict__.copy()
+        state["compiled_scene"] = None
+        return state
+
+    def integrate(self, ray: Ray) -> Vec3:
+        if not self.is_supported:
+            return super().integrate(ray)
+
+        rays = RayBatch(
+            origins=np.array([ray.origin], dtype=np.float64),
+            directions=np.array([ray.direction], dtype=np.float64),
+            pixel_indices=np.zeros(1, dtype=np.int64),
+            bounces=np.array([ray.bounces], dtype=np.int32)
+        )
+        return Vec3.from_array(self.integrate_batch(rays)[0])
+
+    def compile_scene(self) -> None:
+        try:
+            self.compiled_scene = numba_kernels.compile_scene(self.scene)
+        except NotImplementedError as error:
+            logging.warning(f"{error}, falling back to the numpy backend")
+            self.is_supported = False
+
+    def integrate_batch(self, rays: RayBatch, costs: np.ndarray = None, aovs: np.ndarray = None) -> np.ndarray:
+        """
+        The rays are integrated by one call into the compiled code, therefore the
+        seconds of the batch are split among its rays in proportion to the number
+        of rays traced for them.
+        """
+
+        if self.compiled_scene is None and self.is_supported:
+            self.compile_scene()
+        if not self.is_supported:
+            return super().integrate_batch(rays, costs, aovs)
+
+        start_time = time.perf_counter()
+        radiance = np.zeros((len(rays), 3))
+        traced_rays = np.zeros(len(rays), dtype=np.int64)
+        counters = np.zeros(len(numba_kernels.KERNEL_COUNTERS), dtype=np.int64)
+        primary_hits = np.full((len(rays) if aovs is not None else 0, 6), -1.0)
+        numba_kernels.integrate_rays(
+            self.compiled_scene,
+            np.ascontiguousarray(rays.origins, dtype=np.float64),
+            np.ascontiguousarray(rays.directions, dtype=np.float64),
+            np.ascontiguousarray(rays.bounces, dtype=np.int64),
+            radiance,
+            traced_rays,
+            counters,
+            primary_hits
+        )
+        self.traced_rays += int(traced_rays.sum())
+
+        if STATISTICS.enabled:
+            for name, count in zip(numba_kernels.KERNEL_COUNTERS, counters.tolist()):
+                STATISTICS.count(name, count)
+
+        if costs is not None:
+            costs[:, 0] = (time.perf_counter() - start_time) * traced_rays / max(traced_rays.sum(), 1.0)
+            costs[:, 1] = traced_rays
+        if aovs is not None:
+            aovs[...] = self.primary_aovs(rays, primary_hits)
+
+        return radiance
+
+    def primary_aovs(self, rays: RayBatch, primary_hits: np.ndarray) -> np.ndarray:
+        """
+        @param primary_hits the primary hits recorded by numba_kernels.integrate_rays
+        @return the AOVs of the rays, see Integrator.integrate_batch
+        """
+
+        item_ids = primary_hits[:, 1].astype(np.int64)
+        is_hit = item_ids >= 0
+        item_ids = item_ids[is_hit]
+        t = primary_hits[is_hit, 0]
+        triangles = primary_hits[is_hit, 2].astype(np.int64)
+        directions = rays.directions[is_hit]
+
+        # the triangles of meshes become the face ids of their mesh, see Mesh.intersect_batch
+        compiled_scene = self.compiled_scene
+        item_types = compiled_scene.item_types[item_ids]
+        is_mesh = (item_types == numba_kernels.MESH) | (item_types == numba_kernels.INSTANCE)
+        primitive_ids = np.zeros(len(item_ids), dtype=np.int64)
+        primitive_ids[is_mesh] = compiled_scene.mesh_face_ids[triangles[is_mesh] - len(compiled_scene.triangles)]
+
+        aov_table = self.make_aov_table()
+        hits = HitBatch(
+            t=t,
+            positions=t[:, None] * directions + rays.origins[is_hit],
+            normals=primary_hits[is_hit, 3:6],
+            w_in=-directions / np.linalg.norm(directions, axis=1, keepdims=True),
+            material_ids=aov_table.item_material_ids[item_ids],
+            primitive_ids=primitive_ids,
+            item_ids=item_ids
+        )
+        return aov_table.samples(rays, is_hit, hits)
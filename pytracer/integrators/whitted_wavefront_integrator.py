@@ -0,0 +1,330 @@
+import time
+
+import numpy as np
+
+from typing import TYPE_CHECKING
+
+from pytracer.hit_batch import HitBatch
+from pytracer.integrators.whitted_integrator import WhittedIntegrator
+from pytracer.math.vec3 import Vec3
+from pytracer.ray import Ray
+from pytracer.ray_batch import RayBatch
+from pytracer.render_statistics import STATISTICS
+
+if TYPE_CHECKING:
+    from pytracer import Scene
+
+
+class WhittedWavefrontIntegrator(WhittedIntegrator):
+    """
+    Wavefront formulation of the WhittedIntegrator. Instead of following one
+    ray after another recursively, every stage processes a whole batch of rays:
+
+      1. generate: the camera rays of a render task (see Camera.make_worldspace_rays)
+      2. intersect: closest hits of all active rays, rays without hit are dropped
+      3. shade: direct illumination of all non-specular hits, which spawns one
+         shadow ray per hit and light source
+      4. occlusion: closest hits of all shadow rays
+      5. spawn: reflected and refracted rays of all specular hits, which become
+         the active rays of the next bounce
+
+    The recursion of WhittedIntegrator.integrate is replaced by a per-ray
+    throughput weight: a secondary ray carries the product of the specular
+    BRDFs along its path and adds its contribution directly to the radiance of
+    the primary ray it originates from.
+    """
+
+    MAX_BOUNCES = 5
+
+    # material slots per word of the path bitsets, see integrate_paths
+    WORD_BITS = 64
+
+    def __init__(self, scene: 'Scene'):
+        super().__init__(scene)
+        self.materials = None
+
+    def integrate(self, ray: Ray) -> Vec3:
+        rays = RayBatch(
+            origins=np.array([ray.origin], dtype=np.float64),
+            directions=np.array([ray.direction], dtype=np.float64),
+            pixel_indices=np.zeros(1, dtype=np.int64),
+            bounces=np.array([ray.bounces], dtype=np.int32)
+        )
+        return Vec3.from_array(self.integrate_batch(rays)[0])
+
+    def build_material_table(self) -> None:
+        """
+        Number the materials of all scene objects such that hits can refer to
+        their material by an index and material properties can be looked up
+        for many hits at once.
+        """
+
+        self.materials = []
+        material_ids = {}
+        item_material_ids = []
+        for item in self.scene.intersectable_list.container:
+            if id(item.material) not in material_ids:
+                material_ids[id(item.material)] = len(self.materials)
+                self.materials.append(item.material)
+            item_material_ids.append(material_ids[id(item.material)])
+
+        self.item_material_ids = np.array(item_material_ids, dtype=np.int64)
+        self.has_specular_reflection = np.array([m.has_specular_reflection() for m in self.materials], dtype=bool)
+        self.has_specular_refraction = np.array([m.has_specular_refraction() for m in self.materials], dtype=bool)
+        self.material_words = max(-(-len(self.materials) // self.WORD_BITS), 1)
+
+    def integrate_batch(self, rays: RayBatch, costs: np.ndarray = None, aovs: np.ndarray = None) -> np.ndarray:
+        """
+        The stages process all rays at once, therefore the seconds of the batch
+        are split among its rays in proportion to the number of rays traced for them.
+        """
+
+        radiance, primary_hits, _ = self.integrate_paths(rays, costs)
+        if aovs is not None:
+            aovs[...] = self.make_aov_table().samples(rays, *primary_hits)
+
+        return radiance
+
+    def integrate_paths(self, rays: RayBatch, costs: np.ndarray = None, primary_hits: tuple = None,
+                        record_paths: bool = False) -> tuple:
+        """
+        integrate_batch for deferred shading, see GBuffer: the primary hits can be
+        passed in instead of being intersected, and the materials hit along the
+        path of every ray can be recorded.
+
+        @param rays batch of rays
+        @param costs see integrate_batch
+        @param primary_hits (is_hit, hits) of the rays as returned by intersect_stage.
+          The rays are intersected by default.
+        @param record_paths collect the material slots of all hits along the path of every ray
+        @return (radiance, primary_hits, path_materials) the (N, 3) radiance of the rays,
+          their (is_hit, hits) and, if recorded, (N, material_words) uint64 bitsets in which
+          bit m is set if the path of a ray hit material m of the material table, None otherwise.
+        """
+
+        if self.materials is None:
+            self.build_material_table()
+
+        start_time = time.perf_counter()
+        radiance = np.zeros((len(rays), 3))
+        owners = np.arange(len(rays))
+        weights = np.ones((len(rays), 3))
+        traced_rays = np.zeros(len(rays))
+        path_materials = np.zeros((len(rays), self.material_words), dtype=np.uint64) if record_paths else None
+
+        bounce_hits = primary_hits
+        while len(rays) > 0:
+            if bounce_hits is None:
+                if costs is not None:
+                    traced_rays += np.bincount(owners, minlength=len(traced_rays))
+                bounce_hits = self.intersect_stage(rays)
+
+            is_hit, hits = bounce_hits
+            if primary_hits is None:
+                primary_hits = bounce_hits
+            bounce_hits = None
+
+            rays = rays.select(is_hit)
+            owners = owners[is_hit]
+            weights = weights[is_hit]
+            if path_materials is not None:
+                bits = np.left_shift(np.uint64(1), (hits.material_ids % self.WORD_BITS).astype(np.uint64))
+                np.bitwise_or.at(path_materials, (owners, hits.material_ids // self.WORD_BITS), bits)
+
+            is_specular = (self.has_specular_reflection[hits.material_ids]
+                           | self.has_specular_refraction[hits.material_ids])
+
+            is_diffuse = ~is_specular
+            direct = self.shade_stage(hits.select(is_diffuse))
+            np.add.at(radiance, owners[is_diffuse], weights[is_diffuse] * direct)
+            if costs is not None:
+                # one shadow ray per diffuse hit and light source
+                traced_rays += len(self.scene.light_sources) * np.bincount(owners[is_diffuse], minlength=len(traced_rays))
+
+            rays, owners, weights = self.spawn_stage(
+                rays.select(is_specular),
+                hits.select(is_specular),
+                owners[is_specular],
+                weights[is_specular]
+            )
+
+        if costs is not None:
+            costs[:, 0] = (time.perf_counter() - start_time) * traced_rays / max(traced_rays.sum(), 1.0)
+            costs[:, 1] = traced_rays
+
+        return radiance, primary_hits, path_materials
+
+    def intersect_stage(self, rays: RayBatch) -> tuple:
+        """
+        @param rays active rays
+        @return (is_hit, hits) where is_hit is a boolean mask over the rays and
+          hits is the compacted HitBatch of the rays that hit something.
+        """
+
+        start_time = time.perf_counter()
+        t, u, v, primitive_ids, item_ids = self.scene.intersectable_list.intersect_batch_items(rays)
+        if STATISTICS.enabled:
+            STATISTICS.add_time("intersect", time.perf_counter() - start_time)
+
+        is_hit = item_ids >= 0
+
+        t = t[is_hit]
+        u = u[is_hit]
+        v = v[is_hit]
+        primitive_ids = primitive_ids[is_hit]
+        item_ids = item_ids[is_hit]
+        directions = rays.directions[is_hit]
+        positions = t[:, None] * directions + rays.origins[is_hit]
+
+        normals = np.zeros_like(positions)
+        container = self.scene.intersectable_list.container
+        for item_id in np.unique(item_ids):
+            mask = item_ids == item_id
+            normals[mask] = container[item_id].surface_normals_batch(
+                positions[mask], u[mask], v[mask], primitive_ids[mask]
+            )
+
+        w_in = -directions / np.linalg.norm(directions, axis=1, keepdims=True)
+
+        hits = HitBatch(
+            t=t,
+            positions=positions,
+            normals=normals,
+            w_in=w_in,
+            material_ids=self.item_material_ids[item_ids],
+            primitive_ids=primitive_ids,
+            item_ids=item_ids
+        )
+        return is_hit, hits
+
+    def shade_stage(self, hits: HitBatch) -> np.ndarray:
+        """
+        Direct illumination of non-specular hits by all light sources, see
+        WhittedIntegrator.contribution_of. The emission of a light source is
+        evaluated once per batch, which is exact for point lights since their
+        emission does not depend on the direction.
+
+        @param hits hits on non-specular surfaces
+        @return (n, 3) reflected radiance of every hit
+        """
+
+        contribution = np.zeros((len(hits), 3))
+        if len(hits) == 0 or len(self.scene.light_sources) == 0:
+            return contribution
+
+        light_hits = [light_source.sample() for light_source in self.scene.light_sources]
+        light_directions = np.stack([np.asarray(light_hit.position) - hits.positions for light_hit in light_hits])
+        d2 = np.sum(light_directions * light_directions, axis=2)
+
+        light_count = len(light_hits)
+        is_occluded = self.occlusion_stage(
+            np.tile(hits.positions, (light_count, 1)),
+            light_directions.reshape((-1, 3))
+        ).reshape((light_count, -1))
+
+        for light_idx, light_hit in enumerate(light_hits):
+            light_direction = light_directions[light_idx]
+
+            brdf = np.zeros((len(hits), 3))
+            for material_id in np.unique(hits.material_ids):
+                mask = hits.material_ids == material_id
+                brdf[mask] = self.materials[material_id].evaluate_brdf_batch(
+                    hits.select(mask), hits.w_in[mask], light_direction[mask]
+                )
+
+            if STATISTICS.enabled:
+                STATISTICS.count("material_evaluations", len(hits))
+
+            light_emission = np.asarray(light_hit.material.evaluate_emission(light_hit, Vec3.zero()))
+
+            cos_theta_light = np.ones(len(hits))
+            if np.linalg.norm(light_hit.normal) > 0:
+                cos_theta_light = np.maximum(light_direction.dot(np.asarray(light_hit.normal)), 0)
+
+            cos_theta = np.maximum(np.sum(hits.normals * light_direction, axis=1), 0)
+
+            current_contribution = ((1.0 / np.sqrt(d2[light_idx]))[:, None] * brdf * light_emission
+                                    * cos_theta_light[:, None] * cos_theta[:, None])
+            contribution += np.where(is_occluded[light_idx][:, None], 0.0, current_contribution)
+
+        return contribution
+
+    def occlusion_stage(self, positions: np.ndarray, light_directions: np.ndarray) -> np.ndarray:
+        """
+        Batched WhittedIntegrator.is_occluded.
+
+        @param positions (n, 3) hit positions the shadow rays start from
+        @param light_directions (n, 3) unnormalized directions towards the light sources
+        @return (n,) boolean, true for shadow rays that are blocked
+        """
+
+        shadow_rays = RayBatch(
+            origins=Ray.ESP * light_directions + positions,
+            directions=light_directions,
+            pixel_indices=np.zeros(len(positions), dtype=np.int64)
+        )
+        max_t = np.full(len(positions), 1.0 - Ray.ESP)
+
+        start_time = time.perf_counter()
+        is_occluded = self.scene.intersectable_list.occluded_batch(shadow_rays, max_t)
+        if STATISTICS.enabled:
+            STATISTICS.add_time("intersect", time.perf_counter() - start_time)
+            STATISTICS.count("shadow_rays", len(shadow_rays))
+
+        return is_occluded
+
+    def spawn_stage(self, rays: RayBatch, hits: HitBatch, owners: np.ndarray, weights: np.ndarray) -> tuple:
+        """
+        Spawn the reflected and refracted rays of specular hits.
+
+        @return (rays, owners, weights) of the next bounce
+        """
+
+        can_bounce = rays.bounces < self.MAX_BOUNCES
+        rays = rays.select(can_bounce)
+        hits = hits.select(can_bounce)
+        owners = owners[can_bounce]
+        weights = weights[can_bounce]
+
+        next_rays = []
+        next_owners = []
+        next_weights = []
+        for material_id in np.unique(hits.material_ids):
+            mask = hits.material_ids == material_id
+            material = self.materials[material_id]
+            material_hits = hits.select(mask)
+
+            samples = []
+            if material.has_specular_reflection():
+                samples.append(("reflection_rays", material.evaluate_specular_reflection_batch(material_hits)))
+            if material.has_specular_refraction():
+                samples.append(("refraction_rays", material.evaluate_specular_refraction_batch(material_hits)))
+
+            for ray_kind, sample in samples:
+                is_valid = sample.is_valid
+                if STATISTICS.enabled:
+                    STATISTICS.count("material_evaluations", len(material_hits))
+                    STATISTICS.count(ray_kind, np.count_nonzero(is_valid))
+                directions = sample.w[is_valid]
+                next_rays.append(RayBatch(
+                    origins=Ray.ESP * directions + material_hits.positions[is_valid],
+                    directions=directions,
+                    pixel_indices=rays.pixel_indices[mask][is_valid],
+                    bounces=rays.bounces[mask][is_valid] + 1
+                ))
+                next_owners.append(owners[mask][is_valid])
+                next_weights.append(weights[mask][is_valid] * sample.brdf[is_valid])
+
+        if len(next_rays) == 0:
+            return RayBatch.make_empty(), np.zeros(0, dtype=np.int64), np.zeros((0, 3))
+
+        return (
+            RayBatch(
+                origins=np.concatenate([batch.origins for batch in next_rays]),
+                directions=np.concatenate([batch.directions for batch in next_rays]),
+                pixel_indices=np.concatenate([batch.pixel_indices for batch in next_rays]),
+                bounces=np.concatenate([batch.bounces for batch in next_rays])
+            ),
+            np.concatenate(next_owners),
+            np.concatenate(next_weights)
+        )
@@ -0,0 +1,54 @@
+from typing import Optional
+
+from pytracer.math.vec3 import Vec3
+
+
+class BoundingBox:
+    """
+    Axis aligned bounding box spanned by a min and a max corner.
+    """
+
+    def __init__(self, min_corner: Vec3, max_corner: Vec3):
+        """
+        @param min_corner corner with the smallest x, y and z coordinates
+        @param max_corner corner with the largest x, y and z coordinates
+        """
+
+        self.min_corner = min_corner
+        self.max_corner = max_corner
+
+    @classmethod
+    def from_points(cls, *points: Vec3) -> 'BoundingBox':
+        min_corner = Vec3.from_other(points[0])
+        max_corner = Vec3.from_other(points[0])
+        for point in points[1:]:
+            min_corner = Vec3(*[min(a, b) for a, b in zip(min_corner, point)])
+            max_corner = Vec3(*[max(a, b) for a, b in zip(max_corner, point)])
+
+        return BoundingBox(min_corner, max_corner)
+
+    @classmethod
+    def union_of(cls, boxes: list) -> Optional['BoundingBox']:
+        """
+        @param boxes list of bounding boxes, None entries denote unbounded objects
+        @return the box enclosing all given boxes or None if one of them is unbounded.
+        """
+
+        if len(boxes) == 0 or any(box is None for box in boxes):
+            return None
+
+        result = boxes[0]
+        for box in boxes[1:]:
+            result = result.union(box)
+
+        return result
+
+    def union(self, other: 'BoundingBox') -> 'BoundingBox':
+        return BoundingBox.from_points(self.min_corner, self.max_corner, other.min_corner, other.max_corner)
+
+    def centroid(self) -> Vec3:
+        return Vec3.from_other(0.5 * (self.min_corner + self.max_corner))
+
+    def surface_area(self) -> float:
+        dx, dy, dz = self.max_corner - self.min_corner
+        return 2.0 * (dx * dy + dy * dz + dz * dx)
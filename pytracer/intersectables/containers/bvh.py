@@ -0,0 +1,594 @@
+import math
+
+import numpy as np
+
+from typing import Optional, TYPE_CHECKING
+
+from pytracer.intersectables.bounding_box import BoundingBox
+from pytracer.intersectables.containers.intersectable_list import IntersectableList
+from pytracer.math.vec3 import Vec3
+from pytracer.ray import Ray
+from pytracer.render_statistics import STATISTICS
+
+if TYPE_CHECKING:
+    from pytracer.ray_batch import RayBatch
+
+
+class BVH(IntersectableList):
+    """
+    Bounding volume hierarchy built with the surface area heuristic (SAH).
+
+    The BVH is a drop-in replacement for an IntersectableList: items are appended
+    as usual and the hierarchy is (re-)built by calling build() or lazily on the
+    first intersection query. Items without a finite bounding box (e.g. planes)
+    are kept on a separate list and are tested against every ray.
+
+    The hierarchy is stored in flattened, depth-first order:
+      + node_bounds (n, 2, 3) min and max corner of every node
+      + node_offsets (n,) for leaves the index of the first item in
+        ordered_items, for interior nodes the index of the second child. The
+        first child of an interior node is always stored right after the node.
+      + node_counts (n,) number of items in a leaf, 0 for interior nodes
+      + node_axes (n,) split axis of interior nodes, used to visit children front to back
+
+    https://www.pbr-book.org/3ed-2018/Primitives_and_Intersection_Acceleration/Bounding_Volume_Hierarchies
+    """
+
+    BIN_COUNT = 12
+    MAX_LEAF_SIZE = 4
+    TRAVERSAL_COST = 0.125
+    MAX_T = 10_000_000_000
+
+    def __init__(self):
+        super().__init__()
+        self.ordered_items = []
+        self.unbounded_items = []
+        self.ordered_item_ids = np.zeros(0, dtype=np.int64)
+        self.unbounded_item_ids = np.zeros(0, dtype=np.int64)
+        self.node_bounds = np.zeros((0, 2, 3))
+        self.node_offsets = np.zeros(0, dtype=np.int64)
+        self.node_counts = np.zeros(0, dtype=np.int64)
+        self.node_axes = np.zeros(0, dtype=np.int64)
+        self._boxes = None
+        self.is_built = False
+
+    def append(self, item):
+        super().append(item)
+        self.is_built = False
+
+    def bounding_box(self) -> Optional[BoundingBox]:
+        if not self.is_built:
+            self.build()
+
+        if len(self.unbounded_items) > 0 or len(self.node_bounds) == 0:
+            return None
+
+        return BoundingBox(Vec3(*self.node_bounds[0, 0]), Vec3(*self.node_bounds[0, 1]))
+
+    def build(self) -> None:
+        bounded_items = []
+        bounded_item_ids = []
+        boxes = []
+        self.unbounded_items = []
+        unbounded_item_ids = []
+        for item_id, item in enumerate(self.container):
+            box = item.bounding_box()
+            if box is None:
+                self.unbounded_items.append(item)
+                unbounded_item_ids.append(item_id)
+            else:
+                bounded_items.append(item)
+                bounded_item_ids.append(item_id)
+                boxes.append([box.min_corner, box.max_corner])
+
+        order = self.build_hierarchy(np.array(boxes, dtype=np.float64).reshape((-1, 2, 3)))
+
+        self.ordered_items = [bounded_items[idx] for idx in order.tolist()]
+        self.ordered_item_ids = np.array(bounded_item_ids, dtype=np.int64)[order]
+        self.unbounded_item_ids = np.array(unbounded_item_ids, dtype=np.int64)
+        self.prepare_traversal()
+        self.is_built = True
+
+    def build_hierarchy(self, item_bounds: np.ndarray) -> np.ndarray:
+        """
+        Build the nodes of the hierarchy over the bounded items.
+
+        @param item_bounds (n, 2, 3) min and max corner of every bounded item
+        @return (n,) int64 array, the items in the order of the leaves, see ordered_items
+        """
+
+        centroids = 0.5 * (item_bounds[:, 0] + item_bounds[:, 1])
+
+        nodes = []
+        order = []
+        if len(item_bounds) > 0:
+            self.build_node(np.arange(len(item_bounds)), item_bounds, centroids, nodes, order)
+
+        self.node_bounds = np.array([node[0] for node in nodes], dtype=np.float64).reshape((-1, 2, 3))
+        self.node_offsets = np.array([node[1] for node in nodes], dtype=np.int64)
+        self.node_counts = np.array([node[2] for node in nodes], dtype=np.int64)
+        self.node_axes = np.array([node[3] for node in nodes], dtype=np.int64)
+
+        # leaves are stored depth-first like their items, a leaf starts after the items of all previous leaves
+        is_leaf = self.node_counts > 0
+        self.node_offsets[is_leaf] = np.cumsum(self.node_counts[is_leaf]) - self.node_counts[is_leaf]
+        return np.concatenate(order).astype(np.int64) if order else np.zeros(0, dtype=np.int64)
+
+    def arrays(self) -> dict:
+        """
+        @return the flattened hierarchy by name, see BVH.restore
+        """
+
+        if not self.is_built:
+            self.build()
+
+        return {
+            "node_bounds": self.node_bounds,
+            "node_offsets": self.node_offsets,
+            "node_counts": self.node_counts,
+            "node_axes": self.node_axes,
+            "ordered_item_ids": self.ordered_item_ids,
+            "unbounded_item_ids": self.unbounded_item_ids
+        }
+
+    def restore(self, arrays: dict) -> None:
+        """
+        Use a hierarchy previously built for the same items instead of building it again.
+
+        @param arrays the flattened hierarchy as returned by BVH.arrays
+        """
+
+        self.node_bounds = arrays["node_bounds"]
+        self.node_offsets = arrays["node_offsets"]
+        self.node_counts = arrays["node_counts"]
+        self.node_axes = arrays["node_axes"]
+        self.ordered_item_ids = arrays["ordered_item_ids"]
+        self.unbounded_item_ids = arrays["unbounded_item_ids"]
+
+        if self.container is not None:
+            self.ordered_items = [self.container[idx] for idx in self.ordered_item_ids.tolist()]
+            self.unbounded_items = [self.container[idx] for idx in self.unbounded_item_ids.tolist()]
+
+        self._boxes = None
+        self.is_built = True
+
+    def __getstate__(self) -> dict:
+        # the traversal lists are rebuilt on demand from the node arrays, which
+        # pickle a lot more compactly.
+        state = self.__dict__.copy()
+        for key in ("_boxes", "_item_ids", "_unbounded_ids", "_offsets", "_counts", "_axes"):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._boxes = None
+
+    def prepare_traversal(self) -> None:
+        """
+        Traversal runs per ray in plain python, where indexing lists of floats is
+        a lot cheaper than indexing numpy arrays.
+        """
+
+        self._boxes = [tuple(box) for box in self.node_bounds.reshape((-1, 6)).tolist()]
+        self._item_ids = self.ordered_item_ids.tolist()
+        self._unbounded_ids = self.unbounded_item_ids.tolist()
+        self._offsets = self.node_offsets.tolist()
+        self._counts = self.node_counts.tolist()
+        self._axes = self.node_axes.tolist()
+
+    def build_node(self, indices: np.ndarray, item_bounds: np.ndarray, centroids: np.ndarray,
+                   nodes: list, order: list) -> None:
+        """
+        Append the node of the given items and its subtree to nodes, depth-first, and the
+        items of its leaves to order. The offsets of leaves are filled in by build_hierarchy.
+        """
+
+        bounds = item_bounds[indices]
+        node_box = np.stack([bounds[:, 0].min(axis=0), bounds[:, 1].max(axis=0)])
+        node_idx = len(nodes)
+
+        split = self.find_split(indices, bounds, centroids[indices], node_box)
+        if split is None:
+            nodes.append((node_box, 0, len(indices), 0))
+            order.append(indices)
+            return
+
+        axis, left_indices, right_indices = split
+        nodes.append(None)
+        self.build_node(left_indices, item_bounds, centroids, nodes, order)
+        second_child_idx = len(nodes)
+        self.build_node(right_indices, item_bounds, centroids, nodes, order)
+        nodes[node_idx] = (node_box, second_child_idx, 0, axis)
+
+    def find_split(self, indices: np.ndarray, bounds: np.ndarray, centroids: np.ndarray, node_box: np.ndarray):
+        """
+        Evaluate the SAH cost of BIN_COUNT - 1 candidate planes along every axis
+        and return the cheapest split as (axis, left_indices, right_indices), or
+        None if a leaf is cheaper than any split.
+        """
+
+        count = len(indices)
+        if count <= 1:
+            return None
+
+        centroid_min = centroids.min(axis=0)
+        centroid_extent = centroids.max(axis=0) - centroid_min
+        if centroid_extent.max() <= 0.0:
+            return None
+
+        bins = self.BIN_COUNT
+        scale = np.where(centroid_extent > 0.0, bins / np.maximum(centroid_extent, 1e-300), 0.0)
+        bin_ids = np.minimum(((centroids - centroid_min) * scale).astype(np.int64), bins - 1)
+
+        # bin statistics of all three axes at once, each of shape (3, bins, ...)
+        axis_ids = np.broadcast_to(np.arange(3), bin_ids.shape)
+        bin_counts = np.zeros((3, bins), dtype=np.int64)
+        bin_min = np.full((3, bins, 3), np.inf)
+        bin_max = np.full((3, bins, 3), -np.inf)
+        np.add.at(bin_counts, (axis_ids, bin_ids), 1)
+        np.minimum.at(bin_min, (axis_ids, bin_ids), bounds[:, None, 0])
+        np.maximum.at(bin_max, (axis_ids, bin_ids), bounds[:, None, 1])
+
+        left_counts = np.cumsum(bin_counts, axis=1)[:, :-1]
+        right_counts = count - left_counts
+        left_areas = self.surface_areas(np.minimum.accumulate(bin_min, axis=1)[:, :-1],
+                                        np.maximum.accumulate(bin_max, axis=1)[:, :-1])
+        right_areas = self.surface_areas(np.minimum.accumulate(bin_min[:, ::-1], axis=1)[:, ::-1][:, 1:],
+                                         np.maximum.accumulate(bin_max[:, ::-1], axis=1)[:, ::-1][:, 1:])
+
+        costs = left_counts * left_areas + right_counts * right_areas
+        costs[(left_counts == 0) | (right_counts == 0)] = np.inf
+        best_axis, best_bin = np.unravel_index(np.argmin(costs), costs.shape)
+        best_cost = costs[best_axis, best_bin]
+        if not np.isfinite(best_cost):
+            return None
+
+        node_area = self.surface_areas(node_box[0], node_box[1])
+        split_cost = self.TRAVERSAL_COST + best_cost / max(node_area, 1e-300)
+        if count <= self.MAX_LEAF_SIZE and split_cost >= count:
+            return None
+
+        goes_left = bin_ids[:, best_axis] <= best_bin
+        return int(best_axis), indices[goes_left], indices[~goes_left]
+
+    @staticmethod
+    def surface_areas(min_corners: np.ndarray, max_corners: np.ndarray) -> np.ndarray:
+        extent = np.maximum(max_corners - min_corners, 0.0)
+        dx, dy, dz = extent[..., 0], extent[..., 1], extent[..., 2]
+        return 2.0 * (dx * dy + dy * dz + dz * dx)
+
+    @staticmethod
+    def inverse_direction(direction: list) -> tuple:
+        # a huge value instead of infinity avoids 0 * inf = nan in the slab test
+        return tuple(1.0 / d if d != 0.0 else 1e32 for d in direction)
+
+    def candidate_pairs(self, origins: np.ndarray, directions: np.ndarray, max_t: np.ndarray = None) -> tuple:
+        """
+        Traverse the hierarchy with many rays at once. Every iteration tests all
+        pending (ray, node) pairs against their boxes with a few numpy operations
+        and then replaces interior nodes by their children, so the number of
+        iterations is bounded by the depth of the tree.
+
+        @param origins (N, 3) float array of ray origins
+        @param directions (N, 3) float array of ray directions
+        @param max_t optional (N,) float array, boxes entered after max_t are skipped
+        @return (ray_ids, item_ids) int arrays, one entry for every ray and every
+          item in ordered_items stored in a leaf whose box is hit by the ray.
+        """
+
+        if not self.is_built:
+            self.build()
+
+        empty = np.zeros(0, dtype=np.int64)
+        if len(self.node_counts) == 0 or len(origins) == 0:
+            return empty, empty
+
+        if max_t is None:
+            max_t = np.full(len(origins), self.MAX_T)
+
+        safe_directions = np.where(directions != 0.0, directions, 1.0)
+        inv_directions = np.where(directions != 0.0, 1.0 / safe_directions, 1e32)
+
+        ray_ids = np.arange(len(origins))
+        node_ids = np.zeros(len(origins), dtype=np.int64)
+        found_rays = []
+        found_items = []
+        node_visits = 0
+        while len(ray_ids) > 0:
+            node_visits += len(ray_ids)
+            boxes = self.node_bounds[node_ids]
+            ray_origins = origins[ray_ids]
+            ray_inv_directions = inv_directions[ray_ids]
+            t0 = (boxes[:, 0] - ray_origins) * ray_inv_directions
+            t1 = (boxes[:, 1] - ray_origins) * ray_inv_directions
+            t_near = np.minimum(t0, t1).max(axis=1)
+            t_far = np.maximum(t0, t1).min(axis=1)
+
+            is_hit = (t_near <= t_far) & (t_far >= 0.0) & (t_near <= max_t[ray_ids])
+            ray_ids = ray_ids[is_hit]
+            node_ids = node_ids[is_hit]
+
+            counts = self.node_counts[node_ids]
+            is_leaf = counts > 0
+
+            leaf_counts = counts[is_leaf]
+            leaf_starts = np.cumsum(leaf_counts) - leaf_counts
+            positions = np.arange(leaf_counts.sum()) - np.repeat(leaf_starts, leaf_counts)
+            found_rays.append(np.repeat(ray_ids[is_leaf], leaf_counts))
+            found_items.append(np.repeat(self.node_offsets[node_ids[is_leaf]], leaf_counts) + positions)
+
+            inner_rays = ray_ids[~is_leaf]
+            inner_nodes = node_ids[~is_leaf]
+            ray_ids = np.concatenate([inner_rays, inner_rays])
+            node_ids = np.concatenate([inner_nodes + 1, self.node_offsets[inner_nodes]])
+
+        if STATISTICS.enabled:
+            STATISTICS.count("bvh_node_visits", node_visits)
+        return np.concatenate(found_rays), np.concatenate(found_items)
+
+    def intersect_batch_items(self, rays: 'RayBatch', max_t: np.ndarray = None) -> tuple:
+        """
+        Find the closest item hit by every ray of a batch. Every item is queried
+        once with all rays whose path crosses one of its leaves.
+
+        @param rays batch of rays
+        @param max_t optional (N,) float array, only hits with 0 < t < max_t are reported
+        @return tuple (t, u, v, primitive_ids, item_ids) of (N,) arrays. item_ids
+          index the container and are -1 for rays without hit, the other arrays
+          are as returned by the intersect_batch method of the hit item.
+        """
+
+        if not self.is_built:
+            self.build()
+
+        ray_count = len(rays)
+        t_hit = np.full(ray_count, np.inf) if max_t is None else np.array(max_t, dtype=np.float64)
+        u_hit = np.zeros(ray_count)
+        v_hit = np.zeros(ray_count)
+        primitive_ids = np.full(ray_count, -1, dtype=np.int64)
+        item_ids = np.full(ray_count, -1, dtype=np.int64)
+
+        def merge(ray_ids: np.ndarray, item_id: int, hits: tuple):
+            t, u, v, primitive_id = hits
+            is_closer = t < t_hit[ray_ids]
+            closer_ids = ray_ids[is_closer]
+            t_hit[closer_ids] = t[is_closer]
+            u_hit[closer_ids] = u[is_closer]
+            v_hit[closer_ids] = v[is_closer]
+            primitive_ids[closer_ids] = primitive_id[is_closer]
+            item_ids[closer_ids] = item_id
+
+        all_rays = np.arange(ray_count)
+        for item, item_id in zip(self.unbounded_items, self.unbounded_item_ids):
+            merge(all_rays, item_id, item.intersect_batch(rays, t_hit.copy()))
+
+        ray_ids, ordered_ids = self.candidate_pairs(rays.origins, rays.directions, t_hit)
+        if STATISTICS.enabled:
+            STATISTICS.count("intersection_tests", ray_count * len(self.unbounded_items) + len(ray_ids))
+
+        order = np.argsort(ordered_ids, kind="stable")
+        ray_ids = ray_ids[order]
+        ordered_ids = ordered_ids[order]
+        unique_ids, starts = np.unique(ordered_ids, return_index=True)
+        ends = np.append(starts[1:], len(ordered_ids))
+        for ordered_id, start, end in zip(unique_ids, starts, ends):
+            item_rays = ray_ids[start:end]
+            hits = self.ordered_items[ordered_id].intersect_batch(rays.select(item_rays), t_hit[item_rays])
+            merge(item_rays, self.ordered_item_ids[ordered_id], hits)
+
+        t_hit[item_ids < 0] = np.inf
+        return t_hit, u_hit, v_hit, primitive_ids, item_ids
+
+    def closest_hit(self, ray: Ray, t_max: float = math.inf) -> Optional[tuple]:
+        """
+        Visit the nodes front to back and skip every node whose box is entered
+        after the closest hit found so far.
+
+        @param ray the ray used for intersection testing
+        @param t_max only hits with 0 < t < t_max are reported
+        @return (t, primitive_id, u, v) or None, see IntersectableList.closest_hit
+        """
+
+        if not self.is_built:
+            self.build()
+        if self._boxes is None:
+            self.prepare_traversal()
+
+        min_t = t_max
+        closest_hit = None
+        closest_item_id = -1
+        for intersectable, item_id in zip(self.unbounded_items, self._unbounded_ids):
+            hit = intersectable.closest_hit(ray, min_t)
+            if hit is not None:
+                min_t = hit[0]
+                closest_hit = hit
+                closest_item_id = item_id
+
+        if len(self._boxes) == 0:
+            self.count_traversal(0, len(self.unbounded_items))
+            return None if closest_hit is None else self.item_hit(closest_item_id, closest_hit)
+
+        ox, oy, oz = ray.origin.tolist()
+        inv_x, inv_y, inv_z = self.inverse_direction(ray.direction.tolist())
+        is_negative = (inv_x < 0.0, inv_y < 0.0, inv_z < 0.0)
+
+        boxes = self._boxes
+        offsets = self._offsets
+        counts = self._counts
+        axes = self._axes
+        items = self.ordered_items
+        item_ids = self._item_ids
+
+        node_visits = 0
+        tests = len(self.unbounded_items)
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            node_visits += 1
+            min_x, min_y, min_z, max_x, max_y, max_z = boxes[node]
+
+            t0 = (min_x - ox) * inv_x
+            t1 = (max_x - ox) * inv_x
+            t_near, t_far = (t0, t1) if t0 < t1 else (t1, t0)
+
+            t0 = (min_y - oy) * inv_y
+            t1 = (max_y - oy) * inv_y
+            if t0 > t1:
+                t0, t1 = t1, t0
+            if t0 > t_near:
+                t_near = t0
+            if t1 < t_far:
+                t_far = t1
+
+            t0 = (min_z - oz) * inv_z
+            t1 = (max_z - oz) * inv_z
+            if t0 > t1:
+                t0, t1 = t1, t0
+            if t0 > t_near:
+                t_near = t0
+            if t1 < t_far:
+                t_far = t1
+
+            if t_near > t_far or t_far < 0.0 or t_near > min_t:
+                continue
+
+            count = counts[node]
+            if count > 0:
+                tests += count
+                offset = offsets[node]
+                for idx in range(offset, offset + count):
+                    hit = items[idx].closest_hit(ray, min_t)
+                    if hit is not None:
+                        min_t = hit[0]
+                        closest_hit = hit
+                        closest_item_id = item_ids[idx]
+            elif is_negative[axes[node]]:
+                stack.append(node + 1)
+                stack.append(offsets[node])
+            else:
+                stack.append(offsets[node])
+                stack.append(node + 1)
+
+        self.count_traversal(node_visits, tests)
+        if closest_hit is None:
+            return None
+
+        return self.item_hit(closest_item_id, closest_hit)
+
+    def occluded(self, ray: Ray, t_max: float) -> bool:
+        """
+        Visit the nodes entered before t_max until the first item that occludes
+        the ray is found, see Intersectable.occluded.
+        """
+
+        if not self.is_built:
+            self.build()
+        if self._boxes is None:
+            self.prepare_traversal()
+
+        for idx, intersectable in enumerate(self.unbounded_items):
+            if intersectable.occluded(ray, t_max):
+                self.count_traversal(0, idx + 1)
+                return True
+
+        if len(self._boxes) == 0:
+            self.count_traversal(0, len(self.unbounded_items))
+            return False
+
+        ox, oy, oz = ray.origin.tolist()
+        inv_x, inv_y, inv_z = self.inverse_direction(ray.direction.tolist())
+
+        boxes = self._boxes
+        offsets = self._offsets
+        counts = self._counts
+        items = self.ordered_items
+
+        node_visits = 0
+        tests = len(self.unbounded_items)
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            node_visits += 1
+            min_x, min_y, min_z, max_x, max_y, max_z = boxes[node]
+
+            t0 = (min_x - ox) * inv_x
+            t1 = (max_x - ox) * inv_x
+            t_near, t_far = (t0, t1) if t0 < t1 else (t1, t0)
+
+            t0 = (min_y - oy) * inv_y
+            t1 = (max_y - oy) * inv_y
+            if t0 > t1:
+                t0, t1 = t1, t0
+            if t0 > t_near:
+                t_near = t0
+            if t1 < t_far:
+                t_far = t1
+
+            t0 = (min_z - oz) * inv_z
+            t1 = (max_z - oz) * inv_z
+            if t0 > t1:
+                t0, t1 = t1, t0
+            if t0 > t_near:
+                t_near = t0
+            if t1 < t_far:
+                t_far = t1
+
+            if t_near > t_far or t_far < 0.0 or t_near > t_max:
+                continue
+
+            count = counts[node]
+            if count > 0:
+                offset = offsets[node]
+                for idx in range(offset, offset + count):
+                    if items[idx].occluded(ray, t_max):
+                        self.count_traversal(node_visits, tests + idx - offset + 1)
+                        return True
+
+                tests += count
+            else:
+                stack.append(offsets[node])
+                stack.append(node + 1)
+
+        self.count_traversal(node_visits, tests)
+        return False
+
+    @staticmethod
+    def count_traversal(node_visits: int, intersection_tests: int) -> None:
+        if STATISTICS.enabled:
+            STATISTICS.count("bvh_node_visits", node_visits)
+            STATISTICS.count("intersection_tests", intersection_tests)
+
+    def occluded_batch(self, rays: 'RayBatch', max_t: np.ndarray) -> np.ndarray:
+        """
+        Every item is queried once with all rays that cross one of its leaves
+        and are not known to be occluded yet.
+        """
+
+        is_occluded = np.zeros(len(rays), dtype=bool)
+        for item in self.unbounded_items:
+            is_occluded |= item.occluded_batch(rays, max_t)
+
+        if STATISTICS.enabled:
+            STATISTICS.count("intersection_tests", len(rays) * len(self.unbounded_items))
+
+        open_rays = np.flatnonzero(~is_occluded)
+        ray_ids, ordered_ids = self.candidate_pairs(rays.origins[open_rays], rays.directions[open_rays],
+                                                    max_t[open_rays])
+        ray_ids = open_rays[ray_ids]
+
+        order = np.argsort(ordered_ids, kind="stable")
+        ray_ids = ray_ids[order]
+        ordered_ids = ordered_ids[order]
+        unique_ids, starts = np.unique(ordered_ids, return_index=True)
+        ends = np.append(starts[1:], len(ordered_ids))
+        for ordered_id, start, end in zip(unique_ids, starts, ends):
+            item_rays = ray_ids[start:end]
+            item_rays = item_rays[~is_occluded[item_rays]]
+            if STATISTICS.enabled:
+                STATISTICS.count("intersection_tests", len(item_rays))
+            if len(item_rays) > 0:
+                item = self.ordered_items[ordered_id]
+                is_occluded[item_rays] |= item.occluded_batch(rays.select(item_rays), max_t[item_rays])
+
+        return is_occluded
@@ -1,37 +1,89 @@
+import math
+
+import numpy as np
+
+from typing import Optional, TYPE_CHECKING
+
 from pytracer.hit_record import HitRecord
+from pytracer.intersectables.bounding_box import BoundingBox
 from pytracer.intersectables.intersectable import Intersectable
 from pytracer.ray import Ray
+from pytracer.render_statistics import STATISTICS
+
+if TYPE_CHECKING:
+    from pytracer.ray_batch import RayBatch
 
 
 class IntersectableList(Intersectable):
     def __init__(self):
         self.container = []
 
-    def intersect(self, ray: Ray) -> HitRecord:
+    def closest_hit(self, ray: Ray, t_max: float = math.inf) -> Optional[tuple]:
         """
-        Implement ray-surface intersection in this method. Implementations of this
-        method need to make and return a {@link HitRecord} correctly, following
-        the conventions assumed for {@link HitRecord}.
+        Every item is only asked for hits closer than the closest hit found so far.
 
         @param ray the ray used for intersection testing
-        @return a hit record, should return an invalid hit record if there is no
-          intersection
+        @param t_max only hits with 0 < t < t_max are reported
+        @return (t, (item_id, item_primitive_id), u, v) or None, where item_id
+          indexes the container and the rest is the hit of this item.
         """
-        min_t = 10_000_000_000
 
-        hit_record = HitRecord.make_empty()
-        for intersectable in self.container:
-            current_hit_record = intersectable.intersect(ray)
-            if not current_hit_record.is_valid():
-                continue
+        if STATISTICS.enabled:
+            STATISTICS.count("intersection_tests", len(self.container))
+
+        closest_hit = None
+        closest_item_id = -1
+        for item_id, intersectable in enumerate(self.container):
+            hit = intersectable.closest_hit(ray, t_max)
+            if hit is not None:
+                t_max = hit[0]
+                closest_hit = hit
+                closest_item_id = item_id
+
+        if closest_hit is None:
+            return None
+
+        return self.item_hit(closest_item_id, closest_hit)
+
+    def item_hit(self, item_id: int, hit: tuple) -> tuple:
+        """
+        @return the hit of an item as a hit of this list
+        """
 
-            current_t = current_hit_record.t
-            if min_t > current_t > 0.0:
-                min_t = current_t
-                hit_record = HitRecord.make_from_other(current_hit_record)
+        t, primitive_id, u, v = hit
+        return t, (item_id, primitive_id), u, v
 
+    def hit_record(self, ray: Ray, t: float, primitive_id, u: float, v: float) -> HitRecord:
+        item_id, item_primitive_id = primitive_id
+        hit_record = self.container[item_id].hit_record(ray, t, item_primitive_id, u, v)
+        hit_record.item_id = item_id
+        hit_record.primitive_id = item_primitive_id
         return hit_record
 
+    def occluded(self, ray: Ray, t_max: float) -> bool:
+        for item_id, intersectable in enumerate(self.container):
+            if intersectable.occluded(ray, t_max):
+                if STATISTICS.enabled:
+                    STATISTICS.count("intersection_tests", item_id + 1)
+                return True
+
+        if STATISTICS.enabled:
+            STATISTICS.count("intersection_tests", len(self.container))
+        return False
+
+    def occluded_batch(self, rays: 'RayBatch', max_t: np.ndarray) -> np.ndarray:
+        if STATISTICS.enabled:
+            STATISTICS.count("intersection_tests", len(rays) * len(self.container))
+
+        is_occluded = np.zeros(len(rays), dtype=bool)
+        for intersectable in self.container:
+            is_occluded |= intersectable.occluded_batch(rays, max_t)
+
+        return is_occluded
+
+    def bounding_box(self) -> Optional[BoundingBox]:
+        return BoundingBox.union_of([intersectable.bounding_box() for intersectable in self.container])
+
     def append(self, item: Intersectable):
         self.container.append(item)
 
@@ -1,37 +1,213 @@
-from pytracer.intersectables.containers.intersectable_list import IntersectableList
-from pytracer.intersectables.geometries.triangle import MeshTriangle, Triangle
+import math
+
+import numpy as np
+
+from pytracer.intersectables.containers.bvh import BVH
+from pytracer.intersectables.geometries.triangle import TriangleView
+from pytracer.intersectables.geometries.triangle_buffer import TriangleBuffer
+from pytracer.intersectables.intersectable import Intersectable
 from pytracer.intersectables.obj_reader import ObjReader
+from pytracer.render_statistics import STATISTICS
 
-from typing import TYPE_CHECKING
+from typing import Optional, TYPE_CHECKING
 
 if TYPE_CHECKING:
-    from pytracer import Material
+    from pytracer import HitRecord, Material
+    from pytracer.ray import Ray
+    from pytracer.ray_batch import RayBatch
+
+
+class MeshTriangles:
+    """
+    The triangles of a mesh in hierarchy order, see BVH.ordered_items. Every
+    access creates a TriangleView of the triangle buffer, such that the per-ray
+    traversal needs no object per face.
+    """
+
+    def __init__(self, mesh: 'Mesh'):
+        self.mesh = mesh
 
+    def __len__(self) -> int:
+        return len(self.mesh.triangle_buffer)
+
+    def __getitem__(self, idx: int) -> TriangleView:
+        return TriangleView(self.mesh.material, self.mesh.triangle_buffer, idx, int(self.mesh.ordered_item_ids[idx]))
+
+
+class Mesh(BVH):
+    """
+    Triangle mesh read from an OBJ file. The triangles are only stored in the
+    TriangleBuffer, as welded vertices and indices in hierarchy order, such that
+    every leaf covers a contiguous range of the buffer. The per-ray code works
+    on TriangleViews created while traversing, see MeshTriangles.
+    """
 
-class Mesh(IntersectableList):
     def __init__(self, material: 'Material', filepath: str, use_face_normals=False):
         super().__init__()
+        self.material = material
+        self.container = None
+        self.face_rows = None
 
         mesh = ObjReader.read(filepath)
 
-        for face_idx, face in enumerate(mesh.faces):
-            id_x, id_y, id_z = face[0], face[1], face[2]
-            vx = mesh.vertices[id_x - 1]
-            vy = mesh.vertices[id_y - 1]
-            vz = mesh.vertices[id_z - 1]
+        has_normals = len(mesh.normals) > 0 and use_face_normals and (mesh.normal_faces >= 0).all()
+        if has_normals:
+            self.triangle_buffer = TriangleBuffer(*TriangleBuffer.weld(mesh.vertices, mesh.faces,
+                                                                       mesh.normals, mesh.normal_faces))
+        else:
+            self.triangle_buffer = TriangleBuffer(*TriangleBuffer.weld(mesh.vertices, mesh.faces))
+
+        self.build()
+
+    @classmethod
+    def from_arrays(cls, material: 'Material', arrays: dict) -> 'Mesh':
+        """
+        @param material the material of the mesh
+        @param arrays the hierarchy and triangle buffer of a mesh as returned by Mesh.arrays
+        @return the mesh without reading its OBJ file or building its hierarchy
+        """
+
+        mesh = cls.__new__(cls)
+        BVH.__init__(mesh)
+        mesh.material = material
+        mesh.container = None
+        mesh.face_rows = None
+        mesh.restore(arrays)
+        mesh.ordered_items = None
+        mesh.triangle_buffer = TriangleBuffer.from_arrays(
+            {name[len("triangles."):]: array for name, array in arrays.items() if name.startswith("triangles.")}
+        )
+        return mesh
+
+    def arrays(self) -> dict:
+        arrays = super().arrays()
+        arrays.update({f"triangles.{name}": array for name, array in self.triangle_buffer.arrays().items()})
+        return arrays
+
+    @property
+    def nbytes(self) -> int:
+        """
+        @return the memory of the triangles and the hierarchy of the mesh in bytes
+        """
+
+        return sum(array.nbytes for array in self.arrays().values())
+
+    def build(self) -> None:
+        """
+        Build the hierarchy over the triangles of the buffer and store them in
+        hierarchy order. The face ids of the rows of the buffer are kept in
+        ordered_item_ids.
+        """
+
+        order = self.build_hierarchy(self.triangle_buffer.bounds())
+        if len(self.ordered_item_ids) == len(order):
+            # the buffer is already in the order of a previous build
+            self.ordered_item_ids = self.ordered_item_ids[order]
+        else:
+            self.ordered_item_ids = order
+
+        self.triangle_buffer = self.triangle_buffer.permuted(order)
+        self.ordered_items = None
+        self.face_rows = None
+        self._boxes = None
+        self.is_built = True
+
+    def __getstate__(self) -> dict:
+        # the triangle views and the rows of the faces are created on demand, see materialize_triangles.
+        state = super().__getstate__()
+        state["ordered_items"] = None
+        state["face_rows"] = None
+        return state
+
+    def materialize_triangles(self) -> None:
+        """
+        Prepare the per-ray traversal: the triangles of the leaves are views of
+        the triangle buffer, see MeshTriangles, and the hit records of faces are
+        created from the rows of the buffer.
+        """
+
+        self.ordered_items = MeshTriangles(self)
+        self.face_rows = np.empty(len(self.ordered_item_ids), dtype=np.int64)
+        self.face_rows[self.ordered_item_ids] = np.arange(len(self.ordered_item_ids))
+
+    def closest_hit(self, ray: 'Ray', t_max: float = math.inf) -> Optional[tuple]:
+        """
+        @return (t, face_id, u, v) of the closest triangle or None, see Intersectable.closest_hit
+        """
+
+        if self.ordered_items is None:
+            self.materialize_triangles()
+
+        return super().closest_hit(ray, t_max)
+
+    def occluded(self, ray: 'Ray', t_max: float) -> bool:
+        if not self.material.does_cast_shadows():
+            return False
+
+        if self.ordered_items is None:
+            self.materialize_triangles()
+
+        return super().occluded(ray, t_max)
+
+    def item_hit(self, item_id: int, hit: tuple) -> tuple:
+        # the primitive id of a triangle is its face id
+        return hit
+
+    def hit_record(self, ray: 'Ray', t: float, primitive_id, u: float, v: float) -> 'HitRecord':
+        if self.ordered_items is None:
+            self.materialize_triangles()
+
+        return self.ordered_items[int(self.face_rows[primitive_id])].hit_record(ray, t, primitive_id, u, v)
+
+    def rows_of(self, face_ids: np.ndarray) -> np.ndarray:
+        """
+        @param face_ids (N,) int array of faces of the mesh
+        @return (N,) rows of the faces in the triangle buffer
+        """
+
+        if self.face_rows is None:
+            self.materialize_triangles()
+
+        return self.face_rows[face_ids]
+
+    def intersect_batch(self, rays: 'RayBatch', max_t: np.ndarray = None) -> tuple:
+        """
+        Find the closest triangle hit by every ray of a batch. The BVH yields the
+        candidate (ray, triangle) pairs, which are then intersected all at once.
+
+        @param rays batch of rays
+        @param max_t optional (N,) float array, only hits with 0 < t < max_t are reported
+        @return tuple (t, u, v, primitive_ids) of (N,) arrays. primitive_ids are the
+          face ids of the hit triangles like in closest_hit, they are -1 and t is
+          inf for rays that do not hit the mesh.
+        """
+
+        ray_count = len(rays)
+        t_hit = np.full(ray_count, np.inf)
+        u_hit = np.zeros(ray_count)
+        v_hit = np.zeros(ray_count)
+        primitive_ids = np.full(ray_count, -1, dtype=np.int64)
+
+        ray_ids, triangle_ids = self.candidate_pairs(rays.origins, rays.directions, max_t)
+        if STATISTICS.enabled:
+            STATISTICS.count("intersection_tests", len(ray_ids))
 
-            if len(mesh.normals) > 0 and use_face_normals:
-                normal_face = mesh.normal_faces[face_idx]
+        t, u, v = self.triangle_buffer.intersect_pairs(rays.origins[ray_ids], rays.directions[ray_ids], triangle_ids)
+        if max_t is not None:
+            t = np.where(t < max_t[ray_ids], t, np.inf)
 
-                id_nx, id_ny, id_nz = normal_face[0], normal_face[1], normal_face[2]
+        np.minimum.at(t_hit, ray_ids, t)
+        is_closest = np.isfinite(t) & (t == t_hit[ray_ids])
+        u_hit[ray_ids[is_closest]] = u[is_closest]
+        v_hit[ray_ids[is_closest]] = v[is_closest]
+        primitive_ids[ray_ids[is_closest]] = self.ordered_item_ids[triangle_ids[is_closest]]
 
-                nx = mesh.normals[id_nx - 1]
-                ny = mesh.normals[id_ny - 1]
-                nz = mesh.normals[id_nz - 1]
+        return t_hit, u_hit, v_hit, primitive_ids
 
-                triangle = MeshTriangle(material, vx, vy, vz, nx, ny, nz, face_idx)
-                self.container.append(triangle)
+    def occluded_batch(self, rays: 'RayBatch', max_t: np.ndarray) -> np.ndarray:
+        # all triangles at once through intersect_batch instead of triangle by triangle like a BVH
+        return Intersectable.occluded_batch(self, rays, max_t)
 
-            else:
-                triangle = Triangle(material, vx, vy, vz, face_idx)
-                self.container.append(triangle)
+    def surface_normals_batch(self, positions: np.ndarray, u: np.ndarray, v: np.ndarray,
+                              primitive_ids: np.ndarray) -> np.ndarray:
+        return self.triangle_buffer.normals_at(self.rows_of(primitive_ids), u, v)
@@ -0,0 +1,127 @@
+import math
+
+import numpy as np
+
+from pytracer.intersectables.bounding_box import BoundingBox
+from pytracer.intersectables.containers.mesh import Mesh
+from pytracer.intersectables.intersectable import Intersectable
+from pytracer.math.vec3 import Vec3
+from pytracer.ray import Ray
+from pytracer.ray_batch import RayBatch
+
+from typing import Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pytracer import HitRecord, Material
+
+
+class MeshInstance(Intersectable):
+    """
+    A mesh placed into the scene by an affine transform. All instances of a mesh
+    share its triangles and hierarchy, an instance only stores its transform and
+    material. The memory of a scene therefore grows with its unique meshes, not
+    with the number of instances.
+
+    Rays are transformed into the object space of the mesh for intersection.
+    Their directions are not normalized after the transform, such that the ray
+    parameter t of a hit is the same in object and in world space.
+    """
+
+    def __init__(self, mesh: Mesh, transform=None, material: 'Material' = None):
+        """
+        @param mesh the shared mesh, in object space
+        @param transform (4, 4) float array mapping a point p of object space to
+          M @ (p, 1) in world space. The identity by default.
+        @param material overrides the material of the mesh
+        """
+
+        self.mesh = mesh
+        self.material = material if material is not None else mesh.material
+        self.transform = np.identity(4) if transform is None else np.asarray(transform, dtype=np.float64).reshape((4, 4))
+        self.inverse_transform = np.linalg.inv(self.transform)
+        # normals are transformed by the inverse transpose of the linear part
+        self.normal_matrix = np.ascontiguousarray(self.inverse_transform[:3, :3].T)
+
+        # rows of the inverse transform and of the normal matrix as floats for the per-ray code
+        self._inverse = tuple(self.inverse_transform[:3].ravel().tolist())
+        self._normal_matrix = tuple(self.normal_matrix.ravel().tolist())
+
+    def bounding_box(self) -> Optional[BoundingBox]:
+        box = self.mesh.bounding_box()
+        if box is None:
+            return None
+
+        corners = np.array([[x, y, z, 1.0]
+                            for x in (box.min_corner.x, box.max_corner.x)
+                            for y in (box.min_corner.y, box.max_corner.y)
+                            for z in (box.min_corner.z, box.max_corner.z)])
+        corners = corners @ self.transform[:3].T
+        return BoundingBox(Vec3(*corners.min(axis=0)), Vec3(*corners.max(axis=0)))
+
+    def to_object_ray(self, ray: Ray) -> Ray:
+        m = self._inverse
+        ox, oy, oz = ray.origin.tolist()
+        dx, dy, dz = ray.direction.tolist()
+        return Ray(
+            origin=Vec3(m[0] * ox + m[1] * oy + m[2] * oz + m[3],
+                        m[4] * ox + m[5] * oy + m[6] * oz + m[7],
+                        m[8] * ox + m[9] * oy + m[10] * oz + m[11]),
+            direction=Vec3(m[0] * dx + m[1] * dy + m[2] * dz,
+                           m[4] * dx + m[5] * dy + m[6] * dz,
+                           m[8] * dx + m[9] * dy + m[10] * dz),
+            i=ray.i,
+            j=ray.j,
+            perturbate=False,
+            bounces=ray.bounces
+        )
+
+    def to_world_normal(self, normal: Vec3) -> Vec3:
+        m = self._normal_matrix
+        return Vec3(m[0] * normal.x + m[1] * normal.y + m[2] * normal.z,
+                    m[3] * normal.x + m[4] * normal.y + m[5] * normal.z,
+                    m[6] * normal.x + m[7] * normal.y + m[8] * normal.z).normalized()
+
+    def closest_hit(self, ray: Ray, t_max: float = math.inf) -> Optional[tuple]:
+        """
+        @return (t, face_id, u, v) of the closest triangle or None, see Mesh.closest_hit
+        """
+
+        return self.mesh.closest_hit(self.to_object_ray(ray), t_max)
+
+    def occluded(self, ray: Ray, t_max: float) -> bool:
+        if not self.material.does_cast_shadows():
+            return False
+
+        object_ray = self.to_object_ray(ray)
+        if self.mesh.material.does_cast_shadows():
+            return self.mesh.occluded(object_ray, t_max)
+
+        # the triangles of the shared mesh do not occlude by themselves, their material is overridden
+        return self.mesh.closest_hit(object_ray, t_max) is not None
+
+    def hit_record(self, ray: Ray, t: float, primitive_id, u: float, v: float) -> 'HitRecord':
+        hit_record = self.mesh.hit_record(self.to_object_ray(ray), t, primitive_id, u, v)
+        hit_record.position = ray.point_at(t)
+        hit_record.normal = self.to_world_normal(hit_record.normal)
+        hit_record.w_in = ray.direction.incident_direction()
+        hit_record.material = self.material
+        hit_record.intersectable = self
+        return hit_record
+
+    def to_object_points(self, points: np.ndarray) -> np.ndarray:
+        return points @ self.inverse_transform[:3, :3].T + self.inverse_transform[:3, 3]
+
+    def intersect_batch(self, rays: RayBatch, max_t: np.ndarray = None) -> tuple:
+        object_rays = RayBatch(
+            origins=self.to_object_points(rays.origins),
+            directions=rays.directions @ self.inverse_transform[:3, :3].T,
+            pixel_indices=rays.pixel_indices,
+            bounces=rays.bounces
+        )
+        return self.mesh.intersect_batch(object_rays, max_t)
+
+    def surface_normals_batch(self, positions: np.ndarray, u: np.ndarray, v: np.ndarray,
+                              primitive_ids: np.ndarray) -> np.ndarray:
+        normals = self.mesh.surface_normals_batch(self.to_object_points(positions), u, v, primitive_ids)
+        normals = normals @ self.normal_matrix.T
+        return normals / np.linalg.norm(normals, axis=1, keepdims=True)
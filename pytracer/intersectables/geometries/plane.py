@@ -1,15 +1,18 @@
+import math
+
 import numpy as np
 
 from pytracer.hit_record import HitRecord
 from pytracer.intersectables.intersectable import Intersectable
 from pytracer.ray import Ray
 
-from typing import TYPE_CHECKING
+from typing import Optional, TYPE_CHECKING
 
 from pytracer.math.vec3 import Vec3
 
 if TYPE_CHECKING:
     from pytracer import Material
+    from pytracer.ray_batch import RayBatch
 
 
 class Plane(Intersectable):
@@ -20,10 +23,11 @@ class Plane(Intersectable):
         self.distance = distance
         self.normal = normal
 
-    def intersect(self, ray: Ray) -> HitRecord:
+    def closest_hit(self, ray: Ray, t_max: float = math.inf) -> Optional[tuple]:
         """
         @param ray
-        @return HitRecord
+        @param t_max
+        @return (t, 0, 0.0, 0.0) or None, see Intersectable.closest_hit
 
         In the following a derivation of the intersection formula we are using in this implementation to compute the plane ray intersection:
 
@@ -74,19 +78,22 @@ class Plane(Intersectable):
         cos_theta = self.normal.dot(ray.direction)
 
         # TODO: handle to small normals and return an empty hit
-        if np.abs(cos_theta) <= 0.000001:
-            return HitRecord.make_empty()
+        if abs(cos_theta) <= 0.000001:
+            return None
 
         # assumption: point is zero and then we shift by distance
         t = -(self.distance + ray.origin.dot(self.normal)) / cos_theta
 
-        if t <= 0:
-            return HitRecord.make_empty()
+        if t <= 0 or t >= t_max:
+            return None
+
+        return t, 0, 0.0, 0.0
 
+    def hit_record(self, ray: Ray, t: float, primitive_id, u: float, v: float) -> HitRecord:
         intersection_position = ray.point_at(t)
         w_in = ray.direction.incident_direction()
 
-        hit_normal = Vec3(*self.normal)
+        hit_normal = self.normal.copy()
         hit_tangent = Vec3.one().cross(hit_normal)
 
         hit_record = HitRecord(
@@ -99,3 +106,21 @@ class Plane(Intersectable):
             material=self.material
         )
         return hit_record
+
+    def intersect_batch(self, rays: 'RayBatch', max_t: np.ndarray = None) -> tuple:
+        normal = np.asarray(self.normal)
+        cos_theta = rays.directions.dot(normal)
+        is_hit = np.abs(cos_theta) > 0.000001
+
+        t = -(self.distance + rays.origins.dot(normal)) / np.where(is_hit, cos_theta, 1.0)
+        is_hit &= t > 0
+        if max_t is not None:
+            is_hit &= t < max_t
+
+        count = len(rays)
+        zeros = np.zeros(count)
+        return np.where(is_hit, t, np.inf), zeros, zeros, np.zeros(count, dtype=np.int64)
+
+    def surface_normals_batch(self, positions: np.ndarray, u: np.ndarray, v: np.ndarray,
+                              primitive_ids: np.ndarray) -> np.ndarray:
+        return np.tile(np.asarray(self.normal, dtype=np.float64), (len(positions), 1))
@@ -1,11 +1,19 @@
+import math
+
 import numpy as np
 
 from pytracer.hit_record import HitRecord
+from pytracer.intersectables.bounding_box import BoundingBox
 from pytracer.intersectables.intersectable import Intersectable
 from pytracer.materials.material import Material
 from pytracer.ray import Ray
 from pytracer.math.vec3 import Vec3
 
+from typing import Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pytracer.ray_batch import RayBatch
+
 
 class Sphere(Intersectable):
     def __init__(self,
@@ -23,7 +31,14 @@ class Sphere(Intersectable):
         self.center = center
         self.radius = radius
 
-    def intersect(self, ray: Ray) -> HitRecord:
+    def bounding_box(self) -> BoundingBox:
+        extent = Vec3(self.radius, self.radius, self.radius)
+        return BoundingBox(
+            min_corner=self.center - extent,
+            max_corner=self.center + extent
+        )
+
+    def closest_hit(self, ray: Ray, t_max: float = math.inf) -> Optional[tuple]:
         """
         Details how to compute the ray-sphere intersection:
 
@@ -71,6 +86,8 @@ class Sphere(Intersectable):
 
         For computing the hitRecord of the intersection, we are interested in the
         smaller and positive t.
+
+        @return (t, 0, 0.0, 0.0) or None, see Intersectable.closest_hit
         """
 
         oc = ray.origin - self.center
@@ -82,28 +99,32 @@ class Sphere(Intersectable):
 
         discriminant = b * b - 4.0 * a * c
 
-        zeros = []
-        if discriminant >= 0.0:
-            t1 = (-b + np.sqrt(discriminant)) / (2.0 * a)
-            t2 = (-b - np.sqrt(discriminant)) / (2.0 * a)
-            zeros = [t1, t2]  # what if this root is present more than once?
-
-        if len(zeros) < 2:
-            return HitRecord.make_empty()
+        if discriminant < 0.0:
+            return None
         else:
+            root = math.sqrt(discriminant)
+            t1 = (-b + root) / (2.0 * a)
+            t2 = (-b - root) / (2.0 * a)
+
             # find intersection closer to camera
-            t = np.min(zeros)
+            t = min(t1, t2)
             # if the intersection was behind the camera viewing ray
             if t < 0:
                 # then take the one further away from the camera
-                t = np.max(zeros)
+                t = max(t1, t2)
                 # if the intersection was behind the camera viewing ray
                 if t < 0:
                     # then return no viewed intersection
-                    return HitRecord.make_empty()
+                    return None
+
+        if t <= 0.0 or t >= t_max:
+            return None
 
+        return t, 0, 0.0, 0.0
+
+    def hit_record(self, ray: Ray, t: float, primitive_id, u: float, v: float) -> HitRecord:
         hit_position = ray.point_at(t)
-        hit_normal = Vec3.from_other(hit_position - self.center).normalized()
+        hit_normal = (hit_position - self.center).normalized()
 
         w_in = ray.direction.incident_direction()
 
@@ -120,3 +141,33 @@ class Sphere(Intersectable):
         )
 
         return hit_record
+
+    def intersect_batch(self, rays: 'RayBatch', max_t: np.ndarray = None) -> tuple:
+        oc = rays.origins - np.asarray(self.center)
+        rd = rays.directions
+
+        a = np.sum(rd * rd, axis=1)
+        b = 2.0 * np.sum(rd * oc, axis=1)
+        c = np.sum(oc * oc, axis=1) - self.radius ** 2.0
+
+        discriminant = b * b - 4.0 * a * c
+        root = np.sqrt(np.maximum(discriminant, 0.0))
+        t1 = (-b + root) / (2.0 * a)
+        t2 = (-b - root) / (2.0 * a)
+
+        # take the intersection closer to the camera unless it is behind the ray origin
+        t_near = np.minimum(t1, t2)
+        t = np.where(t_near < 0, np.maximum(t1, t2), t_near)
+
+        is_hit = (discriminant >= 0.0) & (t > 0.0)
+        if max_t is not None:
+            is_hit &= t < max_t
+
+        count = len(rays)
+        zeros = np.zeros(count)
+        return np.where(is_hit, t, np.inf), zeros, zeros, np.zeros(count, dtype=np.int64)
+
+    def surface_normals_batch(self, positions: np.ndarray, u: np.ndarray, v: np.ndarray,
+                              primitive_ids: np.ndarray) -> np.ndarray:
+        normals = positions - np.asarray(self.center)
+        return normals / np.linalg.norm(normals, axis=1, keepdims=True)
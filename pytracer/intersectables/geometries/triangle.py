@@ -1,15 +1,20 @@
+import math
+
 import numpy as np
 
 from pytracer.hit_record import HitRecord
+from pytracer.intersectables.bounding_box import BoundingBox
 from pytracer.intersectables.intersectable import Intersectable
+from pytracer.intersectables.geometries.triangle_buffer import TriangleBuffer
 from pytracer.ray import Ray
 
-from typing import TYPE_CHECKING
+from typing import Optional, TYPE_CHECKING
 
 from pytracer.math.vec3 import Vec3
 
 if TYPE_CHECKING:
     from pytracer import Material
+    from pytracer.ray_batch import RayBatch
 
 
 class Triangle(Intersectable):
@@ -26,12 +31,21 @@ class Triangle(Intersectable):
         self.c = c
         self.face_id = face_id
 
+        # edges and normal do not change, precompute them once for all rays
+        self.ba = Vec3.from_other(b - a)
+        self.ca = Vec3.from_other(c - a)
+        self.face_normal = self.ba.cross(self.ca).normalized()
+        self._a = tuple(a.tolist())
+        self._ba = tuple(self.ba.tolist())
+        self._ca = tuple(self.ca.tolist())
+
+    def bounding_box(self) -> BoundingBox:
+        return BoundingBox.from_points(self.a, self.b, self.c)
+
     def compute_normal(self, _alpha: float = 0.0, _beta: float = 0.0):
-        ba = self.b - self.a
-        ca = self.c - self.a
-        return ba.cross(ca).normalized()
+        return Vec3.from_other(self.face_normal)
 
-    def intersect(self, ray: Ray) -> HitRecord:
+    def closest_hit(self, ray: Ray, t_max: float = math.inf) -> Optional[tuple]:
         """
         A triangle T can be spanned by a set of three points A, B, and C, i.e., T = span(A, B, C)
         Every point P within such a triangle T fulfills P = w * A + u * B + v * C with the conditions
@@ -63,34 +77,54 @@ class Triangle(Intersectable):
         the point P in the triangle. We can the perform an intersection test by
         verifying the initial conditions (1) 0 <= u, v <= 1 and (2) u + v + w = 1
 
+        Instead of inverting M we solve the system with Cramer's rule (Möller–Trumbore),
+        see TriangleBuffer for the vectorized version of this computation.
+
         @param ray
+        @param t_max
+        @return (t, face_id, u, v) or None, see Intersectable.closest_hit
         """
-        ba = self.b - self.a
-        ca = self.c - self.a
-        oa = ray.origin - self.a
-        d = -ray.direction
-
-        M = np.array([
-            [ba[0], ca[0], d[0]],
-            [ba[1], ca[1], d[1]],
-            [ba[2], ca[2], d[2]]
-        ])
-
-        u, v, t = np.linalg.inv(M).dot(oa)
-
+        ox, oy, oz = ray.origin.tolist()
+        dx, dy, dz = ray.direction.tolist()
+        ax, ay, az = self._a
+        e1x, e1y, e1z = self._ba
+        e2x, e2y, e2z = self._ca
+
+        px = dy * e2z - dz * e2y
+        py = dz * e2x - dx * e2z
+        pz = dx * e2y - dy * e2x
+        det = e1x * px + e1y * py + e1z * pz
+
+        # the ray is parallel to the triangle
+        if -1e-12 < det < 1e-12:
+            return None
+
+        inv_det = 1.0 / det
+        tx = ox - ax
+        ty = oy - ay
+        tz = oz - az
+        u = (tx * px + ty * py + tz * pz) * inv_det
         if u < 0.0 or u > 1.0:
-            return HitRecord.make_empty()
+            return None
 
-        if v < 0.0 or v > 1.0:
-            return HitRecord.make_empty()
+        qx = ty * e1z - tz * e1y
+        qy = tz * e1x - tx * e1z
+        qz = tx * e1y - ty * e1x
+        v = (dx * qx + dy * qy + dz * qz) * inv_det
 
         # u + v + w = 1
-        sum = u + v
-        if sum > 1.0 or sum < 0.0:
-            return HitRecord.make_empty()
+        if v < 0.0 or u + v > 1.0:
+            return None
 
+        t = (e2x * qx + e2y * qy + e2z * qz) * inv_det
+        if t <= 0.0 or t >= t_max:
+            return None
+
+        return t, self.face_id, u, v
+
+    def hit_record(self, ray: Ray, t: float, primitive_id, u: float, v: float) -> HitRecord:
         intersection_position = ray.point_at(t)
-        hit_normal = self.compute_normal(0, 0)
+        hit_normal = self.compute_normal(u, v)
         w_in = ray.direction.incident_direction()
         hit_tangent = Vec3.one()  # TODO: fixme
 
@@ -105,6 +139,17 @@ class Triangle(Intersectable):
         )
         return hit_record
 
+    def intersect_batch(self, rays: 'RayBatch', max_t: np.ndarray = None) -> tuple:
+        t, u, v, is_hit = TriangleBuffer.solve(rays.origins.T, rays.directions.T, self._a, self._ba, self._ca)
+        if max_t is not None:
+            is_hit &= t < max_t
+
+        return np.where(is_hit, t, np.inf), u, v, np.full(len(rays), self.face_id, dtype=np.int64)
+
+    def surface_normals_batch(self, positions: np.ndarray, u: np.ndarray, v: np.ndarray,
+                              primitive_ids: np.ndarray) -> np.ndarray:
+        return np.tile(np.asarray(self.face_normal, dtype=np.float64), (len(positions), 1))
+
 
 class MeshTriangle(Triangle):
     def __init__(self, material: 'Material', a: Vec3, b: Vec3, c: Vec3, nx: Vec3, ny: Vec3, nz: Vec3, face_id: int):
@@ -115,6 +160,42 @@ class MeshTriangle(Triangle):
 
     def compute_normal(self, u: float, v: float):
         w = 1 - u - v
-        normal = Vec3.from_other(w * self.nx + u * self.ny + v * self.nz)
-        normal.normalized()
-        return normal
+        return Vec3.from_other(w * self.nx + u * self.ny + v * self.nz).normalized()
+
+    def surface_normals_batch(self, positions: np.ndarray, u: np.ndarray, v: np.ndarray,
+                              primitive_ids: np.ndarray) -> np.ndarray:
+        w = 1.0 - u - v
+        normals = (w[:, None] * np.asarray(self.nx) + u[:, None] * np.asarray(self.ny)
+                   + v[:, None] * np.asarray(self.nz))
+        return normals / np.linalg.norm(normals, axis=1, keepdims=True)
+
+
+class TriangleView(Triangle):
+    """
+    A triangle of a TriangleBuffer, created on demand by the per-ray traversal
+    of a Mesh instead of being kept per face. It only reads the corners of its
+    row of the buffer, see TriangleBuffer.corner_floats.
+    """
+
+    def __init__(self, material: 'Material', buffer: TriangleBuffer, row: int, face_id: int):
+        self.material = material
+        self.buffer = buffer
+        self.row = row
+        self.face_id = face_id
+        self._a, self._ba, self._ca = buffer.corner_floats(row)
+
+    def bounding_box(self) -> BoundingBox:
+        a = Vec3(*self._a)
+        return BoundingBox.from_points(a, a + Vec3(*self._ba), a + Vec3(*self._ca))
+
+    def compute_normal(self, u: float = 0.0, v: float = 0.0):
+        if self.buffer.normals is None:
+            return Vec3(*self._ba).cross(Vec3(*self._ca)).normalized()
+
+        nx, ny, nz = (Vec3(*normal) for normal in self.buffer.normals[self.buffer.indices[self.row]].tolist())
+        w = 1 - u - v
+        return Vec3.from_other(w * nx + u * ny + v * nz).normalized()
+
+    def surface_normals_batch(self, positions: np.ndarray, u: np.ndarray, v: np.ndarray,
+                              primitive_ids: np.ndarray) -> np.ndarray:
+        return self.buffer.normals_at(np.full(len(positions), self.row), u, v)
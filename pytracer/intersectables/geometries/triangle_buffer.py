@@ -0,0 +1,361 @@
+import numpy as np
+
+from typing import Optional
+
+
+class TriangleBuffer:
+    """
+    Stores many triangles as contiguous arrays and intersects rays with all of
+    them at once using the Möller–Trumbore algorithm:
+
+    https://en.wikipedia.org/wiki/M%C3%B6ller%E2%80%93Trumbore_intersection_algorithm
+
+    The ray-triangle system O + t * D = A + u * (B - A) + v * (C - A) (see
+    Triangle.intersect) is solved with Cramer's rule. Using the precomputed edges
+    E1 = B - A and E2 = C - A, P = D x E2, T = O - A and Q = T x E1 we get
+
+        det = dot(E1, P)
+        u = dot(T, P) / det
+        v = dot(D, Q) / det
+        t = dot(E2, Q) / det
+
+    The triangles are stored as an indexed mesh: a float32 (v, 3) buffer of
+    vertex positions, optionally a float32 (v, 3) buffer of vertex normals, and
+    a uint32 (n, 3) buffer with the vertex indices of the corners of every
+    triangle. Vertices shared by several triangles are stored once, see weld,
+    such that a triangle takes about 20 bytes instead of the 168 bytes of its
+    float64 corners, edges and normals. Queries gather the corners of the
+    triangles they test and solve in float64 per coordinate, i.e. with arrays
+    of shape (3, n), so that every step of the kernel is a single numpy
+    operation over all triangles.
+    """
+
+    EPS = 1e-12
+    MAX_T = 10_000_000_000
+    BATCH_CHUNK_SIZE = 1 << 20
+
+    def __init__(self, positions: np.ndarray, indices: np.ndarray, normals: np.ndarray = None):
+        """
+        @param positions (v, 3) float array of vertex positions
+        @param indices (n, 3) int array, the vertices of the corners a, b and c of every triangle
+        @param normals optional (v, 3) float array of vertex normals, used for normal interpolation
+        """
+
+        self.positions = np.ascontiguousarray(positions, dtype=np.float32).reshape((-1, 3))
+        self.indices = np.ascontiguousarray(indices, dtype=np.uint32).reshape((-1, 3))
+        self.normals = None if normals is None else np.ascontiguousarray(normals, dtype=np.float32).reshape((-1, 3))
+
+    @classmethod
+    def from_corners(cls, a: np.ndarray, b: np.ndarray, c: np.ndarray,
+                     normals_a: np.ndarray = None, normals_b: np.ndarray = None,
+                     normals_c: np.ndarray = None) -> 'TriangleBuffer':
+        """
+        @param a (n, 3) float array, first vertex of every triangle
+        @param b (n, 3) float array, second vertex of every triangle
+        @param c (n, 3) float array, third vertex of every triangle
+        @param normals_a optional (n, 3) float array of vertex normals at a
+        @param normals_b optional (n, 3) float array of vertex normals at b
+        @param normals_c optional (n, 3) float array of vertex normals at c
+        @return a buffer of the triangles with their shared corners welded, see weld
+        """
+
+        corners = np.stack([np.reshape(a, (-1, 3)), np.reshape(b, (-1, 3)), np.reshape(c, (-1, 3))], axis=1)
+        faces = np.arange(corners.shape[0] * 3).reshape((-1, 3))
+        corner_normals = None
+        if normals_a is not None:
+            corner_normals = np.stack([np.reshape(normals_a, (-1, 3)), np.reshape(normals_b, (-1, 3)),
+                                       np.reshape(normals_c, (-1, 3))], axis=1).reshape((-1, 3))
+
+        return cls(*cls.weld(corners.reshape((-1, 3)), faces, corner_normals, faces))
+
+    @staticmethod
+    def weld(positions: np.ndarray, faces: np.ndarray, normals: np.ndarray = None,
+             normal_faces: np.ndarray = None) -> tuple:
+        """
+        Merge all corners with the same float32 position and, if given, the same
+        normal into one vertex. Vertices that no face refers to are dropped.
+
+        @param positions (p, 3) float array
+        @param faces (n, 3) int array of position indices of the corners of every triangle
+        @param normals optional (m, 3) float array of normals
+        @param normal_faces (n, 3) int array of normal indices of the corners, needed with normals
+        @return (positions, indices, normals) as passed to TriangleBuffer, normals are None without normals
+        """
+
+        positions = np.asarray(positions, dtype=np.float32).reshape((-1, 3))
+        faces = np.asarray(faces).reshape((-1, 3))
+        if len(faces) == 0:
+            return np.zeros((0, 3), dtype=np.float32), np.zeros((0, 3), dtype=np.uint32), \
+                None if normals is None else np.zeros((0, 3), dtype=np.float32)
+
+        unique_positions, position_ids = np.unique(positions, axis=0, return_inverse=True)
+        keys = position_ids.reshape(-1)[faces.reshape(-1)].astype(np.int64)
+        if normals is not None:
+            normals = np.asarray(normals, dtype=np.float32).reshape((-1, 3))
+            unique_normals, normal_ids = np.unique(normals, axis=0, return_inverse=True)
+            keys = keys * len(unique_normals) + normal_ids.reshape(-1)[np.asarray(normal_faces).reshape(-1)]
+
+        _, first_corners, indices = np.unique(keys, return_index=True, return_inverse=True)
+        if len(first_corners) > np.iinfo(np.uint32).max:
+            raise ValueError(f"A triangle buffer holds at most {np.iinfo(np.uint32).max} vertices")
+
+        vertex_normals = None
+        if normals is not None:
+            vertex_normals = normals[np.asarray(normal_faces).reshape(-1)[first_corners]]
+
+        return (positions[faces.reshape(-1)[first_corners]], indices.reshape((-1, 3)).astype(np.uint32),
+                vertex_normals)
+
+    def __len__(self) -> int:
+        return self.indices.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.arrays().values())
+
+    def arrays(self) -> dict:
+        """
+        @return the arrays of this buffer by name, see TriangleBuffer.from_arrays
+        """
+
+        arrays = {"positions": self.positions, "indices": self.indices}
+        if self.normals is not None:
+            arrays["normals"] = self.normals
+
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: dict) -> 'TriangleBuffer':
+        """
+        @param arrays the arrays of a buffer as returned by TriangleBuffer.arrays, e.g. memory-mapped from a file
+        @return a buffer using the given arrays without copying them
+        """
+
+        buffer = cls.__new__(cls)
+        buffer.positions = arrays["positions"]
+        buffer.indices = arrays["indices"]
+        buffer.normals = arrays.get("normals")
+        return buffer
+
+    def vertices(self, primitive_ids=slice(None)) -> np.ndarray:
+        """
+        @param primitive_ids triangles to return, all by default
+        @return (n, 3, 3) float64 array with the three corners of every triangle
+        """
+
+        return self.positions[self.indices[primitive_ids]].astype(np.float64)
+
+    def corners(self, primitive_ids=slice(None)) -> tuple:
+        """
+        @param primitive_ids triangles to return, all by default
+        @return (a, e1, e2) float64 arrays of shape (3, n) with the first vertex and the edges
+          b - a and c - a of every triangle, see solve
+        """
+
+        corners = self.vertices(primitive_ids)
+        a = corners[:, 0]
+        return a.T, (corners[:, 1] - a).T, (corners[:, 2] - a).T
+
+    def corner_floats(self, primitive_id: int) -> tuple:
+        """
+        @return (a, b - a, c - a) of a single triangle as tuples of floats, for the per-ray code
+        """
+
+        (ax, ay, az), (bx, by, bz), (cx, cy, cz) = self.positions[self.indices[primitive_id]].tolist()
+        return (ax, ay, az), (bx - ax, by - ay, bz - az), (cx - ax, cy - ay, cz - az)
+
+    def face_normals(self, primitive_ids=slice(None)) -> np.ndarray:
+        """
+        @param primitive_ids triangles to return, all by default
+        @return (n, 3) float64 array with the normalized geometric normal of every triangle
+        """
+
+        _, (e1x, e1y, e1z), (e2x, e2y, e2z) = self.corners(primitive_ids)
+        return self.normalized(e1y * e2z - e1z * e2y, e1z * e2x - e1x * e2z, e1x * e2y - e1y * e2x)
+
+    def vertex_normals(self, primitive_ids=slice(None)) -> Optional[np.ndarray]:
+        """
+        @param primitive_ids triangles to return, all by default
+        @return (n, 3, 3) float64 array with the normals at the three corners of every triangle,
+          None if the buffer has no vertex normals
+        """
+
+        if self.normals is None:
+            return None
+
+        return self.normals[self.indices[primitive_ids]].astype(np.float64)
+
+    def bounds(self) -> np.ndarray:
+        """
+        @return (n, 2, 3) float array with the min and max corner of every triangle
+        """
+
+        bounds = np.empty((len(self), 2, 3))
+        for begin in range(0, len(self), self.BATCH_CHUNK_SIZE):
+            corners = self.positions[self.indices[begin:begin + self.BATCH_CHUNK_SIZE]]
+            bounds[begin:begin + self.BATCH_CHUNK_SIZE, 0] = corners.min(axis=1)
+            bounds[begin:begin + self.BATCH_CHUNK_SIZE, 1] = corners.max(axis=1)
+
+        return bounds
+
+    def permuted(self, order: np.ndarray) -> 'TriangleBuffer':
+        """
+        @param order index array, e.g. the item order of a BVH
+        @return a buffer with the triangles stored in the given order, sharing the vertices of this buffer
+        """
+
+        return TriangleBuffer(self.positions, self.indices[order], self.normals)
+
+    @classmethod
+    def solve(cls, origin, direction, a: np.ndarray, e1: np.ndarray, e2: np.ndarray) -> tuple:
+        """
+        Möller–Trumbore kernel. All arguments are given per coordinate and only
+        have to be broadcastable against each other, e.g. a single ray against
+        many triangles or many rays against many triangles.
+
+        @param origin ray origins (ox, oy, oz)
+        @param direction ray directions (dx, dy, dz)
+        @param a first triangle vertices (ax, ay, az)
+        @param e1 first triangle edges (b - a)
+        @param e2 second triangle edges (c - a)
+        @return (t, u, v, is_valid) where is_valid marks hits inside the triangle in front of the ray
+        """
+
+        ox, oy, oz = origin
+        dx, dy, dz = direction
+        ax, ay, az = a
+        e1x, e1y, e1z = e1
+        e2x, e2y, e2z = e2
+
+        px = dy * e2z - dz * e2y
+        py = dz * e2x - dx * e2z
+        pz = dx * e2y - dy * e2x
+        det = e1x * px + e1y * py + e1z * pz
+        is_valid = np.abs(det) > cls.EPS
+        inv_det = 1.0 / np.where(is_valid, det, 1.0)
+
+        tx = ox - ax
+        ty = oy - ay
+        tz = oz - az
+        u = (tx * px + ty * py + tz * pz) * inv_det
+
+        qx = ty * e1z - tz * e1y
+        qy = tz * e1x - tx * e1z
+        qz = tx * e1y - ty * e1x
+        v = (dx * qx + dy * qy + dz * qz) * inv_det
+        t = (e2x * qx + e2y * qy + e2z * qz) * inv_det
+
+        is_valid &= (u >= 0.0) & (u <= 1.0) & (v >= 0.0) & (u + v <= 1.0) & (t > 0.0)
+        return t, u, v, is_valid
+
+    def intersect(self, origin, direction, start: int = 0, end: int = None,
+                  max_t: float = MAX_T) -> Optional[tuple]:
+        """
+        Intersect a single ray with the triangles start, ..., end - 1.
+
+        @param origin ray origin (3 floats)
+        @param direction ray direction (3 floats)
+        @param start index of the first triangle to test
+        @param end index after the last triangle to test, all remaining triangles by default
+        @param max_t only hits with 0 < t < max_t are reported
+        @return (t, u, v, primitive_id) of the closest hit or None if no triangle was hit
+        """
+
+        t, u, v, is_valid = self.solve(origin, direction, *self.corners(slice(start, end)))
+        is_valid &= t < max_t
+        if not is_valid.any():
+            return None
+
+        t = np.where(is_valid, t, np.inf)
+        k = int(np.argmin(t))
+        return float(t[k]), float(u[k]), float(v[k]), start + k
+
+    def intersect_batch(self, origins: np.ndarray, directions: np.ndarray, max_t: np.ndarray = None) -> tuple:
+        """
+        Intersect every ray of a batch with every triangle of this buffer. Rays
+        are processed in chunks such that at most BATCH_CHUNK_SIZE ray-triangle
+        pairs are evaluated at once.
+
+        @param origins (N, 3) float array of ray origins, e.g. RayBatch.origins
+        @param directions (N, 3) float array of ray directions, e.g. RayBatch.directions
+        @param max_t optional (N,) float array, only hits with 0 < t < max_t are reported
+        @return tuple (t, u, v, primitive_ids) of (N,) arrays describing the closest hit
+          of every ray. Rays that do not hit any triangle get t = inf and primitive id -1.
+        """
+
+        ray_count = len(origins)
+        t_hit = np.full(ray_count, np.inf)
+        u_hit = np.zeros(ray_count)
+        v_hit = np.zeros(ray_count)
+        primitive_ids = np.full(ray_count, -1, dtype=np.int64)
+        if max_t is None:
+            max_t = np.full(ray_count, self.MAX_T)
+
+        if len(self) == 0:
+            return t_hit, u_hit, v_hit, primitive_ids
+
+        a, e1, e2 = self.corners()
+        chunk_size = max(1, self.BATCH_CHUNK_SIZE // len(self))
+        for begin in range(0, ray_count, chunk_size):
+            chunk = slice(begin, begin + chunk_size)
+            t, u, v, is_valid = self.solve(origins[chunk].T[:, :, None], directions[chunk].T[:, :, None],
+                                           a, e1, e2)
+            is_valid &= t < max_t[chunk, None]
+            t = np.where(is_valid, t, np.inf)
+
+            k = np.argmin(t, axis=1)
+            rows = np.arange(len(k))
+            t_min = t[rows, k]
+            is_hit = np.isfinite(t_min)
+
+            t_hit[chunk] = t_min
+            u_hit[chunk] = np.where(is_hit, u[rows, k], 0.0)
+            v_hit[chunk] = np.where(is_hit, v[rows, k], 0.0)
+            primitive_ids[chunk] = np.where(is_hit, k, -1)
+
+        return t_hit, u_hit, v_hit, primitive_ids
+
+    def intersect_pairs(self, origins: np.ndarray, directions: np.ndarray, primitive_ids: np.ndarray) -> tuple:
+        """
+        Intersect the k-th ray with the triangle primitive_ids[k], e.g. for the
+        candidate pairs found by a BVH traversal.
+
+        @param origins (P, 3) float array of ray origins
+        @param directions (P, 3) float array of ray directions
+        @param primitive_ids (P,) int array of triangles
+        @return tuple (t, u, v) of (P,) arrays, t = inf for pairs that do not intersect
+        """
+
+        t, u, v, is_valid = self.solve(origins.T, directions.T, *self.corners(primitive_ids))
+        return np.where(is_valid, t, np.inf), u, v
+
+    def normals_at(self, primitive_ids: np.ndarray, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+        """
+        @param primitive_ids (N,) int array of hit triangles
+        @param u (N,) float array, barycentric coordinate of the hit with respect to b
+        @param v (N,) float array, barycentric coordinate of the hit with respect to c
+        @return (N, 3) normalized normals, interpolated from the vertex normals if
+          available, the face normals otherwise.
+        """
+
+        if self.normals is None:
+            return self.face_normals(primitive_ids)
+
+        normals = self.vertex_normals(primitive_ids)
+        w = 1.0 - u - v
+        normals = w[:, None] * normals[:, 0] + u[:, None] * normals[:, 1] + v[:, None] * normals[:, 2]
+        return self.normalized(*normals.T)
+
+    @staticmethod
+    def normalized(x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
+        """
+        Normalize operation by operation like Vec3.normalized and the numba
+        kernels, such that all backends compute the same normals.
+
+        @param x, y, z (n,) float arrays, the coordinates of the vectors
+        @return (n, 3) normalized vectors, zero vectors stay zero
+        """
+
+        lengths = np.sqrt(x * x + y * y + z * z)
+        inv_lengths = 1.0 / np.where(lengths > 0.0, lengths, np.inf)
+        return np.stack([x * inv_lengths, y * inv_lengths, z * inv_lengths], axis=1)
@@ -1,24 +1,132 @@
+import math
+
 from abc import ABC, abstractmethod
 
+import numpy as np
+
 from pytracer.ray import Ray
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 
 if TYPE_CHECKING:
     from pytracer import HitRecord
+    from pytracer.intersectables.bounding_box import BoundingBox
+    from pytracer.ray_batch import RayBatch
 
 
 class Intersectable(ABC):
+    """
+    Rays are intersected in two phases: closest_hit only locates the closest
+    hit by (t, primitive_id, u, v), which is cheap to compute and to discard
+    when a closer hit is found later. The full HitRecord is made once for the
+    final closest hit by hit_record.
+    """
 
-    @abstractmethod
     def intersect(self, ray: Ray) -> 'HitRecord':
         """
-        Implement ray-surface intersection in this method. Implementations of this
-        method need to make and return a {@link HitRecord} correctly, following
-        the conventions assumed for {@link HitRecord}.
+        @param ray the ray used for intersection testing
+        @return a hit record, an invalid hit record if there is no intersection
+        """
+
+        from pytracer.hit_record import HitRecord
+
+        hit = self.closest_hit(ray)
+        if hit is None:
+            return HitRecord.make_empty()
+
+        return self.hit_record(ray, *hit)
+
+    @abstractmethod
+    def closest_hit(self, ray: Ray, t_max: float = math.inf) -> Optional[tuple]:
+        """
+        Implement ray-surface intersection in this method.
 
         @param ray the ray used for intersection testing
-        @return a hit record, should return an invalid hit record if there is no intersection
+        @param t_max only hits with 0 < t < t_max are reported
+        @return (t, primitive_id, u, v) of the closest hit or None if there is
+          no intersection. primitive_id and the surface coordinates u, v locate
+          the hit on the surface, e.g. a triangle of a mesh and the barycentric
+          coordinates in this triangle, they are passed back to hit_record.
         """
 
         pass
+
+    @abstractmethod
+    def hit_record(self, ray: Ray, t: float, primitive_id, u: float, v: float) -> 'HitRecord':
+        """
+        Make the hit record of a hit found by closest_hit, following the
+        conventions assumed for {@link HitRecord}.
+
+        @param ray the intersected ray
+        @param t, primitive_id, u, v as returned by closest_hit
+        @return a valid hit record
+        """
+
+        pass
+
+    def occluded(self, ray: Ray, t_max: float) -> bool:
+        """
+        Any-hit query for shadow rays: is there a surface that casts shadows
+        between the origin of the ray and t_max? Unlike closest_hit, the query
+        may stop at the first blocker found.
+
+        Surfaces whose material does not cast shadows never occlude, this
+        default implementation is meant for geometries with a material.
+
+        @param ray the shadow ray
+        @param t_max only surfaces with 0 < t < t_max occlude the ray
+        @return true if the ray is blocked
+        """
+
+        return self.material.does_cast_shadows() and self.closest_hit(ray, t_max) is not None
+
+    def bounding_box(self) -> Optional['BoundingBox']:
+        """
+        Axis aligned box that encloses the whole surface. Acceleration structures
+        only store objects that have a finite bounding box.
+
+        @return a bounding box or None if the object is unbounded (e.g. a plane)
+        """
+
+        return None
+
+    def intersect_batch(self, rays: 'RayBatch', max_t: np.ndarray = None) -> tuple:
+        """
+        Intersect all rays of a batch at once. Only the location of the hits is
+        computed, the surface normals of the hits that are actually used can be
+        queried afterwards by calling surface_normals_batch.
+
+        @param rays batch of rays
+        @param max_t optional (N,) float array, only hits with 0 < t < max_t are reported
+        @return tuple (t, u, v, primitive_ids) of (N,) arrays. t is inf for rays
+          that do not hit the surface. u, v and primitive_ids locate the hit on
+          the surface, e.g. the barycentric coordinates in a triangle of a mesh.
+        """
+
+        raise NotImplementedError(f"{type(self).__name__} does not support batched intersection")
+
+    def occluded_batch(self, rays: 'RayBatch', max_t: np.ndarray) -> np.ndarray:
+        """
+        Batched counterpart of occluded.
+
+        @param rays batch of shadow rays
+        @param max_t (N,) float array, only surfaces with 0 < t < max_t occlude a ray
+        @return (N,) boolean, true for rays that are blocked
+        """
+
+        if not self.material.does_cast_shadows():
+            return np.zeros(len(rays), dtype=bool)
+
+        return np.isfinite(self.intersect_batch(rays, max_t)[0])
+
+    def surface_normals_batch(self, positions: np.ndarray, u: np.ndarray, v: np.ndarray,
+                              primitive_ids: np.ndarray) -> np.ndarray:
+        """
+        @param positions (N, 3) hit positions
+        @param u (N,) as returned by intersect_batch
+        @param v (N,) as returned by intersect_batch
+        @param primitive_ids (N,) as returned by intersect_batch
+        @return (N, 3) normalized surface normals at the given hits
+        """
+
+        raise NotImplementedError(f"{type(self).__name__} does not support batched intersection")
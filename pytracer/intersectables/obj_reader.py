@@ -1,57 +1,246 @@
+import hashlib
+import logging
+import os
+
+import numpy as np
+
 from dataclasses import dataclass
-from typing import List
 
-from pytracer.math.vec3 import Vec3
+from pytracer.array_bundle import ArrayBundle
 
 
 @dataclass
 class MeshData:
-    vertices: List[Vec3]
-    normals: List[Vec3]
-    faces: List[Vec3]
-    normal_faces: List[Vec3]
+    """
+    Triangulated mesh. All face arrays hold zero based indices, missing
+    texture coordinate or normal indices are -1.
+    """
+
+    vertices: np.ndarray         # (n, 3) float32
+    normals: np.ndarray          # (m, 3) float32, normalized
+    texcoords: np.ndarray        # (k, 2) float32
+    faces: np.ndarray            # (f, 3) int32 vertex indices
+    normal_faces: np.ndarray     # (f, 3) int32 normal indices
+    texcoord_faces: np.ndarray   # (f, 3) int32 texture coordinate indices
 
 
 class ObjReader:
     """
     https://en.wikipedia.org/wiki/Wavefront_.obj_file
+
+    Faces may use the v, v/vt, v//vn and v/vt/vn syntax, with positive or
+    negative (relative) indices. Quads and n-gons are fan-triangulated.
+
+    Parsed meshes are cached in a sidecar file next to the OBJ file (see
+    ArrayBundle), which is memory-mapped on later reads. The cache is keyed by
+    the size, modification time and content hash of the OBJ file.
     """
 
+    CACHE_VERSION = 1
+    CACHE_SUFFIX = ".cache"
+
+    @staticmethod
+    def read(filepath: str, use_cache: bool = True) -> MeshData:
+        """
+        @param filepath path to an OBJ file
+        @param use_cache read and write the sidecar cache
+        @return the triangulated mesh
+        """
+
+        if not use_cache:
+            with open(filepath, "rb") as file:
+                return ObjReader.parse(file.read())
+
+        cache_filepath = filepath + ObjReader.CACHE_SUFFIX
+        stat = os.stat(filepath)
+        metadata = ObjReader.read_cache_metadata(cache_filepath)
+        if (metadata.get("size"), metadata.get("mtime_ns")) == (stat.st_size, stat.st_mtime_ns):
+            return ObjReader.read_cache(cache_filepath)
+
+        with open(filepath, "rb") as file:
+            data = file.read()
+
+        content_hash = hashlib.blake2b(data, digest_size=20).hexdigest()
+        if metadata.get("hash") == content_hash:
+            return ObjReader.read_cache(cache_filepath)
+
+        mesh = ObjReader.parse(data)
+        metadata = {
+            "version": ObjReader.CACHE_VERSION,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "hash": content_hash
+        }
+        try:
+            ArrayBundle.write(cache_filepath, vars(mesh), metadata)
+        except OSError as error:
+            logging.warning(f"Could not write mesh cache {cache_filepath}: {error}")
+
+        return mesh
+
+    @staticmethod
+    def read_cache_metadata(cache_filepath: str) -> dict:
+        """
+        @return the metadata of a valid cache of the current version, an empty dict otherwise
+        """
+
+        try:
+            metadata = ArrayBundle.read_metadata(cache_filepath)
+        except (OSError, ValueError):
+            return {}
+
+        return metadata if metadata.get("version") == ObjReader.CACHE_VERSION else {}
+
+    @staticmethod
+    def read_cache(cache_filepath: str) -> MeshData:
+        arrays, _ = ArrayBundle.read(cache_filepath)
+        return MeshData(**arrays)
+
     @staticmethod
-    def read(filepath: str) -> MeshData:
-        with open(filepath) as file:
-            lines = [line.rstrip('\n') for line in file]
-
-        vertices = []
-        normals = []
-        faces = []
-        normal_faces = []
-
-        prefixes = set()
-        for line in lines:
-            prefix, *rest = line.split(" ")
-            prefixes.add(prefix)
-            match prefix:
-                case 'v':
-                    vx, vy, vz, *_ = [float(item) for item in rest]
-                    v = Vec3(vx, vy, vz)
-                    vertices.append(v)
-                case 'vn':
-                    nx, ny, nz, *_ = [float(item) for item in rest]
-                    normal = Vec3(nx, ny, nz).normalized()
-                    normals.append(normal)
-                case 'f':
-                    f1, f2, f3, *_ = [int(item.split("//")[0]) for item in rest[1:]]
-                    fn1, fn2, fn3, *_ = [int(item.split("//")[1]) for item in rest[1:]]
-                    face = Vec3(f1, f2, f3)
-                    normal_face = Vec3(fn1, fn2, fn3)
-
-                    faces.append(face)
-                    normal_faces.append(normal_face)
+    def parse(data: bytes) -> MeshData:
+        """
+        Parse all lines of a kind at once: the v, vt, vn and f lines are
+        selected by their prefix with numpy and the numbers of every kind are
+        converted in a single call. Lines starting with whitespace are ignored.
+
+        @param data content of an OBJ file
+        @return the triangulated mesh
+        """
+
+        characters = np.frombuffer(data + b"\n", dtype=np.uint8).copy()
+        characters[characters == ord("\r")] = ord(" ")
+
+        line_ends = np.flatnonzero(characters == ord("\n"))
+        line_starts = np.concatenate([[0], line_ends[:-1] + 1])
+
+        # the first three characters of every line, empty lines are padded with newlines
+        padded = np.concatenate([characters, np.full(2, ord("\n"), dtype=np.uint8)])
+        first, second, third = padded[line_starts], padded[line_starts + 1], padded[line_starts + 2]
+
+        def is_blank(character: np.ndarray) -> np.ndarray:
+            return (character == ord(" ")) | (character == ord("\t"))
+
+        is_vertex = (first == ord("v")) & is_blank(second)
+        is_texcoord = (first == ord("v")) & (second == ord("t")) & is_blank(third)
+        is_normal = (first == ord("v")) & (second == ord("n")) & is_blank(third)
+        is_face = (first == ord("f")) & is_blank(second)
+
+        # remove the prefixes, such that only numbers remain
+        characters[line_starts[is_vertex | is_texcoord | is_normal | is_face]] = ord(" ")
+        characters[line_starts[is_texcoord | is_normal] + 1] = ord(" ")
+
+        line_lengths = line_ends - line_starts + 1
+
+        def select(is_selected: np.ndarray) -> tuple:
+            return characters[np.repeat(is_selected, line_lengths)].tobytes(), int(is_selected.sum())
+
+        vertices = ObjReader.parse_vectors(*select(is_vertex), 3)
+        texcoords = ObjReader.parse_vectors(*select(is_texcoord), 2)
+        normals = ObjReader.parse_vectors(*select(is_normal), 3)
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        normals /= np.where(lengths > 0.0, lengths, 1.0)
+
+        corners, corner_counts = ObjReader.parse_faces(*select(is_face))
+
+        # negative indices are relative to the elements defined before the face
+        face_offsets = np.stack([
+            np.cumsum(is_vertex)[is_face],
+            np.cumsum(is_texcoord)[is_face],
+            np.cumsum(is_normal)[is_face]
+        ], axis=1)
+        corner_offsets = np.repeat(face_offsets, corner_counts, axis=0)
+
+        # 1 based indices, 0 marks a missing index
+        corners = np.where(corners > 0, corners - 1, np.where(corners < 0, corners + corner_offsets, -1))
+
+        triangles = ObjReader.fan_triangulate(corner_counts)
+        faces = corners[triangles]
 
         return MeshData(
             vertices=vertices,
             normals=normals,
-            faces=faces,
-            normal_faces=normal_faces
+            texcoords=texcoords,
+            faces=np.ascontiguousarray(faces[..., 0], dtype=np.int32),
+            normal_faces=np.ascontiguousarray(faces[..., 2], dtype=np.int32),
+            texcoord_faces=np.ascontiguousarray(faces[..., 1], dtype=np.int32)
         )
+
+    @staticmethod
+    def token_counts(text: bytes, line_count: int) -> np.ndarray:
+        """
+        @param text newline terminated lines of whitespace separated tokens
+        @param line_count number of lines in text
+        @return (line_count,) number of tokens per line
+        """
+
+        characters = np.frombuffer(text, dtype=np.uint8)
+        is_separator = (characters == ord(" ")) | (characters == ord("\t")) | (characters == ord("\n"))
+        token_starts = np.flatnonzero(~is_separator & np.concatenate([[True], is_separator[:-1]]))
+        token_lines = np.searchsorted(np.flatnonzero(characters == ord("\n")), token_starts)
+        return np.bincount(token_lines, minlength=line_count)
+
+    @staticmethod
+    def parse_vectors(text: bytes, line_count: int, dimension: int) -> np.ndarray:
+        """
+        @param text newline terminated lines of numbers, e.g. b"0.1 0.2 0.3\n"
+        @param line_count number of lines in text
+        @param dimension number of leading components to keep
+        @return (line_count, dimension) float32 array
+        """
+
+        values = np.fromstring(text, dtype=np.float32, sep=" ")
+        counts = ObjReader.token_counts(text, line_count)
+        if values.size != counts.sum() or (counts < dimension).any():
+            raise ValueError(f"Expected at least {dimension} numbers on every line")
+
+        if (counts == dimension).all():
+            return values.reshape((-1, dimension))
+
+        # lines with additional components, e.g. vertex colors
+        line_starts = np.cumsum(counts) - counts
+        return values[line_starts[:, None] + np.arange(dimension)[None, :]]
+
+    @staticmethod
+    def parse_faces(text: bytes, line_count: int) -> tuple:
+        """
+        @param text newline terminated face lines without prefix, e.g. b"1/1/1 2/2/2 3/3/3 4/4/4\n"
+        @param line_count number of lines in text
+        @return (corners, corner_counts) where corners is a (c, 3) int64 array with
+          the raw (vertex, texcoord, normal) indices of all face corners, 0 for
+          missing indices, and corner_counts the number of corners of every face.
+        """
+
+        if line_count == 0:
+            return np.zeros((0, 3), dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        corner_counts = ObjReader.token_counts(text, line_count)
+        if (corner_counts < 3).any():
+            raise ValueError("Faces need at least three vertices")
+
+        first_corner = text.split(None, 1)[0]
+        component_count = first_corner.count(b"/") + 1
+        text = text.replace(b"//", b"/0/").replace(b"/", b" ")
+        values = np.fromstring(text, dtype=np.int64, sep=" ")
+        if values.size != component_count * corner_counts.sum():
+            raise ValueError("All faces have to use the same v, v/vt, v//vn or v/vt/vn syntax")
+
+        corners = np.zeros((corner_counts.sum(), 3), dtype=np.int64)
+        corners[:, :component_count] = values.reshape((-1, component_count))
+        return corners, corner_counts
+
+    @staticmethod
+    def fan_triangulate(corner_counts: np.ndarray) -> np.ndarray:
+        """
+        Split a face with corners c0, c1, ..., ck into the triangles
+        (c0, c1, c2), (c0, c2, c3), ..., (c0, ck-1, ck).
+
+        @param corner_counts (f,) number of corners of every face
+        @return (t, 3) int array of corner indices of all triangles
+        """
+
+        triangle_counts = corner_counts - 2
+        first_corners = np.repeat(np.cumsum(corner_counts) - corner_counts, triangle_counts)
+        face_starts = np.repeat(np.cumsum(triangle_counts) - triangle_counts, triangle_counts)
+        steps = np.arange(triangle_counts.sum()) - face_starts
+
+        return np.stack([first_corners, first_corners + steps + 1, first_corners + steps + 2], axis=1)
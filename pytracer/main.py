@@ -1,5 +1,15 @@
 from pytracer import Scene
 from pytracer import Renderer
+from pytracer.aov_buffer import AovBuffer
+from pytracer.render_features import CHECKPOINT_INTERVAL, SCHEDULES
+from pytracer.renderer import SPP_PER_PASS, TILE_SIZE
+from pytracer.distributed.protocol import DEFAULT_PORT, parse_address
+from pytracer.distributed.render_coordinator import TASK_TIMEOUT
+from pytracer.distributed.render_worker import run_workers
+from pytracer.service.render_service import RenderService, SERVICE_PORT
+from pytracer.service.scene_cache import CACHE_SIZE
+from pytracer.scene import BACKENDS, SAMPLERS
+from pytracer.image_writer import ImageWriter
 
 from optparse import OptionParser
 
@@ -55,6 +65,203 @@ def main():
         default=1
     )
 
+    parser.add_option(
+        "-t",
+        "--tile-size",
+        dest="tile_size",
+        type="int",
+        help="Edge length in pixels of the square tiles the image is split into",
+        default=TILE_SIZE
+    )
+
+    parser.add_option(
+        "--schedule",
+        dest="schedule",
+        type="choice",
+        choices=list(SCHEDULES),
+        help=f"Order the tiles are rendered in, one of {', '.join(SCHEDULES)}. 'cost' renders the most expensive "
+             f"tiles first and splits them, based on the costs of a previous render or of a quick pre-pass",
+        default="morton"
+    )
+
+    parser.add_option(
+        "--cost-map",
+        action="store_true",
+        dest="record_costs",
+        default=False,
+        help="Measure the render time and the rays of every pixel and write them as heatmap to "
+             "output/rendered_image.cost.png"
+    )
+
+    parser.add_option(
+        "-a",
+        "--adaptive",
+        dest="noise_threshold",
+        type="float",
+        help="Sample adaptively until the relative error of every pixel is below the given noise level, "
+             "e.g. 0.02. The samples per pixel are the maximum per pixel then",
+        metavar="NOISE"
+    )
+
+    parser.add_option(
+        "--sampler",
+        dest="sampler",
+        type="choice",
+        choices=list(SAMPLERS),
+        help=f"Overrides the sampler of the scene, one of {', '.join(SAMPLERS)}. "
+             f"Adaptive sampling needs a random sampler"
+    )
+
+    parser.add_option(
+        "--backend",
+        dest="backend",
+        type="choice",
+        choices=list(BACKENDS),
+        help=f"Implementation of the whitted integrators, one of {', '.join(BACKENDS)}. 'numba' compiles the "
+             f"intersection, traversal and shading code and needs the optional numba package",
+        default="numpy"
+    )
+
+    parser.add_option(
+        "--spp-per-pass",
+        dest="spp_per_pass",
+        type="int",
+        help="Samples per pixel taken in every pass of the progressive rendering",
+        default=SPP_PER_PASS
+    )
+
+    parser.add_option(
+        "--checkpoint-interval",
+        dest="checkpoint_interval",
+        type="float",
+        help="Write a checkpoint at the end of a pass whenever this many seconds have passed since the last one. "
+             f"No checkpoints are written by default, or every {CHECKPOINT_INTERVAL:g} seconds with --resume",
+        default=None
+    )
+
+    parser.add_option(
+        "-r",
+        "--resume",
+        action="store_true",
+        dest="resume",
+        default=False,
+        help="Continue from the last checkpoint of a previous render"
+    )
+
+    parser.add_option(
+        "--tone-mapping",
+        dest="tone_mapping",
+        type="choice",
+        choices=list(ImageWriter.TONE_MAPPINGS),
+        help=f"Tone mapping applied before the image is sRGB encoded, one of {', '.join(ImageWriter.TONE_MAPPINGS)}",
+        default="clamp"
+    )
+
+    parser.add_option(
+        "-f",
+        "--float-output",
+        dest="float_formats",
+        type="choice",
+        choices=list(ImageWriter.FLOAT_FORMATS),
+        action="append",
+        help=f"Additionally write the linear radiance losslessly, one of {', '.join(ImageWriter.FLOAT_FORMATS)}. "
+             f"Can be given multiple times",
+        default=[]
+    )
+
+    parser.add_option(
+        "--aov",
+        dest="aovs",
+        type="choice",
+        choices=list(AovBuffer.AOVS),
+        action="append",
+        help=f"Write an output variable of the primary hits, collected in the same pass as the image, to "
+             f"output/rendered_image.<aov>.pfm, one of {', '.join(AovBuffer.AOVS)}. Can be given multiple times",
+        default=[]
+    )
+
+    parser.add_option(
+        "--crop",
+        dest="crop",
+        help="Only render the window of the image from column X0 and row Y0 up to but excluding column X1 and row Y1. "
+             "The image is written at the size of the window",
+        metavar="X0,Y0,X1,Y1"
+    )
+
+    parser.add_option(
+        "--preview",
+        action="store_true",
+        dest="preview",
+        default=False,
+        help="Write the image after the first pass at 1/16 and at 1/4 of the resolution and after every pass, "
+             "such that a first look at the image is available early"
+    )
+
+    parser.add_option(
+        "--gbuffer",
+        action="store_true",
+        dest="use_gbuffer",
+        default=False,
+        help="Keep the primary hits in output/rendered_image.gbuffer. Later renders of the scene with --gbuffer that only "
+             "change materials or lights skip the primary intersections and only shade the affected pixels again"
+    )
+
+    parser.add_option(
+        "--statistics",
+        action="store_true",
+        dest="collect_statistics",
+        default=False,
+        help="Count the traced rays, intersection tests and material evaluations and time the render stages. "
+             "The statistics of all threads are logged and written to output/rendered_image.statistics.json"
+    )
+
+    parser.add_option(
+        "--coordinator",
+        dest="coordinator_address",
+        help=f"Render on remote workers instead of local threads: listen on HOST:PORT (port {DEFAULT_PORT} by default) "
+             f"and serve the tiles to the workers that connect, e.g. 0.0.0.0:{DEFAULT_PORT}",
+        metavar="ADDRESS"
+    )
+
+    parser.add_option(
+        "--worker",
+        dest="worker_address",
+        help="Render tiles for the coordinator at HOST:PORT until its image is done. "
+             "No scene or resolution is needed, both are received from the coordinator",
+        metavar="ADDRESS"
+    )
+
+    parser.add_option(
+        "--worker-processes",
+        dest="worker_processes",
+        type="int",
+        help="Number of worker processes started by --worker or --service. By default, one per available thread"
+    )
+
+    parser.add_option(
+        "--task-timeout",
+        dest="task_timeout",
+        type="float",
+        help="Seconds after which the coordinator hands a tile that was not returned to another worker",
+        default=TASK_TIMEOUT
+    )
+
+    parser.add_option(
+        "--service",
+        dest="service_address",
+        help=f"Run as render service that keeps its worker processes and the loaded scenes between jobs and "
+             f"accepts jobs over HTTP on HOST:PORT (port {SERVICE_PORT} by default) or on the Unix socket unix:PATH",
+        metavar="ADDRESS"
+    )
+
+    parser.add_option(
+        "--cache-size",
+        dest="cache_size",
+        type="float",
+        help="Memory in MiB the render service may use for cached scenes",
+        default=CACHE_SIZE / 2 ** 20
+    )
+
     parser.add_option(
         "-q",
         "--quiet",
@@ -66,10 +273,27 @@ def main():
 
     (options, args) = parser.parse_args()
 
+    if options.worker_address is not None or options.service_address is not None:
+        required_options = []
+
     for r in required_options:
         if options.__dict__[r] is None:
             parser.error("parameter %s is required" % r)
 
+    if options.aovs and options.coordinator_address is not None:
+        parser.error("AOVs are only collected by local renders, not with --coordinator")
+    if options.preview and options.coordinator_address is not None:
+        parser.error("Previews are only written by local renders, not with --coordinator")
+
+    crop = None
+    if options.crop is not None:
+        try:
+            crop = tuple(int(value) for value in options.crop.split(","))
+        except ValueError:
+            crop = ()
+        if len(crop) != 4:
+            parser.error(f"--crop expects four integers X0,Y0,X1,Y1, got '{options.crop}'")
+
     today = date.today()
     current_date = today.strftime("%d_%m_%y")
     log_path = os.path.join(ROOT_PATH, 'logs', f"status_{current_date}.log")
@@ -89,16 +313,74 @@ def main():
         level=logging.DEBUG
     )
 
+    if options.worker_address is not None:
+        host, port = parse_address(options.worker_address)
+        run_workers(host, port, options.worker_processes)
+        return
+
+    if options.service_address is not None:
+        service = RenderService(process_count=options.worker_processes, cache_size=int(options.cache_size * 2 ** 20))
+        service.run(options.service_address)
+        return
+
     scene_filepath = options.scene_filepath
     spp = options.spp
     logging.info(f"Starting rendering process using the following settings:")
     logging.info(f"  Scene: {scene_filepath}")
     logging.info(f"  Resolution: {options.width} x {options.height} pixels")
     logging.info(f"  Samples per pixel: {spp}")
+    logging.info(f"  Tile size: {options.tile_size}")
+    logging.info(f"  Tile schedule: {options.schedule}")
+    logging.info(f"  Samples per pass: {options.spp_per_pass}")
+    if options.noise_threshold is not None:
+        logging.info(f"  Adaptive sampling with noise threshold: {options.noise_threshold}")
+    if options.checkpoint_interval is not None:
+        logging.info(f"  Checkpoint interval: {options.checkpoint_interval} seconds")
+    logging.info(f"  Tone mapping: {options.tone_mapping}")
+    logging.info(f"  Backend: {options.backend}")
+    if crop is not None:
+        logging.info(f"  Crop window: columns {crop[0]} to {crop[2]}, rows {crop[1]} to {crop[3]}")
+    if options.preview:
+        logging.info(f"  Writing previews")
+    if options.coordinator_address is not None:
+        logging.info(f"  Coordinator: {options.coordinator_address}")
 
-    scene = Scene(scene_filepath=scene_filepath, width=options.width, height=options.height)
-    renderer = Renderer(scene, output_filename="rendered_image")
-    renderer.render(spp=spp)
+    scene = Scene(scene_filepath=scene_filepath, width=options.width, height=options.height, sampler=options.sampler,
+                  backend=options.backend)
+    renderer = Renderer(
+        scene,
+        output_filename="rendered_image",
+        tone_mapping=options.tone_mapping,
+        float_formats=options.float_formats
+    )
+    if options.coordinator_address is not None:
+        host, port = parse_address(options.coordinator_address)
+        renderer.render_distributed(
+            spp=spp,
+            host=host,
+            port=port,
+            tile_size=options.tile_size,
+            spp_per_pass=options.spp_per_pass,
+            collect_statistics=options.collect_statistics,
+            task_timeout=options.task_timeout,
+            crop=crop
+        )
+    else:
+        renderer.render(
+            spp=spp,
+            tile_size=options.tile_size,
+            spp_per_pass=options.spp_per_pass,
+            checkpoint_interval=options.checkpoint_interval,
+            resume=options.resume,
+            noise_threshold=options.noise_threshold,
+            collect_statistics=options.collect_statistics,
+            record_costs=options.record_costs,
+            schedule=options.schedule,
+            use_gbuffer=options.use_gbuffer,
+            aovs=options.aovs,
+            crop=crop,
+            preview=options.preview
+        )
     logging.info("Completed rendering")
 
 
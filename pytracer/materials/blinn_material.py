@@ -1,5 +1,7 @@
 import math
 
+import numpy as np
+
 from pytracer.materials.material import Material
 from pytracer.shading_sample import ShadingSample
 from pytracer.math.vec3 import Vec3
@@ -24,6 +26,25 @@ class BlinnMaterial(Material):
 
         return ambient_contribution + diffuse_contribution + specular_contribution
 
+    def evaluate_brdf_batch(self, hits: 'HitBatch', w_out: np.ndarray, w_in: np.ndarray) -> np.ndarray:
+        cos_theta = np.sum(w_in * hits.normals, axis=1)
+
+        half_vectors = w_in + w_out
+        half_vectors = half_vectors / np.linalg.norm(half_vectors, axis=1, keepdims=True)
+        cos_theta_half = np.sum(half_vectors * hits.normals, axis=1)
+
+        diffuse = np.asarray(self.diffuse)
+        diffuse_contribution = diffuse * cos_theta[:, None]
+        specular_contribution = np.asarray(self.specular) * np.power(cos_theta_half, self.shininess)[:, None]
+
+        return diffuse + diffuse_contribution + specular_contribution
+
+    def evaluate_albedo(self, hit_record: 'HitRecord') -> Vec3:
+        return Vec3.from_other(self.diffuse)
+
+    def evaluate_albedo_batch(self, hits: 'HitBatch') -> np.ndarray:
+        return np.tile(np.asarray(self.diffuse, dtype=np.float64), (len(hits), 1))
+
     def evaluate_emission(self, hit_record: 'HitRecord', w_out: Vec3) -> Vec3:
         return Vec3.zero()
 
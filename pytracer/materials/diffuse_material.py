@@ -17,6 +17,16 @@ class DiffuseMaterial(Material):
     def evaluate_brdf(self, hit_record: 'HitRecord', w_out: Vec3, w_in: Vec3) -> Vec3:
         return Vec3.from_other(self.emission)
 
+    def evaluate_brdf_batch(self, hits: 'HitBatch', w_out: np.ndarray, w_in: np.ndarray) -> np.ndarray:
+        return np.tile(np.asarray(self.emission, dtype=np.float64), (len(hits), 1))
+
+    def evaluate_albedo(self, hit_record: 'HitRecord') -> Vec3:
+        # the brdf of a lambertian surface is its reflectance / pi
+        return self.emission * np.pi
+
+    def evaluate_albedo_batch(self, hits: 'HitBatch') -> np.ndarray:
+        return np.tile(np.asarray(self.emission * np.pi, dtype=np.float64), (len(hits), 1))
+
     def evaluate_emission(self, hit_record: 'HitRecord', w_out: Vec3) -> Vec3:
         if hit_record.normal.dot(w_out) < 0:
             #hit_record.normal = -hit_record.normal
@@ -17,8 +17,16 @@ class GridTexturedMaterial(Material):
 
     def evaluate_brdf(self, hit_record: 'HitRecord', w_out: Vec3, w_in: Vec3) -> Vec3:
         diffuse_brdf = self.diffuse.evaluate_brdf(hit_record, w_out, w_in)
-        hit_position = Vec3.from_other(hit_record.position)
-        shifted = Vec3.from_other(hit_record.position)
+        diffuse_brdf *= self.color_at(hit_record.position)
+        return diffuse_brdf
+
+    def color_at(self, position: Vec3) -> Vec3:
+        """
+        @return the line or tile color at a position on the surface
+        """
+
+        hit_position = Vec3.from_other(position)
+        shifted = Vec3.from_other(position)
         shifted = shifted + self.shift
 
         hit_position = hit_position / self.scale
@@ -31,14 +39,37 @@ class GridTexturedMaterial(Material):
             float(round(hit_position[2]))
         )
         shifted = shifted - rounded_positions
-        shifted = np.abs(shifted)
+        shifted = abs(shifted)
 
         if shifted[0] < relative_thickness or shifted[1] < relative_thickness or shifted[2] < relative_thickness:
-            diffuse_brdf *= self.line_color
-        else:
-            diffuse_brdf *= self.tile_color
+            return self.line_color
 
-        return diffuse_brdf
+        return self.tile_color
+
+    def evaluate_brdf_batch(self, hits: 'HitBatch', w_out: np.ndarray, w_in: np.ndarray) -> np.ndarray:
+        diffuse_brdf = self.diffuse.evaluate_brdf_batch(hits, w_out, w_in)
+        return diffuse_brdf * self.colors_at_batch(hits.positions)
+
+    def colors_at_batch(self, positions: np.ndarray) -> np.ndarray:
+        """
+        @param positions (N, 3) positions on the surface
+        @return (N, 3) line or tile colors
+        """
+
+        hit_positions = positions / self.scale
+        shifted = (positions + self.shift) / self.scale
+
+        relative_thickness = self.thickness / self.scale
+        shifted = np.abs(shifted - np.round(hit_positions))
+
+        is_line = np.any(shifted < relative_thickness, axis=1)
+        return np.where(is_line[:, None], np.asarray(self.line_color), np.asarray(self.tile_color))
+
+    def evaluate_albedo(self, hit_record: 'HitRecord') -> Vec3:
+        return self.diffuse.evaluate_albedo(hit_record) * self.color_at(hit_record.position)
+
+    def evaluate_albedo_batch(self, hits: 'HitBatch') -> np.ndarray:
+        return self.diffuse.evaluate_albedo_batch(hits) * self.colors_at_batch(hits.positions)
 
     def evaluate_emission(self, hit_record: 'HitRecord', w_out: Vec3) -> Vec3:
         return self.diffuse.evaluate_emission(hit_record, w_out)
@@ -2,11 +2,14 @@ from abc import ABC, abstractmethod
 
 from typing import TYPE_CHECKING
 
-from pytracer.shading_sample import ShadingSample
+import numpy as np
+
+from pytracer.shading_sample import ShadingSample, ShadingSampleBatch
 from pytracer.math.vec3 import Vec3
 
 if TYPE_CHECKING:
     from pytracer import HitRecord
+    from pytracer.hit_batch import HitBatch
 
 
 class Material(ABC):
@@ -60,6 +63,15 @@ class Material(ABC):
     def does_cast_shadows(self) -> bool:
         pass
 
+    def evaluate_albedo(self, hit_record: 'HitRecord') -> Vec3:
+        """
+        @param hit_record Information about hit point
+        @return the color of the surface independent of the lighting, e.g. the
+         diffuse reflectance, black for materials without one such as lights
+        """
+
+        return Vec3.zero()
+
     @abstractmethod
     def evaluate_specular_reflection(self, hit_record: 'HitRecord') -> ShadingSample:
         pass
@@ -67,3 +79,40 @@ class Material(ABC):
     @abstractmethod
     def evaluate_specular_refraction(self, hit_record: 'HitRecord') -> ShadingSample:
         pass
+
+    # Batched counterparts of the methods above, used by the wavefront integrator.
+    # They fall back to evaluating one hit after another, materials override
+    # them with vectorized implementations.
+
+    def evaluate_brdf_batch(self, hits: 'HitBatch', w_out: np.ndarray, w_in: np.ndarray) -> np.ndarray:
+        """
+        @param hits hits on surfaces with this material
+        @param w_out (N, 3) outgoing directions
+        @param w_in (N, 3) incoming directions
+        @return (N, 3) BRDF values
+        """
+
+        brdfs = [
+            self.evaluate_brdf(hits.hit_record_at(k, self), Vec3.from_array(w_out[k]), Vec3.from_array(w_in[k]))
+            for k in range(len(hits))
+        ]
+        return np.array(brdfs, dtype=np.float64).reshape((-1, 3))
+
+    def evaluate_albedo_batch(self, hits: 'HitBatch') -> np.ndarray:
+        """
+        @param hits hits on surfaces with this material
+        @return (N, 3) albedos
+        """
+
+        albedos = [self.evaluate_albedo(hits.hit_record_at(k, self)) for k in range(len(hits))]
+        return np.array(albedos, dtype=np.float64).reshape((-1, 3))
+
+    def evaluate_specular_reflection_batch(self, hits: 'HitBatch') -> ShadingSampleBatch:
+        return ShadingSampleBatch.from_samples([
+            self.evaluate_specular_reflection(hits.hit_record_at(k, self)) for k in range(len(hits))
+        ])
+
+    def evaluate_specular_refraction_batch(self, hits: 'HitBatch') -> ShadingSampleBatch:
+        return ShadingSampleBatch.from_samples([
+            self.evaluate_specular_refraction(hits.hit_record_at(k, self)) for k in range(len(hits))
+        ])
@@ -1,5 +1,7 @@
+import numpy as np
+
 from pytracer.materials.material import Material
-from pytracer.shading_sample import ShadingSample
+from pytracer.shading_sample import ShadingSample, ShadingSampleBatch
 from pytracer.math.vec3 import Vec3
 
 
@@ -10,6 +12,12 @@ class ReflectiveMaterial(Material):
     def evaluate_brdf(self, hit_record: 'HitRecord', w_out: Vec3, w_in: Vec3) -> Vec3:
         return Vec3.one()
 
+    def evaluate_albedo(self, hit_record: 'HitRecord') -> Vec3:
+        return Vec3.from_other(self.ks)
+
+    def evaluate_albedo_batch(self, hits: 'HitBatch') -> np.ndarray:
+        return np.tile(np.asarray(self.ks, dtype=np.float64), (len(hits), 1))
+
     def evaluate_emission(self, hit_record: 'HitRecord', w_out: Vec3) -> Vec3:
         return Vec3.zero()
 
@@ -32,5 +40,14 @@ class ReflectiveMaterial(Material):
             p=1.0
         )
 
+    def evaluate_specular_reflection_batch(self, hits: 'HitBatch') -> ShadingSampleBatch:
+        cos_theta_i = np.sum(hits.normals * hits.w_in, axis=1)
+        reflected_directions = 2.0 * cos_theta_i[:, None] * hits.normals - hits.w_in
+        return ShadingSampleBatch(
+            brdf=np.tile(np.asarray(self.ks, dtype=np.float64), (len(hits), 1)),
+            w=reflected_directions,
+            is_valid=np.ones(len(hits), dtype=bool)
+        )
+
     def evaluate_specular_refraction(self, hit_record: 'HitRecord') -> ShadingSample:
         return ShadingSample.make_empty()
@@ -4,7 +4,7 @@ from pytracer.materials.material import Material
 import numpy as np
 
 from pytracer.math.vec3 import Vec3
-from pytracer.shading_sample import ShadingSample
+from pytracer.shading_sample import ShadingSample, ShadingSampleBatch
 
 
 class RefractiveMaterial(Material):
@@ -45,13 +45,52 @@ class RefractiveMaterial(Material):
             x = 1.0 - cos_theta_i
             return r0 + (1.0 - r0) * math.pow(x, 5.0)
 
-        cos_theta_t = np.sqrt(1.0 - sin_sq_theta_t)
+        cos_theta_t = math.sqrt(1.0 - sin_sq_theta_t)
         x = 1.0 - cos_theta_t
         return r0 + (1.0 - r0) * math.pow(x, 5.0)
 
+    def refraction_setup_batch(self, hits: 'HitBatch') -> tuple:
+        """
+        Vectorized common part of fresnel_factor and evaluate_specular_refraction.
+
+        @return (w_in, normal, n1, n2, cos_theta_i, sin_sq_theta_t) where the
+          normal points to the side of the incident ray.
+        """
+
+        w_in = -hits.w_in
+        w_in = w_in / np.linalg.norm(w_in, axis=1, keepdims=True)
+
+        # leaves material
+        is_leaving = np.sum(hits.normals * hits.w_in, axis=1) <= 0.0
+        n1 = np.where(is_leaving, self.refraction_index, 1.0)
+        n2 = np.where(is_leaving, 1.0, self.refraction_index)
+        normal = np.where(is_leaving[:, None], -hits.normals, hits.normals)
+
+        cos_theta_i = -np.sum(w_in * normal, axis=1)
+        phase_velocity = n1 / n2
+        sin_sq_theta_t = phase_velocity ** 2.0 * (1.0 - cos_theta_i ** 2.0)
+
+        return w_in, normal, n1, n2, cos_theta_i, sin_sq_theta_t
+
+    def fresnel_factor_batch(self, hits: 'HitBatch') -> np.ndarray:
+        _, _, n1, n2, cos_theta_i, sin_sq_theta_t = self.refraction_setup_batch(hits)
+
+        r0 = ((n1 - n2) / (n1 + n2)) ** 2.0
+        cos_theta_t = np.sqrt(np.maximum(1.0 - sin_sq_theta_t, 0.0))
+        x = np.where(n1 <= n2, 1.0 - cos_theta_i, 1.0 - cos_theta_t)
+        r = r0 + (1.0 - r0) * x ** 5.0
+
+        return np.where(sin_sq_theta_t > 1.0, 1.0, r)
+
     def evaluate_brdf(self, hit_record: 'HitRecord', w_out: Vec3, w_in: Vec3) -> Vec3:
         return Vec3.zero()
 
+    def evaluate_albedo(self, hit_record: 'HitRecord') -> Vec3:
+        return Vec3.from_other(self.ks)
+
+    def evaluate_albedo_batch(self, hits: 'HitBatch') -> np.ndarray:
+        return np.tile(np.asarray(self.ks, dtype=np.float64), (len(hits), 1))
+
     def evaluate_emission(self, hit_record: 'HitRecord', w_out: Vec3) -> Vec3:
         return Vec3.zero()
 
@@ -98,7 +137,7 @@ class RefractiveMaterial(Material):
 
         refracted_direction = phase_velocity * Vec3.from_other(w_in)
 
-        scaled_normal = (phase_velocity * cos_theta_i - np.sqrt(1.0 - sin_sq_theta_t)) * normal
+        scaled_normal = (phase_velocity * cos_theta_i - math.sqrt(1.0 - sin_sq_theta_t)) * normal
         refracted_direction = refracted_direction + scaled_normal
 
         r = self.fresnel_factor(hit_record)
@@ -111,3 +150,26 @@ class RefractiveMaterial(Material):
             is_specular=True,
             p=r
         )
+
+    def evaluate_specular_reflection_batch(self, hits: 'HitBatch') -> ShadingSampleBatch:
+        cos_theta_i = np.sum(hits.normals * hits.w_in, axis=1)
+        reflected_directions = 2.0 * cos_theta_i[:, None] * hits.normals - hits.w_in
+        r = self.fresnel_factor_batch(hits)
+        return ShadingSampleBatch(
+            brdf=np.repeat(r[:, None], 3, axis=1),
+            w=reflected_directions,
+            is_valid=np.ones(len(hits), dtype=bool)
+        )
+
+    def evaluate_specular_refraction_batch(self, hits: 'HitBatch') -> ShadingSampleBatch:
+        w_in, normal, n1, n2, cos_theta_i, sin_sq_theta_t = self.refraction_setup_batch(hits)
+        phase_velocity = n1 / n2
+        is_valid = sin_sq_theta_t <= 1.0
+
+        scale = phase_velocity * cos_theta_i - np.sqrt(np.maximum(1.0 - sin_sq_theta_t, 0.0))
+        refracted_directions = phase_velocity[:, None] * w_in + scale[:, None] * normal
+
+        r = self.fresnel_factor_batch(hits)
+        brdf = (1.0 - r)[:, None] * np.asarray(self.ks, dtype=np.float64)
+
+        return ShadingSampleBatch(brdf=brdf, w=refracted_directions, is_valid=is_valid)
@@ -1,15 +1,45 @@
+import math
+
 import numpy as np
 
 
-class Vec3(np.ndarray):
-    def __new__(cls, *args):
-        x, y, z, *_ = args
-        return np.asarray([x, y, z]).view(cls)
+class Vec3:
+    """
+    Three component float vector used by the scalar (one ray at a time) code.
+
+    The components are plain Python floats stored in slots, which makes the
+    per-ray arithmetic much cheaper than dispatching every 3-element
+    operation to numpy. Vectors convert to and from numpy arrays, such that
+    the batch code keeps working:
+
+      np.asarray(v)            (3,) float64 array, see Vec3.to_array
+      Vec3.from_other(array)   vector of the first three components of any sequence
+      Vec3.from_array(array)   same for arrays, e.g. a row of a (N, 3) batch array
+
+    Arithmetic with a numpy array yields a numpy array. Numpy ufuncs cannot be
+    applied to vectors directly (see __array_ufunc__), use the methods or
+    convert the vector first.
+    """
+
+    __slots__ = ("x", "y", "z")
+
+    # numpy defers binary operators with numpy scalars, e.g. np.float64(2.0) * v, to Vec3
+    __array_ufunc__ = None
+
+    def __init__(self, x, y, z, *_):
+        self.x = float(x)
+        self.y = float(y)
+        self.z = float(z)
 
     @classmethod
-    def from_other(cls, other: np.ndarray) -> 'Vec3':
+    def from_other(cls, other) -> 'Vec3':
         return Vec3(*other)
 
+    @classmethod
+    def from_array(cls, array: np.ndarray) -> 'Vec3':
+        x, y, z = array.tolist()[:3]
+        return Vec3(x, y, z)
+
     @classmethod
     def zero(cls) -> 'Vec3':
         return Vec3(0.0, 0.0, 0.0)
@@ -18,18 +48,143 @@ class Vec3(np.ndarray):
     def one(cls) -> 'Vec3':
         return Vec3(1.0, 1.0, 1.0)
 
+    def to_array(self, dtype=np.float64) -> np.ndarray:
+        return np.array((self.x, self.y, self.z), dtype=dtype)
+
+    def tolist(self) -> list:
+        return [self.x, self.y, self.z]
+
+    def copy(self) -> 'Vec3':
+        return Vec3(self.x, self.y, self.z)
+
+    def __array__(self, dtype=None) -> np.ndarray:
+        return self.to_array(np.float64 if dtype is None else dtype)
+
+    def __iter__(self):
+        return iter((self.x, self.y, self.z))
+
+    def __len__(self) -> int:
+        return 3
+
+    def __getitem__(self, index):
+        return (self.x, self.y, self.z)[index]
+
+    def __repr__(self) -> str:
+        return f"Vec3({self.x}, {self.y}, {self.z})"
+
+    def __eq__(self, other) -> bool:
+        if other.__class__ is not Vec3:
+            return NotImplemented
+
+        return self.x == other.x and self.y == other.y and self.z == other.z
+
+    __hash__ = None
+
+    def __getstate__(self) -> tuple:
+        return self.x, self.y, self.z
+
+    def __setstate__(self, state: tuple) -> None:
+        self.x, self.y, self.z = state
+
+    def __neg__(self) -> 'Vec3':
+        return Vec3(-self.x, -self.y, -self.z)
+
+    def __abs__(self) -> 'Vec3':
+        return Vec3(abs(self.x), abs(self.y), abs(self.z))
+
+    def __add__(self, other):
+        if other.__class__ is Vec3:
+            return Vec3(self.x + other.x, self.y + other.y, self.z + other.z)
+        if isinstance(other, np.ndarray):
+            return self.to_array() + other
+
+        other = float(other)
+        return Vec3(self.x + other, self.y + other, self.z + other)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if other.__class__ is Vec3:
+            return Vec3(self.x - other.x, self.y - other.y, self.z - other.z)
+        if isinstance(other, np.ndarray):
+            return self.to_array() - other
+
+        other = float(other)
+        return Vec3(self.x - other, self.y - other, self.z - other)
+
+    def __rsub__(self, other):
+        if isinstance(other, np.ndarray):
+            return other - self.to_array()
+
+        other = float(other)
+        return Vec3(other - self.x, other - self.y, other - self.z)
+
+    def __mul__(self, other):
+        """
+        Component-wise product with a vector, scaling with a scalar.
+        """
+
+        if other.__class__ is Vec3:
+            return Vec3(self.x * other.x, self.y * other.y, self.z * other.z)
+        if isinstance(other, np.ndarray):
+            return self.to_array() * other
+
+        other = float(other)
+        return Vec3(self.x * other, self.y * other, self.z * other)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        if other.__class__ is Vec3:
+            return Vec3(self.x / other.x, self.y / other.y, self.z / other.z)
+        if isinstance(other, np.ndarray):
+            return self.to_array() / other
+
+        other = 1.0 / float(other)
+        return Vec3(self.x * other, self.y * other, self.z * other)
+
+    def __rtruediv__(self, other):
+        if isinstance(other, np.ndarray):
+            return other / self.to_array()
+
+        other = float(other)
+        return Vec3(other / self.x, other / self.y, other / self.z)
+
+    def dot(self, other) -> float:
+        if other.__class__ is not Vec3:
+            other = Vec3.from_other(other)
+
+        return self.x * other.x + self.y * other.y + self.z * other.z
+
     def dotted(self) -> float:
-        return self.dot(self)
+        return self.x * self.x + self.y * self.y + self.z * self.z
+
+    def length(self) -> float:
+        return math.sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
 
-    def reflected_on(self, normal: 'Vec3') -> 'Vec':
-        cos_theta_i = normal.dot(self)
-        return 2.0 * cos_theta_i * normal - self
+    def reflected_on(self, normal: 'Vec3') -> 'Vec3':
+        cos_theta_i = 2.0 * (normal.x * self.x + normal.y * self.y + normal.z * self.z)
+        return Vec3(cos_theta_i * normal.x - self.x, cos_theta_i * normal.y - self.y, cos_theta_i * normal.z - self.z)
 
     def incident_direction(self) -> 'Vec3':
-        return -Vec3(*self).normalized()
+        inv_length = -self.inverse_length()
+        return Vec3(self.x * inv_length, self.y * inv_length, self.z * inv_length)
 
     def cross(self, other: 'Vec3') -> 'Vec3':
-        return Vec3(*np.cross(self, other))
+        return Vec3(
+            self.y * other.z - self.z * other.y,
+            self.z * other.x - self.x * other.z,
+            self.x * other.y - self.y * other.x
+        )
+
+    def inverse_length(self) -> float:
+        """
+        @return 1 / length of this vector, nan for the zero vector
+        """
+
+        length = math.sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
+        return 1.0 / length if length > 0.0 else math.nan
 
     def normalized(self) -> 'Vec3':
-        return Vec3(*self / np.linalg.norm(self))
+        inv_length = self.inverse_length()
+        return Vec3(self.x * inv_length, self.y * inv_length, self.z * inv_length)
@@ -0,0 +1,21 @@
+import numpy as np
+
+
+class RandomSampler:
+    """
+    Uniformly distributed random samples. The random generator is seeded
+    separately in every process the sampler is used in, such that the render
+    workers do not draw the same samples.
+    """
+
+    def __init__(self):
+        self.rng = None
+
+    def __getstate__(self) -> dict:
+        return {"rng": None}
+
+    def make_sample(self, _n: int, d: int) -> list:
+        if self.rng is None:
+            self.rng = np.random.default_rng()
+
+        return self.rng.random((_n, d)).tolist()
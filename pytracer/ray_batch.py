@@ -0,0 +1,65 @@
+import numpy as np
+
+from pytracer.math.vec3 import Vec3
+from pytracer.ray import Ray
+
+
+class RayBatch:
+    """
+    Structure-of-arrays representation of many rays: the k-th ray starts at
+    origins[k] and points along directions[k].
+    """
+
+    def __init__(self,
+                 origins: np.ndarray,
+                 directions: np.ndarray,
+                 pixel_indices: np.ndarray,
+                 bounces: np.ndarray = None):
+        """
+        @param origins (N, 3) float array of ray origins
+        @param directions (N, 3) float array of ray directions
+        @param pixel_indices (N,) int array, flat index (row * width + column) of the pixel a ray contributes to
+        @param bounces (N,) int array, number of bounces a ray has already taken. Zero by default.
+        """
+
+        self.origins = origins
+        self.directions = directions
+        self.pixel_indices = pixel_indices
+        self.bounces = bounces if bounces is not None else np.zeros(len(pixel_indices), dtype=np.int32)
+
+    @classmethod
+    def make_empty(cls) -> 'RayBatch':
+        return RayBatch(
+            origins=np.zeros((0, 3)),
+            directions=np.zeros((0, 3)),
+            pixel_indices=np.zeros(0, dtype=np.int64)
+        )
+
+    def __len__(self) -> int:
+        return len(self.pixel_indices)
+
+    def select(self, mask: np.ndarray) -> 'RayBatch':
+        """
+        @param mask boolean mask or index array selecting the rays to keep
+        @return a compacted batch that only contains the selected rays
+        """
+
+        return RayBatch(
+            origins=self.origins[mask],
+            directions=self.directions[mask],
+            pixel_indices=self.pixel_indices[mask],
+            bounces=self.bounces[mask]
+        )
+
+    def ray_at(self, k: int) -> Ray:
+        """
+        @param k index of a ray in this batch
+        @return the k-th ray of this batch as a regular Ray
+        """
+
+        return Ray(
+            origin=Vec3.from_array(self.origins[k]),
+            direction=Vec3.from_array(self.directions[k]),
+            perturbate=False,
+            bounces=int(self.bounces[k])
+        )
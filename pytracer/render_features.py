@@ -0,0 +1,446 @@
+"""
+The optional features of Renderer.render. Every feature validates its options
+when it is created, sets up its buffers and has hooks that the pass loop of
+the renderer calls at the start of the render, for every pass and at the end.
+A disabled feature keeps its hooks as no-ops, such that the loop does not need
+to check which features are enabled.
+"""
+
+import logging
+import time
+
+import numpy as np
+
+from multiprocessing import Pool
+from typing import TYPE_CHECKING
+
+from pytracer.aov_buffer import AovBuffer
+from pytracer.checkpoint import Checkpoint
+from pytracer.cost_buffer import CostBuffer
+from pytracer.framebuffer import Framebuffer
+from pytracer.gbuffer import GBuffer
+from pytracer.image_writer import ImageWriter
+from pytracer.integrators.whitted_integrator import WhittedIntegrator
+from pytracer.render_statistics import RenderStatistics
+from pytracer.render_task import RenderTask
+
+if TYPE_CHECKING:
+    from pytracer.renderer import Renderer
+
+CHECKPOINT_INTERVAL = 60.0
+
+# samples per pixel taken before adaptive sampling starts to skip pixels
+MIN_ADAPTIVE_SPP = 4
+
+# tile orders, see CostScheduling
+SCHEDULES = ("morton", "cost")
+
+# the cost estimation pre-pass samples one pixel of every PREPASS_STRIDE x PREPASS_STRIDE block
+PREPASS_STRIDE = 8
+
+# cost-aware scheduling splits tiles until every tile has at most 1 / (TASKS_PER_THREAD * threads) of the cost
+TASKS_PER_THREAD = 4
+MIN_TILE_SIZE = 4
+
+# a preview takes the first pass on the pixels whose row and column are multiples of these strides, one after another
+PREVIEW_STRIDES = (4, 2, 1)
+
+
+class Checkpointing:
+    """
+    Writes a checkpoint at the end of a pass whenever the checkpoint interval
+    has passed since the last one and after the last pass, see Checkpoint.
+    Without a checkpoint interval and resume the framebuffer is kept in shared
+    memory only.
+    """
+
+    def __init__(self, renderer: 'Renderer', interval: float = None, resume: bool = False, crop: tuple = None):
+        """
+        @param interval minimal number of seconds between two checkpoints, see Renderer.render
+        @param resume continue from the last checkpoint, checkpoints every CHECKPOINT_INTERVAL seconds by default
+        @param crop cropped renders write no checkpoints, such that a later resume of the whole image
+          does not pick up a partial framebuffer
+        @raise ValueError if checkpoints are combined with a crop window
+        """
+
+        if crop is not None and (resume or interval is not None):
+            raise ValueError("Cropped renders write no checkpoints, crop cannot be combined with resume "
+                             "or a checkpoint interval")
+
+        self.renderer = renderer
+        self.interval = CHECKPOINT_INTERVAL if resume and interval is None else interval
+        self.resume = resume
+        self.checkpoint = None
+        if self.interval is not None:
+            self.checkpoint = Checkpoint(renderer.output_filepath(f"{renderer.output_filename}.checkpoint"),
+                                         renderer.scene)
+
+        self.checkpointed_spp = 0
+        self.last_checkpoint_time = time.time()
+
+    def open_framebuffer(self) -> tuple:
+        """
+        @return (framebuffer, spp) the framebuffer to render into and the samples per pixel it already contains
+        """
+
+        width, height = self.renderer.width, self.renderer.height
+        framebuffer, self.checkpointed_spp = Framebuffer(width, height), 0
+        if self.checkpoint is not None:
+            framebuffer, self.checkpointed_spp = self.checkpoint.open_framebuffer(width, height, self.resume)
+
+        self.last_checkpoint_time = time.time()
+        return framebuffer, self.checkpointed_spp
+
+    def end_pass(self, framebuffer: Framebuffer, spp: int, statistics: RenderStatistics) -> None:
+        if self.checkpoint is not None and time.time() - self.last_checkpoint_time >= self.interval:
+            self.save(framebuffer, spp, statistics)
+
+    def finish(self, framebuffer: Framebuffer, spp: int, statistics: RenderStatistics) -> None:
+        if self.checkpoint is not None and self.checkpointed_spp != spp:
+            self.save(framebuffer, spp, statistics)
+
+    def save(self, framebuffer: Framebuffer, spp: int, statistics: RenderStatistics) -> None:
+        start_time = time.perf_counter()
+        framebuffer.flush()
+        self.checkpoint.save(framebuffer, spp)
+        logging.info(f"Wrote checkpoint with {spp} samples per pixel")
+        statistics.add_time("output", time.perf_counter() - start_time)
+
+        self.checkpointed_spp = spp
+        self.last_checkpoint_time = time.time()
+
+
+class AdaptiveSampling:
+    """
+    With a noise threshold, passes after MIN_ADAPTIVE_SPP samples per pixel only
+    sample the pixels whose relative error is still above the threshold and skip
+    tiles without such pixels, see Framebuffer.relative_errors.
+    """
+
+    def __init__(self, noise_threshold: float = None):
+        """
+        @param noise_threshold target relative error per pixel, every pixel gets all samples by default
+        """
+
+        self.noise_threshold = noise_threshold
+
+    def pass_tiles(self, framebuffer: Framebuffer, tiles: list, completed_spp: int) -> tuple:
+        """
+        @param completed_spp samples per pixel taken by the previous passes
+        @return (tiles, noise_threshold) the tiles the next pass samples and the noise threshold of its tasks.
+          No tiles once all pixels are below the threshold.
+        """
+
+        if self.noise_threshold is None or completed_spp < MIN_ADAPTIVE_SPP:
+            return tiles, None
+
+        is_noisy = framebuffer.relative_errors() > self.noise_threshold
+        tiles = [tile for tile in tiles if is_noisy[tile[0]:tile[1], tile[2]:tile[3]].any()]
+        if len(tiles) == 0:
+            logging.info(f"All pixels are below the noise threshold after {completed_spp} samples per pixel")
+
+        return tiles, self.noise_threshold
+
+    def finish(self, framebuffer: Framebuffer, pixel_count: int, spp: int) -> None:
+        """
+        @param pixel_count number of rendered pixels
+        @param spp maximal samples per pixel
+        """
+
+        if self.noise_threshold is not None:
+            sample_count = framebuffer.sample_count()
+            logging.info(f"Adaptive sampling took {sample_count} samples, "
+                         f"{100 * sample_count / max(pixel_count * spp, 1):.1f}% of {spp} samples per pixel")
+
+
+class CostScheduling:
+    """
+    Records the seconds and rays spent on every pixel, see CostBuffer, and
+    writes them to output/<output_filename>.cost.npz and as heatmap to
+    output/<output_filename>.cost.png. The 'cost' schedule orders the tiles by
+    their estimated cost, see schedule_tiles.
+    """
+
+    def __init__(self, renderer: 'Renderer', record_costs: bool = False, schedule: str = "morton"):
+        """
+        @param record_costs write the measured costs
+        @param schedule one of SCHEDULES, see Renderer.render
+        @raise ValueError for an unknown schedule
+        """
+
+        if schedule not in SCHEDULES:
+            raise ValueError(f"Unknown schedule '{schedule}', expected one of {SCHEDULES}")
+
+        self.renderer = renderer
+        self.record_costs = record_costs
+        self.schedule = schedule
+        self.cost_buffer = None
+        if record_costs or schedule == "cost":
+            self.cost_buffer = CostBuffer(renderer.width, renderer.height)
+
+        self.task_count = 1
+
+    @property
+    def cost_filepath(self) -> str:
+        return self.renderer.output_filepath(f"{self.renderer.output_filename}.cost")
+
+    @staticmethod
+    def schedule_tiles(tiles: list, pixel_costs: np.ndarray, task_count: int) -> list:
+        """
+        Order tiles by their estimated cost, most expensive first, such that the
+        expensive work starts early and cheap tiles fill up the threads at the
+        end of a pass. Tiles costing more than 1 / task_count of the image are
+        split in halves along their longer side first, down to MIN_TILE_SIZE.
+
+        @param tiles as returned by Renderer.compute_tiles
+        @param pixel_costs (height, width) estimated cost of every pixel, e.g. CostBuffer.estimate
+        @param task_count the number of tasks the cost of the image should at least be spread over
+        @return list of (row_begin, row_end, col_begin, col_end) tuples
+        """
+
+        # summed-area table, the cost of any tile is the sum of four entries
+        height, width = pixel_costs.shape
+        table = np.zeros((height + 1, width + 1))
+        table[1:, 1:] = pixel_costs.cumsum(axis=0).cumsum(axis=1)
+
+        def tile_cost(tile: tuple) -> float:
+            row_begin, row_end, col_begin, col_end = tile
+            return table[row_end, col_end] - table[row_begin, col_end] - table[row_end, col_begin] + table[row_begin, col_begin]
+
+        max_cost = table[height, width] / max(task_count, 1)
+
+        def split(tile: tuple) -> list:
+            row_begin, row_end, col_begin, col_end = tile
+            cost = tile_cost(tile)
+            if cost <= max_cost or max(row_end - row_begin, col_end - col_begin) <= MIN_TILE_SIZE:
+                return [(cost, tile)]
+
+            if row_end - row_begin >= col_end - col_begin:
+                row_mid = (row_begin + row_end) // 2
+                halves = [(row_begin, row_mid, col_begin, col_end), (row_mid, row_end, col_begin, col_end)]
+            else:
+                col_mid = (col_begin + col_end) // 2
+                halves = [(row_begin, row_end, col_begin, col_mid), (row_begin, row_end, col_mid, col_end)]
+
+            return split(halves[0]) + split(halves[1])
+
+        scheduled_tiles = [scheduled_tile for tile in tiles for scheduled_tile in split(tile)]
+        scheduled_tiles.sort(key=lambda scheduled_tile: -scheduled_tile[0])
+        return [tile for _, tile in scheduled_tiles]
+
+    def start(self, pool: Pool, tiles: list, thread_count: int, statistics: RenderStatistics) -> list:
+        """
+        The costs are taken from output/<output_filename>.cost.npz of a previous render of the scene at the same
+        size or from a low resolution pre-pass, see estimate_costs.
+
+        @param tiles as returned by Renderer.compute_tiles
+        @param thread_count number of threads of the pool
+        @return the tiles of the first pass
+        """
+
+        if self.schedule != "cost":
+            return tiles
+
+        self.task_count = thread_count * TASKS_PER_THREAD
+        pixel_costs = CostBuffer.load_estimate(f"{self.cost_filepath}.npz", self.renderer.width,
+                                               self.renderer.height, self.renderer.scene.filepath)
+        if pixel_costs is None:
+            pixel_costs = self.estimate_costs(pool, tiles, statistics)
+        else:
+            logging.info("Scheduling the tiles with the pixel costs of the previous render")
+
+        scheduled_tiles = self.schedule_tiles(tiles, pixel_costs, self.task_count)
+        logging.info(f"Scheduled {len(scheduled_tiles)} tiles by their estimated cost")
+        return scheduled_tiles
+
+    def estimate_costs(self, pool: Pool, tiles: list, statistics: RenderStatistics) -> np.ndarray:
+        """
+        Pre-pass that traces one sample of every PREPASS_STRIDE-th pixel of every
+        PREPASS_STRIDE-th row and measures their costs. The samples are not added
+        to the image.
+
+        @return (height, width) estimated seconds per sample of every pixel
+        """
+
+        start_time = time.time()
+        tasks = [RenderTask(tile=tile, width=self.renderer.width, spp=1, stride=PREPASS_STRIDE, accumulate=False)
+                 for tile in tiles]
+        self.renderer.run_tasks(pool, tasks, statistics)
+
+        pixel_costs = self.cost_buffer.estimate(PREPASS_STRIDE)
+        self.cost_buffer.reset()
+        logging.info(f"Estimated the pixel costs with a 1/{PREPASS_STRIDE ** 2} pre-pass in {time.time() - start_time} seconds")
+        return pixel_costs
+
+    def end_pass(self, tiles: list, image_tiles: list) -> list:
+        """
+        @param tiles the tiles of the finished pass
+        @param image_tiles as returned by Renderer.compute_tiles
+        @return the tiles of the next pass, scheduled with the measured costs
+        """
+
+        if self.schedule != "cost":
+            return tiles
+
+        return self.schedule_tiles(image_tiles, self.cost_buffer.estimate(), self.task_count)
+
+    def finish(self) -> None:
+        if self.cost_buffer is None:
+            return
+
+        self.cost_buffer.save(f"{self.cost_filepath}.npz", self.renderer.scene.filepath)
+        if self.record_costs:
+            ImageWriter.write_heatmap(f"{self.cost_filepath}.png", self.cost_buffer.per_sample()[..., 0])
+            logging.info(f"Wrote cost heatmap {self.cost_filepath}.png")
+
+
+class GBufferCache:
+    """
+    Keeps the primary hits in output/<output_filename>.gbuffer, such that a render of the scene with changed
+    materials or light sources only shades the affected samples again, see GBuffer.
+    """
+
+    def __init__(self, renderer: 'Renderer', use_gbuffer: bool, spp: int, noise_threshold: float = None,
+                 resume: bool = False, crop: tuple = None):
+        """
+        @param use_gbuffer keep the G-buffer, disabled otherwise
+        @param spp samples per pixel of the render
+        @raise ValueError if the scene has no whitted integrator or the render does not take every sample
+          of every pixel, i.e. with adaptive sampling, resume or a crop window
+        """
+
+        if use_gbuffer and not isinstance(renderer.scene.integrator, WhittedIntegrator):
+            raise ValueError("The G-buffer needs a whitted integrator")
+        if use_gbuffer and (noise_threshold is not None or resume or crop is not None):
+            raise ValueError("The G-buffer needs all samples of a render, it cannot be combined with adaptive sampling, "
+                             "resume or crop")
+
+        self.renderer = renderer
+        self.use_gbuffer = use_gbuffer
+        self.spp = spp
+        self.gbuffer = None
+
+    def open(self) -> None:
+        if self.use_gbuffer:
+            self.gbuffer = GBuffer(self.renderer.output_filepath(f"{self.renderer.output_filename}.gbuffer"),
+                                   self.renderer.width, self.renderer.height, self.spp)
+            self.gbuffer.open(self.renderer.scene)
+
+    def finish(self) -> None:
+        if self.gbuffer is not None:
+            self.gbuffer.save_state()
+
+
+class AovOutput:
+    """
+    Collects output variables of the primary hits while rendering, see AovBuffer,
+    and writes them next to the image, see Renderer.write_aovs.
+    """
+
+    def __init__(self, renderer: 'Renderer', names: tuple = (), resume: bool = False):
+        """
+        @param names output variables to write, see AovBuffer.AOVS
+        @param resume AOVs are not kept in checkpoints
+        @raise ValueError for unknown names or if AOVs are combined with resume
+        """
+
+        unknown_names = [name for name in names if name not in AovBuffer.AOVS]
+        if unknown_names:
+            raise ValueError(f"Unknown AOVs {', '.join(unknown_names)}, expected some of {', '.join(AovBuffer.AOVS)}")
+        if names and resume:
+            raise ValueError("AOVs are not kept in checkpoints, they cannot be combined with resume")
+
+        self.renderer = renderer
+        self.names = tuple(names)
+        self.aov_buffer = AovBuffer(renderer.width, renderer.height) if self.names else None
+
+    def finish(self, window: tuple, statistics: RenderStatistics) -> None:
+        """
+        @param window (x0, y0, x1, y1) rendered part of the image, see Renderer.crop_window
+        """
+
+        if self.aov_buffer is not None:
+            statistics.add_time("output", self.renderer.write_aovs(self.renderer.output_filename, self.aov_buffer,
+                                                                   self.names, window))
+
+
+class Preview:
+    """
+    Takes the first pass of a render level by level of PREVIEW_STRIDES and
+    writes an image after each of them, as well as after every later pass,
+    see first_pass. The final image is the same.
+    """
+
+    def __init__(self, renderer: 'Renderer', enabled: bool, window: tuple):
+        """
+        @param enabled write previews, disabled otherwise
+        @param window (x0, y0, x1, y1) rendered part of the image, see Renderer.crop_window
+        """
+
+        self.renderer = renderer
+        self.enabled = enabled
+        self.window = window
+
+    @staticmethod
+    def preview_image(radiance: np.ndarray, window: tuple, stride: int) -> np.ndarray:
+        """
+        @param radiance (height, width, 3) radiance of the image
+        @param window (x0, y0, x1, y1) rendered part of the image, see Renderer.crop_window
+        @param stride only the pixels whose row and column are multiples of stride are sampled
+        @return the radiance of the window, every pixel takes the radiance of the closest sampled
+          pixel above and to the left of it
+        """
+
+        x0, y0, x1, y1 = window
+        rows = np.arange(y0, y1)
+        cols = np.arange(x0, x1)
+        sampled_rows = rows[rows % stride == 0]
+        sampled_cols = cols[cols % stride == 0]
+        if len(sampled_rows) == 0 or len(sampled_cols) == 0:
+            return radiance[y0:y1, x0:x1]
+
+        row_indices = np.maximum(np.searchsorted(sampled_rows, rows, side="right") - 1, 0)
+        col_indices = np.maximum(np.searchsorted(sampled_cols, cols, side="right") - 1, 0)
+        return radiance[np.ix_(sampled_rows[row_indices], sampled_cols[col_indices])]
+
+    def first_pass(self, pool: Pool, framebuffer: Framebuffer, tiles: list, spp: int, sample_offset: int,
+                   start_time: float, statistics: RenderStatistics) -> int:
+        """
+        Every level samples the pixels whose row and column are multiples of its stride that no previous
+        level sampled, and writes an image in which every pixel shows the closest sampled pixel, see
+        preview_image. After the last level every pixel has spp samples, exactly like after a regular pass.
+
+        @param tiles the tiles of the pass, see Renderer.compute_tiles
+        @param spp samples per pixel of the pass
+        @param sample_offset samples per pixel taken before the pass
+        @param start_time time the render started, to log the time until each preview
+        @return the samples per pixel taken, 0 without previews
+        """
+
+        if not self.enabled:
+            return 0
+
+        previous_stride = None
+        for stride in PREVIEW_STRIDES:
+            tasks = [RenderTask(tile=tile, width=self.renderer.width, spp=spp, stride=stride,
+                                skip_stride=previous_stride, sample_offset=sample_offset)
+                     for tile in tiles]
+            self.renderer.run_tasks(pool, tasks, statistics)
+
+            logging.info(f"Rendered the 1/{stride ** 2} preview after {time.time() - start_time} seconds")
+            if stride > 1:
+                statistics.add_time("output", self.renderer.write_image(
+                    self.renderer.output_filename, self.preview_image(framebuffer.radiance(), self.window, stride)))
+            previous_stride = stride
+
+        return spp
+
+    def end_pass(self, framebuffer: Framebuffer, is_last: bool, statistics: RenderStatistics) -> None:
+        """
+        @param is_last the final image is written by the renderer after the last pass
+        """
+
+        if self.enabled and not is_last:
+            x0, y0, x1, y1 = self.window
+            statistics.add_time("output", self.renderer.write_image(self.renderer.output_filename,
+                                                                    framebuffer.radiance()[y0:y1, x0:x1]))
@@ -0,0 +1,108 @@
+import json
+import logging
+
+from typing import Optional
+
+
+class RenderStatistics:
+    """
+    Opt-in counters and timers of the hot paths of a render.
+
+    Every process has its own instance, STATISTICS, which the tracing code
+    updates only if it is enabled:
+
+        if STATISTICS.enabled:
+            STATISTICS.count("shadow_rays")
+
+    such that a disabled instance costs one attribute lookup per call site.
+    Counts are accumulated per traversal or per batch where possible, not per
+    node or per primitive.
+
+    Counters:
+      + primary_rays, shadow_rays, reflection_rays, refraction_rays: traced rays by kind
+      + intersection_tests: ray-item tests done by the containers. A ray tested
+        against a mesh counts once plus once per tested triangle of the mesh.
+      + bvh_node_visits: (ray, node) box tests of the hierarchy traversals
+      + material_evaluations: BRDF and specular sample evaluations
+
+    Timers in seconds, summed over all processes:
+      + generate: camera ray generation
+      + intersect: closest hit and occlusion queries
+      + shade: integrator time that is not spent in intersect
+      + output: accumulation into the framebuffer, checkpoints and image files
+    """
+
+    COUNTERS = (
+        "primary_rays",
+        "shadow_rays",
+        "reflection_rays",
+        "refraction_rays",
+        "intersection_tests",
+        "bvh_node_visits",
+        "material_evaluations"
+    )
+
+    TIMERS = ("generate", "intersect", "shade", "output")
+
+    def __init__(self):
+        self.enabled = False
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.timers = dict.fromkeys(self.TIMERS, 0.0)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] += int(amount)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        self.timers[name] += seconds
+
+    def reset(self) -> None:
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.timers = dict.fromkeys(self.TIMERS, 0.0)
+
+    def to_dict(self) -> dict:
+        return {"counters": dict(self.counters), "timers": dict(self.timers)}
+
+    def pop(self) -> Optional[dict]:
+        """
+        @return the statistics collected since the last call, None if disabled.
+          Used by the workers to hand their statistics of a task to the parent.
+        """
+
+        if not self.enabled:
+            return None
+
+        statistics = self.to_dict()
+        self.reset()
+        return statistics
+
+    def merge(self, statistics: Optional[dict]) -> None:
+        """
+        @param statistics as returned by to_dict or pop, None is ignored
+        """
+
+        if statistics is None:
+            return
+
+        for name, value in statistics["counters"].items():
+            self.counters[name] += value
+        for name, value in statistics["timers"].items():
+            self.timers[name] += value
+
+    def log(self) -> None:
+        for name in self.COUNTERS:
+            logging.info(f"  {name}: {self.counters[name]:,}")
+        for name in self.TIMERS:
+            logging.info(f"  {name}: {self.timers[name]:.3f} seconds")
+
+    def save(self, filepath: str, metadata: dict = None) -> None:
+        """
+        @param filepath JSON file
+        @param metadata additional entries of the JSON object, e.g. the resolution
+        """
+
+        with open(filepath, "w") as file:
+            json.dump({**(metadata or {}), **self.to_dict()}, file, indent=2)
+
+
+# statistics of the current process
+STATISTICS = RenderStatistics()
@@ -1,14 +1,61 @@
-from pytracer import Scene
+import numpy as np
 
 
 class RenderTask:
+    """
+    A tile of the image. Tasks only describe which pixels to render, the scene
+    is shared with the workers once, see SceneSnapshot.
+    """
+
     def __init__(self,
-                 scene: Scene,
-                 indices: list,
-                 spp: int):
-
-        self.width = scene.width
-        self.height = scene.height
-        self.indices = indices
-        self.scene = scene
+                 tile: tuple,
+                 width: int,
+                 spp: int,
+                 noise_threshold: float = None,
+                 stride: int = 1,
+                 skip_stride: int = None,
+                 accumulate: bool = True,
+                 sample_offset: int = 0):
+        """
+        @param tile (row_begin, row_end, col_begin, col_end)
+        @param width image width in pixels
+        @param spp samples per pixel
+        @param noise_threshold if given, only the pixels of the tile whose relative
+          error is above this threshold are sampled, see Framebuffer.relative_errors.
+        @param stride only sample the pixels whose row and column are multiples of stride,
+          e.g. the sparse pixels of the cost estimation pre-pass
+        @param skip_stride skip the pixels whose row and column are multiples of skip_stride, e.g. the
+          pixels sampled by the previous level of a preview, see Preview.first_pass
+        @param accumulate add the samples to the framebuffer, disabled for passes that only measure costs
+        @param sample_offset index of the first sample of the task, i.e. the samples per pixel of the previous passes.
+          Identifies the samples in the G-buffer, see GBuffer.slots
+        """
+
+        self.tile = tile
+        self.width = width
         self.spp = spp
+        self.noise_threshold = noise_threshold
+        self.stride = stride
+        self.skip_stride = skip_stride
+        self.accumulate = accumulate
+        self.sample_offset = sample_offset
+
+    @property
+    def indices(self) -> np.ndarray:
+        """
+        @return flat indices (row * width + col) of all pixels in the tile, see stride and skip_stride
+        """
+
+        row_begin, row_end, col_begin, col_end = self.tile
+        rows = np.arange(row_begin, row_end)
+        cols = np.arange(col_begin, col_end)
+        if self.stride > 1:
+            rows = rows[rows % self.stride == 0]
+            cols = cols[cols % self.stride == 0]
+
+        indices = rows[:, None] * self.width + cols[None, :]
+        if self.skip_stride is not None:
+            is_skipped = (rows[:, None] % self.skip_stride == 0) & (cols[None, :] % self.skip_stride == 0)
+            return indices[~is_skipped]
+
+        return indices.ravel()
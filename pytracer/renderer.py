@@ -1,209 +1,499 @@
 import logging
 
-from PIL import Image
 import numpy as np
 import multiprocessing
 from multiprocessing import Pool
 from threading import Timer
 import time
-import random
-import ctypes
 import os
 
+from typing import Optional
+
 from pytracer import RenderTask
 from pytracer import Scene
+from pytracer.aov_buffer import AovBuffer
+from pytracer.distributed.render_coordinator import RenderCoordinator, TASK_TIMEOUT
+from pytracer.framebuffer import Framebuffer
+from pytracer.gbuffer import GBuffer
+from pytracer.image_writer import ImageWriter
+from pytracer.render_features import AdaptiveSampling, AovOutput, Checkpointing, CostScheduling, GBufferCache, Preview
+from pytracer.render_statistics import RenderStatistics, STATISTICS
+from pytracer.scene_snapshot import SceneSnapshot
+
+PIXELS_PER_BATCH = 1024
+TILE_SIZE = 32
+SPP_PER_PASS = 1
+
+
+def init_shared_state(shared_framebuffer, snapshot_name, collect_statistics=False, shared_cost_buffer=None,
+                      shared_gbuffer=None, shared_aov_buffer=None):
+    """ attach to the shared framebuffer and scene """
+
+    global framebuffer
+    global cost_buffer
+    global gbuffer
+    global aov_buffer
+
+    global scene_snapshot
+    global scene
+
+    framebuffer = shared_framebuffer
+    cost_buffer = shared_cost_buffer
+    gbuffer = shared_gbuffer
+    aov_buffer = shared_aov_buffer
+
+    scene_snapshot = SceneSnapshot.attach(snapshot_name)
+    scene = scene_snapshot.scene
+
+    STATISTICS.enabled = collect_statistics
+    STATISTICS.reset()
+
+
+def trace_pixels(scene: Scene, indices: np.ndarray, width: int, spp: int, record_costs: bool = False,
+                 gbuffer: GBuffer = None, sample_offset: int = 0, record_aovs: bool = False):
+    """
+    Trace the samples of the given pixels in chunks of PIXELS_PER_BATCH, such that
+    batched integrators can work on many rays at once while the progress is still
+    reported regularly.
+
+    @param indices flat pixel indices (row * width + col)
+    @param width image width in pixels
+    @param spp samples per pixel
+    @param record_costs measure the seconds and rays of every sample, see Integrator.integrate_batch
+    @param gbuffer integrate the samples with the G-buffer instead of the integrator of the scene, see GBuffer
+    @param sample_offset index of the first traced sample of every pixel, see RenderTask
+    @param record_aovs collect the output variables of the primary hits, see AovBuffer
+    @return generator of (rays, spectrum, costs, aovs) per chunk, costs and aovs are None unless recorded
+    """
+
+    for begin in range(0, len(indices), PIXELS_PER_BATCH):
+        chunk = indices[begin:begin + PIXELS_PER_BATCH]
+
+        #  compute 2D image lookup coordinates (rowIdx, colIdx) from 1D index value
+        rows = chunk // width
+        cols = chunk % width
+
+        start_time = time.perf_counter()
+        samples = [scene.sampler.make_sample(spp, 2) for _ in chunk]
+        rays = scene.camera.make_worldspace_rays(rows, cols, samples)
+
+        generated_time = time.perf_counter()
+        intersect_time = STATISTICS.timers["intersect"]
+        costs = np.zeros((len(rays), 2)) if record_costs else None
+        aovs = np.zeros((len(rays), AovBuffer.SAMPLE_CHANNELS)) if record_aovs else None
+        if gbuffer is None:
+            spectrum = scene.integrator.integrate_batch(rays, costs, aovs)
+        else:
+            spectrum = gbuffer.integrate(scene, rays, gbuffer.slots(rays.pixel_indices, sample_offset, spp), costs,
+                                         aovs)
+
+        if STATISTICS.enabled:
+            STATISTICS.count("primary_rays", len(rays))
+            STATISTICS.add_time("generate", generated_time - start_time)
+            intersect_time = STATISTICS.timers["intersect"] - intersect_time
+            STATISTICS.add_time("shade", time.perf_counter() - generated_time - intersect_time)
+
+        yield rays, spectrum, costs, aovs
+
+
+def render_tile(scene: Scene, render_task: RenderTask) -> np.ndarray:
+    """
+    Render a tile into a framebuffer of its own, e.g. in a process that does not share the framebuffer of the image.
+
+    @return float32 (rows, cols, Framebuffer.CHANNELS) samples of the tile, see Framebuffer
+    """
+
+    row_begin, row_end, col_begin, col_end = render_task.tile
+    tile_framebuffer = Framebuffer(col_end - col_begin, row_end - row_begin)
+    for rays, spectrum, _, _ in trace_pixels(scene, render_task.indices, render_task.width, render_task.spp):
+        integrated_time = time.perf_counter()
+        # image pixel indices to indices into the tile
+        rows = rays.pixel_indices // render_task.width - row_begin
+        cols = rays.pixel_indices % render_task.width - col_begin
+        tile_framebuffer.accumulate(rows * tile_framebuffer.width + cols, spectrum)
+
+        if STATISTICS.enabled:
+            STATISTICS.add_time("output", time.perf_counter() - integrated_time)
+
+    return tile_framebuffer.pixels
 
 
-def init_shared_state(
-        n,
-        shared_array_base_red,
-        shared_array_base_green,
-        shared_array_base_blue,
-        shared_array_base_red_count,
-        shared_array_base_green_count,
-        shared_array_base_blue_count,
-        raw_shared_status
-):
-    """ store pixels for later use """
+def compute_contribution(render_task: RenderTask) -> Optional[dict]:
+    """
+    @return the statistics of the task if they are collected, see RenderStatistics.pop
+    """
 
-    global pixels_red
-    global pixels_green
-    global pixels_blue
+    # perform actual computations here...
+    indices = render_task.indices
+    if render_task.noise_threshold is not None:
+        indices = indices[framebuffer.relative_errors(indices) > render_task.noise_threshold]
+
+    # passes that only measure costs do not touch the G-buffer and the AOVs
+    task_gbuffer = gbuffer if render_task.accumulate else None
+    record_aovs = aov_buffer is not None and render_task.accumulate
+    for rays, spectrum, costs, aovs in trace_pixels(scene, indices, render_task.width, render_task.spp,
+                                                    cost_buffer is not None, task_gbuffer, render_task.sample_offset,
+                                                    record_aovs):
+        integrated_time = time.perf_counter()
+        if render_task.accumulate:
+            framebuffer.accumulate(rays.pixel_indices, spectrum)
+        if aovs is not None:
+            aov_buffer.accumulate(rays.pixel_indices, aovs)
+        if costs is not None:
+            cost_buffer.accumulate(rays.pixel_indices, costs)
+
+        if STATISTICS.enabled:
+            STATISTICS.add_time("output", time.perf_counter() - integrated_time)
+
+    return STATISTICS.pop()
 
-    global pixel_red_count
-    global pixel_green_count
-    global pixel_blue_count
 
-    global shared_status
+class RepeatTimer(Timer):
+    def run(self):
+        while not self.finished.wait(self.interval):
+            self.function(*self.args, **self.kwargs)
 
-    pixels_red = np.ctypeslib.as_array(shared_array_base_red.get_obj())
-    pixels_green = np.ctypeslib.as_array(shared_array_base_green.get_obj())
-    pixels_blue = np.ctypeslib.as_array(shared_array_base_blue.get_obj())
 
-    pixel_red_count = np.ctypeslib.as_array(shared_array_base_red_count.get_obj())
-    pixel_green_count = np.ctypeslib.as_array(shared_array_base_green_count.get_obj())
-    pixel_blue_count = np.ctypeslib.as_array(shared_array_base_blue_count.get_obj())
+class Renderer:
+    def __init__(self, scene: Scene, output_filename: str, tone_mapping: str = "clamp", float_formats: tuple = ()):
+        """
+        @param scene the scene to render
+        @param output_filename name of the written files in the output directory, without extension
+        @param tone_mapping see ImageWriter.tone_map
+        @param float_formats additional lossless outputs of the linear radiance, see ImageWriter.FLOAT_FORMATS
+        """
 
-    shared_status = np.ctypeslib.as_array(raw_shared_status.get_obj())
-    for idx in range(n):
-        shared_status[idx] = 0
+        self.scene = scene
+        self.width = scene.width
+        self.height = scene.height
+        self.output_filename = output_filename
+        self.tone_mapping = tone_mapping
+        self.float_formats = tuple(float_formats)
+        self.statistics = None
 
+    @staticmethod
+    def morton_codes(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Interleave the bits of x and y (each less than 2^16), such that sorting
+        by the resulting code visits a grid along a Z-order curve.
+        https://en.wikipedia.org/wiki/Z-order_curve
+        """
 
-def compute_contribution(render_task: RenderTask) -> RenderTask:
-    # perform actual computations here...
-    for idx in render_task.indices:
-        samples = render_task.scene.sampler.make_sample(render_task.spp, 2)
+        def spread_bits(values: np.ndarray) -> np.ndarray:
+            values = values.astype(np.uint64) & 0xFFFF
+            values = (values | (values << np.uint64(8))) & np.uint64(0x00FF00FF)
+            values = (values | (values << np.uint64(4))) & np.uint64(0x0F0F0F0F)
+            values = (values | (values << np.uint64(2))) & np.uint64(0x33333333)
+            values = (values | (values << np.uint64(1))) & np.uint64(0x55555555)
+            return values
 
-        for sample in samples:
-            #  compute 2D image lookup coordinates (rowIdx, colIdx) from 1D index value
-            row_idx = idx // render_task.width
-            col_idx = idx % render_task.width
+        return spread_bits(x) | (spread_bits(y) << np.uint64(1))
 
-            ray = render_task.scene.camera.make_worldspace_ray(row_idx, col_idx, sample)
-            spectrum = render_task.scene.integrator.integrate(ray)
+    @staticmethod
+    def compute_tiles(width: int, height: int, tile_size: int, window: tuple = None) -> list:
+        """
+        Split the image into square tiles and order them along a Z-order curve,
+        such that consecutively rendered tiles are close to each other.
+
+        @param width image width in pixels
+        @param height image height in pixels
+        @param tile_size edge length of a tile in pixels, tiles at the border may be smaller.
+        @param window (x0, y0, x1, y1) part of the image to split, see crop_window. The whole image by default.
+        @return list of (row_begin, row_end, col_begin, col_end) tuples
+        """
 
-            pixels_red[idx] += spectrum[0]
-            pixels_green[idx] += spectrum[1]
-            pixels_blue[idx] += spectrum[2]
+        x0, y0, x1, y1 = window or (0, 0, width, height)
+        tile_rows = np.arange(0, y1 - y0, tile_size)
+        tile_cols = np.arange(0, x1 - x0, tile_size)
+        grid_rows, grid_cols = np.meshgrid(tile_rows // tile_size, tile_cols // tile_size, indexing="ij")
+        order = np.argsort(Renderer.morton_codes(grid_cols.ravel(), grid_rows.ravel()), kind="stable")
 
-            pixel_red_count[idx] += 1
-            pixel_green_count[idx] += 1
-            pixel_blue_count[idx] += 1
+        tiles = []
+        for tile_idx in order:
+            row_begin = y0 + int(grid_rows.ravel()[tile_idx]) * tile_size
+            col_begin = x0 + int(grid_cols.ravel()[tile_idx]) * tile_size
+            tiles.append((row_begin, min(row_begin + tile_size, y1), col_begin, min(col_begin + tile_size, x1)))
 
-        shared_status[idx] = 1
+        return tiles
 
-    return render_task
+    def crop_window(self, crop: tuple = None) -> tuple:
+        """
+        @param crop (x0, y0, x1, y1) pixel window of the image, x1 and y1 exclusive. The whole image by default.
+        @return the window as tuple of ints
+        @raise ValueError if the window is empty or exceeds the image
+        """
 
+        if crop is None:
+            return 0, 0, self.width, self.height
 
-class RepeatTimer(Timer):
-    def run(self):
-        while not self.finished.wait(self.interval):
-            self.function(*self.args, **self.kwargs)
+        x0, y0, x1, y1 = (int(value) for value in crop)
+        if not (0 <= x0 < x1 <= self.width and 0 <= y0 < y1 <= self.height):
+            raise ValueError(f"The crop window {x0},{y0},{x1},{y1} is empty or exceeds the "
+                             f"{self.width} x {self.height} image")
 
+        return x0, y0, x1, y1
 
-class Renderer:
-    channels = 3
+    @staticmethod
+    def frame_tasks(tiles: list, width: int, spp: int, spp_per_pass: int) -> list:
+        """
+        @param tiles as returned by compute_tiles
+        @return RenderTasks taking spp samples of every pixel, pass by pass with spp_per_pass samples per pixel
+        """
 
-    def __init__(self, scene: Scene, output_filename: str):
-        self.scene = scene
-        self.width = scene.width
-        self.height = scene.height
-        self.output_filename = output_filename
+        tasks = []
+        for completed_spp in range(0, spp, spp_per_pass):
+            pass_spp = min(spp_per_pass, spp - completed_spp)
+            tasks.extend(RenderTask(tile=tile, width=width, spp=pass_spp) for tile in tiles)
+
+        return tasks
 
     @staticmethod
-    def compute_indices_groups(index_count: int, cpu_count: int) -> np.array:
-        indices = range(index_count)
-        indices = [idx for idx in indices]
-        random.shuffle(indices)
-        return np.array_split(indices, cpu_count)
+    def output_filepath(filename: str) -> str:
+        project_root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        return os.path.join(project_root_path, 'output', filename)
+
+    def write_image(self, output_filename: str, radiance: np.ndarray) -> float:
+        """
+        @param output_filename name of the written files in the output directory, without extension
+        @param radiance (height, width, 3) linear radiance of the rendered image
+        @return the number of seconds writing took
+        """
 
-    def write_image(self, output_filename, red: list, blue: list, green: list):
         start_time = time.time()
-        img_data = np.zeros((self.height, self.width, self.channels), dtype=np.uint8)
+        filepath = self.output_filepath(output_filename)
 
-        # Set the RGB values
-        for y in range(img_data.shape[0]):
-            for x in range(img_data.shape[1]):
-                r, g, b = red[y][x], green[y][x], blue[y][x]
+        filepaths = [f"{filepath}.png"]
+        ImageWriter.write_png(filepaths[0], radiance, self.tone_mapping)
+        for float_format in self.float_formats:
+            filepaths.append(f"{filepath}.{float_format}")
+            if float_format == "pfm":
+                ImageWriter.write_pfm(filepaths[-1], radiance)
+            else:
+                ImageWriter.write_npy(filepaths[-1], radiance)
 
-                if r > 1:
-                    r = 1.0
-                if g > 1:
-                    g = 1.0
-                if b > 1:
-                    b = 1.0
+        end_time = time.time()
+        logging.info(f"Wrote image {', '.join(filepaths)} in {end_time - start_time} seconds")
+        return end_time - start_time
+
+    def write_aovs(self, output_filename: str, aov_buffer: AovBuffer, names: tuple, window: tuple = None) -> float:
+        """
+        Write every output variable as output/<output_filename>.<name>.<format> in the float formats
+        of the renderer, pfm by default.
 
-                img_data[y][x][0] = r * 255
-                img_data[y][x][1] = g * 255
-                img_data[y][x][2] = b * 255
+        @param names outputs to write, see AovBuffer.AOVS
+        @param window (x0, y0, x1, y1) part of the image to write, see crop_window. The whole image by default.
+        @return the number of seconds writing took
+        """
+
+        start_time = time.time()
+        filepath = self.output_filepath(output_filename)
+        x0, y0, x1, y1 = window or (0, 0, self.width, self.height)
+
+        filepaths = []
+        for name, image in aov_buffer.images(names).items():
+            image = image[y0:y1, x0:x1]
+            for float_format in self.float_formats or ("pfm",):
+                filepaths.append(f"{filepath}.{name}.{float_format}")
+                if float_format == "pfm":
+                    ImageWriter.write_pfm(filepaths[-1], image)
+                else:
+                    ImageWriter.write_npy(filepaths[-1], image)
 
         end_time = time.time()
+        logging.info(f"Wrote AOVs {', '.join(filepaths)} in {end_time - start_time} seconds")
+        return end_time - start_time
+
+    @staticmethod
+    def run_tasks(pool: Pool, tasks: list, statistics: RenderStatistics) -> None:
+        """
+        Render the tasks on the threads of the pool, they are handed out in the order of the list.
+
+        @param statistics merges the statistics of the tasks, see compute_contribution
+        """
 
-        output_image = Image.fromarray(img_data)
+        for task_statistics in pool.imap_unordered(compute_contribution, tasks):
+            statistics.merge(task_statistics)
 
-        project_root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-        filename = f"{output_filename}.png"
-        filepath = os.path.join(project_root_path, 'output', filename)
-        logging.info(f"Wrote image {filepath} in {end_time - start_time} seconds")
-        output_image.save(filepath)
+    @staticmethod
+    def log_progress(framebuffer: Framebuffer, sample_count: int) -> None:
+        """
+        @param sample_count total number of samples of the render
+        """
 
-    def render(self, spp: int, thread_count: int = None) -> None:
+        percentage = int(100 * (framebuffer.sample_count() / max(sample_count, 1)))
+        logging.info(f"=> Progress: {str(percentage)}% ")
+
+    def write_statistics(self, spp: int, seconds: float) -> None:
+        filepath = self.output_filepath(f"{self.output_filename}.statistics.json")
+        logging.info(f"Render statistics, written to {filepath}:")
+        self.statistics.log()
+        self.statistics.save(filepath, {
+            "width": self.width,
+            "height": self.height,
+            "spp": spp,
+            "seconds": seconds
+        })
+
+    def render(self,
+               spp: int,
+               thread_count: int = None,
+               tile_size: int = TILE_SIZE,
+               spp_per_pass: int = SPP_PER_PASS,
+               checkpoint_interval: float = None,
+               resume: bool = False,
+               noise_threshold: float = None,
+               collect_statistics: bool = False,
+               record_costs: bool = False,
+               schedule: str = "morton",
+               use_gbuffer: bool = False,
+               aovs: tuple = (),
+               crop: tuple = None,
+               preview: bool = False) -> None:
         """
+        Render the image progressively in passes, every pass adds spp_per_pass samples to every pixel.
+        The optional features validate their options, set up their buffers and hook into the passes
+        themselves, see render_features.
+
         @param spp [int] samples per pixel
         @param thread_count the number of threads used to render the image. By default, the total number of available threads is used.
+        @param tile_size edge length of the square tiles in pixels. Tiles are handed out to the threads one by one,
+            such that threads that finish early keep pulling work.
+        @param spp_per_pass samples per pixel taken in every pass
+        @param checkpoint_interval minimal number of seconds between two checkpoints, see Checkpointing.
+            No checkpoints are written by default, or every CHECKPOINT_INTERVAL seconds with resume.
+        @param resume continue from the last checkpoint of a previous render with the same output filename
+        @param noise_threshold target relative error per pixel for adaptive sampling, see AdaptiveSampling.
+            spp is the maximal number of samples per pixel then. By default, every pixel gets spp samples.
+        @param collect_statistics count the traced rays and time the stages of every thread, see RenderStatistics.
+            The merged statistics are logged, kept in self.statistics and written to output/<output_filename>.statistics.json
+        @param record_costs measure the seconds and rays spent on every pixel and write them, see CostScheduling
+        @param schedule one of SCHEDULES, the order the tiles are rendered in. 'morton' follows a Z-order curve.
+            'cost' splits and orders the tiles by their estimated cost, see CostScheduling.
+        @param use_gbuffer keep the primary hits for material-only re-renders, see GBufferCache.
+            Needs a whitted integrator and every sample of every pixel, i.e. no adaptive sampling, resume or crop.
+        @param aovs names of output variables of the primary hits, see AovBuffer.AOVS, that are collected while
+            rendering and written next to the image, see AovOutput. They cannot be combined with resume.
+        @param crop (x0, y0, x1, y1) only render this window of the image, x1 and y1 exclusive, see crop_window.
+            The image and the AOVs are written at the size of the window. Cropped renders write no checkpoints.
+        @param preview take the first pass at 1/16, 1/4 and then full resolution and write an image after each
+            of them as well as after every later pass, see Preview. The final image is the same.
         """
+        window = self.crop_window(crop)
+        x0, y0, x1, y1 = window
+        checkpointing = Checkpointing(self, checkpoint_interval, resume, crop)
+        adaptive_sampling = AdaptiveSampling(noise_threshold)
+        cost_scheduling = CostScheduling(self, record_costs, schedule)
+        gbuffer_cache = GBufferCache(self, use_gbuffer, spp, noise_threshold, resume, crop)
+        aov_output = AovOutput(self, tuple(aovs), resume)
+        previews = Preview(self, preview, window)
+
         cpu_count = thread_count or multiprocessing.cpu_count()
         logging.info(f"Starting {cpu_count} threads")
-        index_groups = self.compute_indices_groups(index_count=self.width * self.height, cpu_count=cpu_count)
-
-        tasks = []
-        for idx in range(0, cpu_count):
-            tasks.append(RenderTask(scene=self.scene, indices=index_groups[idx], spp=spp))
-
-        n = self.height * self.width
-        shared_array_base_red = multiprocessing.Array(ctypes.c_double, n)
-        shared_array_base_green = multiprocessing.Array(ctypes.c_double, n)
-        shared_array_base_blue = multiprocessing.Array(ctypes.c_double, n)
-
-        shared_array_base_red_count = multiprocessing.Array(ctypes.c_int, n)
-        shared_array_base_green_count = multiprocessing.Array(ctypes.c_int, n)
-        shared_array_base_blue_count = multiprocessing.Array(ctypes.c_int, n)
+        image_tiles = self.compute_tiles(width=self.width, height=self.height, tile_size=tile_size, window=window)
+        logging.info(f"Split image into {len(image_tiles)} tiles of at most {tile_size} x {tile_size} pixels")
 
-        raw_shared_status = multiprocessing.Array(ctypes.c_int, n)
+        framebuffer, completed_spp = checkpointing.open_framebuffer()
+        gbuffer_cache.open()
 
-        def show_progress():
-            completed_task_count = np.sum(raw_shared_status)
-            percentage = int(100 * (completed_task_count / n))
-            logging.info(f"=> Progress: {str(percentage)}% ")
+        snapshot = SceneSnapshot.create(self.scene)
+        logging.info(f"Shared scene snapshot of {snapshot.size / 2 ** 20:.2f} MiB with the threads")
 
-        timer = RepeatTimer(1, show_progress)
+        n = (y1 - y0) * (x1 - x0)
+        statistics = RenderStatistics()
+        # a resumed checkpoint may already hold more than spp samples per pixel
+        progress_args = (framebuffer, n * max(spp, completed_spp))
+        timer = RepeatTimer(1, self.log_progress, progress_args)
         timer.start()
 
         start_time = time.time()
-        with Pool(
-                processes=cpu_count,
-                initializer=init_shared_state,
-                initargs=(
-                        n,
-                        shared_array_base_red,
-                        shared_array_base_green,
-                        shared_array_base_blue,
-                        shared_array_base_red_count,
-                        shared_array_base_green_count,
-                        shared_array_base_blue_count,
-                        raw_shared_status
-
-                )) as pool:
-            pool.map(compute_contribution, tasks)
+        try:
+            with Pool(
+                    processes=cpu_count,
+                    initializer=init_shared_state,
+                    initargs=(framebuffer, snapshot.name, collect_statistics, cost_scheduling.cost_buffer,
+                              gbuffer_cache.gbuffer, aov_output.aov_buffer)) as pool:
+                tiles = cost_scheduling.start(pool, image_tiles, cpu_count, statistics)
+                if completed_spp < spp:
+                    completed_spp += previews.first_pass(pool, framebuffer, tiles, min(spp_per_pass, spp - completed_spp),
+                                                         completed_spp, start_time, statistics)
+
+                while completed_spp < spp:
+                    pass_spp = min(spp_per_pass, spp - completed_spp)
+                    pass_tiles, pass_noise_threshold = adaptive_sampling.pass_tiles(framebuffer, tiles, completed_spp)
+                    if len(pass_tiles) == 0:
+                        break
+
+                    tasks = [RenderTask(tile=tile, width=self.width, spp=pass_spp, noise_threshold=pass_noise_threshold,
+                                        sample_offset=completed_spp)
+                             for tile in pass_tiles]
+                    self.run_tasks(pool, tasks, statistics)
+                    completed_spp += pass_spp
+
+                    tiles = cost_scheduling.end_pass(tiles, image_tiles)
+                    previews.end_pass(framebuffer, completed_spp >= spp, statistics)
+                    checkpointing.end_pass(framebuffer, completed_spp, statistics)
+
+                checkpointing.finish(framebuffer, completed_spp, statistics)
+                gbuffer_cache.finish()
+        finally:
+            timer.cancel()
+            snapshot.close()
+            snapshot.unlink()
 
         end_time = time.time()
-        timer.cancel()
-        show_progress()
+        self.log_progress(*progress_args)
         logging.info(f"Completed raytracing in {end_time - start_time} seconds")
+        adaptive_sampling.finish(framebuffer, n, spp)
+
+        statistics.add_time("output", self.write_image(self.output_filename, framebuffer.radiance()[y0:y1, x0:x1]))
+        aov_output.finish(window, statistics)
+        cost_scheduling.finish()
+        if collect_statistics:
+            self.statistics = statistics
+            self.write_statistics(spp, end_time - start_time)
+
+    def render_distributed(self,
+                           spp: int,
+                           host: str,
+                           port: int,
+                           tile_size: int = TILE_SIZE,
+                           spp_per_pass: int = SPP_PER_PASS,
+                           collect_statistics: bool = False,
+                           task_timeout: float = TASK_TIMEOUT,
+                           crop: tuple = None) -> None:
+        """
+        Render the image on remote workers, see RenderCoordinator. The tiles of every pass are served to the
+        workers that connect to host:port, e.g. started with run.py --worker on other machines. The image is
+        written once all tiles are rendered.
 
-        new_shape = (self.height, self.width)
-
-        red = np.reshape(np.frombuffer(shared_array_base_red.get_obj()), newshape=new_shape)
-        green = np.reshape(np.frombuffer(shared_array_base_blue.get_obj()), newshape=new_shape)
-        blue = np.reshape(np.frombuffer(shared_array_base_green.get_obj()), newshape=new_shape)
-
-        red_count = np.reshape(
-            np.frombuffer(shared_array_base_red_count.get_obj(), dtype='int32'),
-            newshape=new_shape
-        ) + 1e-8
+        Checkpoints, adaptive sampling and cost-aware scheduling need the framebuffer in the workers and
+        are not supported.
 
-        green_count = np.reshape(
-            np.frombuffer(shared_array_base_green_count.get_obj(), dtype='int32'),
-            newshape=new_shape
-        ) + 1e-8
+        @param spp [int] samples per pixel
+        @param host address to listen on, e.g. 0.0.0.0 to accept workers on all interfaces
+        @param port TCP port to listen on
+        @param tile_size edge length of the square tiles in pixels
+        @param spp_per_pass samples per pixel taken in every pass
+        @param collect_statistics see render
+        @param task_timeout seconds after which a tile that was not returned is handed to another worker,
+            see RenderCoordinator
+        @param crop only render this window of the image, see render
+        """
 
-        blue_count = np.reshape(
-            np.frombuffer(shared_array_base_blue_count.get_obj(), dtype='int32'),
-            newshape=new_shape
-        ) + 1e-8
+        x0, y0, x1, y1 = window = self.crop_window(crop)
+        tiles = self.compute_tiles(width=self.width, height=self.height, tile_size=tile_size, window=window)
+        tasks = self.frame_tasks(tiles, self.width, spp, spp_per_pass)
+        logging.info(f"Split image into {len(tiles)} tiles of at most {tile_size} x {tile_size} pixels, "
+                     f"{len(tasks)} tasks for the workers")
 
-        red = red / red_count
-        green = green / green_count
-        blue = blue / blue_count
+        coordinator = RenderCoordinator(self.scene, tasks, host, port, collect_statistics, task_timeout)
+        start_time = time.time()
+        framebuffer = coordinator.render()
+        end_time = time.time()
+        logging.info(f"Completed raytracing in {end_time - start_time} seconds")
 
-        self.write_image(self.output_filename, red, green, blue)
+        statistics = coordinator.statistics
+        statistics.add_time("output", self.write_image(self.output_filename, framebuffer.radiance()[y0:y1, x0:x1]))
+        if collect_statistics:
+            self.statistics = statistics
+            self.write_statistics(spp, end_time - start_time)
@@ -1,15 +1,22 @@
 import json
+import logging
+import os
 
 from pytracer import Camera
 from pytracer.integrators.debug_integrator import DebugIntegrator
 from pytracer.intersectables.containers.mesh import Mesh
+from pytracer.intersectables.containers.mesh_instance import MeshInstance
 from pytracer.intersectables.geometries.triangle import Triangle
 
 from pytracer.materials.blinn_material import BlinnMaterial
+from pytracer.integrators.numba_kernels import NUMBA_AVAILABLE
 from pytracer.integrators.whitted_integrator import WhittedIntegrator
+from pytracer.integrators.whitted_numba_integrator import WhittedNumbaIntegrator
+from pytracer.integrators.whitted_wavefront_integrator import WhittedWavefrontIntegrator
 from pytracer.materials.diffuse_material import DiffuseMaterial
-from pytracer.intersectables.containers.intersectable_list import IntersectableList
+from pytracer.intersectables.containers.bvh import BVH
 from pytracer.one_sampler import OneSampler
+from pytracer.random_sampler import RandomSampler
 from pytracer.intersectables.geometries.plane import Plane
 from pytracer.light_sources.point_light import PointLight
 from pytracer.materials.reflective_material import ReflectiveMaterial
@@ -17,6 +24,7 @@ from pytracer.materials.refractive_material import RefractiveMaterial
 from pytracer.materials.grid_textured_material import GridTexturedMaterial
 from pytracer.intersectables.geometries.sphere import Sphere
 from pytracer.math.vec3 import Vec3
+from pytracer.scene_bundle import SceneBundle
 
 MATERIALS = {
     "blinn": lambda params: BlinnMaterial(diffuse=Vec3(*params["diffuse"]),
@@ -38,28 +46,86 @@ LIGHT_TYPES = {
                                              emission=Vec3(*params["emission"]))
 }
 
+SAMPLERS = {
+    "one": OneSampler,
+    "random": RandomSampler
+}
+
 INTEGRATORS = {
     "whitted": WhittedIntegrator,
+    "whitted_wavefront": WhittedWavefrontIntegrator,
     "debug": DebugIntegrator
 }
 
+BACKENDS = ("numpy", "numba")
+
+# integrators replacing the ones of INTEGRATORS with the numba backend
+NUMBA_INTEGRATORS = {
+    "whitted": WhittedNumbaIntegrator,
+    "whitted_wavefront": WhittedNumbaIntegrator
+}
+
 
 class Scene:
-    def __init__(self, scene_filepath: str, width: int, height: int):
-        with open(scene_filepath) as file:
-            scene_description = json.load(file)
+    def __init__(self, scene_filepath: str, width: int, height: int, sampler: str = None, use_bundle: bool = True,
+                 backend: str = "numpy"):
+        """
+        @param scene_filepath path to the JSON scene description
+        @param width image width in pixels
+        @param height image height in pixels
+        @param sampler one of SAMPLERS, overrides the sampler of the scene description.
+          Scenes without a sampler use the 'one' sampler, i.e. every pixel is sampled at its center.
+        @param use_bundle load the meshes and hierarchies from the compiled scene bundle next to
+          the scene file if it is up to date and write the bundle otherwise, see SceneBundle.
+        @param backend one of BACKENDS. 'numba' renders the whitted integrators with compiled
+          kernels, see WhittedNumbaIntegrator, and falls back to 'numpy' if numba is not installed.
+        """
 
+        with open(scene_filepath, "rb") as file:
+            scene_data = file.read()
+
+        scene_description = json.loads(scene_data)
+
+        self.filepath = os.path.abspath(scene_filepath)
         self.width = width
         self.height = height
 
         self.camera = self.build_camera(camera_params=scene_description["camera"])
-        self.sampler = OneSampler()
-        self.integrator = INTEGRATORS[scene_description["integrator"]](self)
+        # the sampler of the scene description, see set_sampler
+        self.default_sampler = scene_description.get("sampler", "one")
+        self.sampler = SAMPLERS[sampler or self.default_sampler]()
+        if backend == "numba" and not NUMBA_AVAILABLE:
+            logging.warning("numba is not installed, falling back to the numpy backend")
+            backend = "numpy"
 
-        self.intersectable_list = IntersectableList()
+        self.backend = backend
+        integrator = INTEGRATORS[scene_description["integrator"]]
+        if backend == "numba":
+            integrator = NUMBA_INTEGRATORS.get(scene_description["integrator"], integrator)
+        self.integrator = integrator(self)
+
+        self.intersectable_list = BVH()
+        self.meshes = []
+        # the meshes shared by the instances of the scene, one per OBJ file
+        self.instance_meshes = []
         self.light_sources = []
 
-        self.build_intersectables(object_params_list=scene_description["objects"])
+        object_params_list = scene_description["objects"]
+        bundle = None
+        compiled_arrays = None
+        mesh_filepaths = [self.resolve_filepath(object_params["filepath"])
+                          for object_params in object_params_list.get("meshes", [])]
+        mesh_filepaths += self.instance_filepaths(object_params_list)
+        # the OBJ files the scene was built from
+        self.mesh_filepaths = mesh_filepaths
+        if use_bundle:
+            bundle = SceneBundle(scene_filepath, scene_data, mesh_filepaths)
+            compiled_arrays = bundle.load()
+
+        self.build_intersectables(object_params_list=object_params_list, compiled_arrays=compiled_arrays)
+        if bundle is not None and compiled_arrays is None:
+            bundle.save(self)
+
         self.build_light_sources(light_params_list=scene_description["lights"])
 
     def build_camera(self, camera_params) -> Camera:
@@ -78,8 +144,47 @@ class Scene:
             height=self.height
         )
 
-    def build_intersectables(self, object_params_list):
-        for sphere_params in object_params_list["spheres"]:
+    def set_resolution(self, width: int, height: int) -> None:
+        """
+        Render the scene at another image size. Only the camera depends on the
+        image size, the geometry is kept.
+
+        @param width image width in pixels
+        @param height image height in pixels
+        """
+
+        if (width, height) == (self.width, self.height):
+            return
+
+        self.width = width
+        self.height = height
+        self.camera = Camera(
+            eye=self.camera.eye,
+            look_at=self.camera.look_at,
+            up=self.camera.up,
+            fov=self.camera.fov,
+            aspect_ratio=width / height,
+            width=width,
+            height=height
+        )
+
+    def set_sampler(self, sampler: str = None) -> None:
+        """
+        @param sampler one of SAMPLERS, the sampler of the scene description by default
+        """
+
+        sampler_type = SAMPLERS[sampler or self.default_sampler]
+        if type(self.sampler) is not sampler_type:
+            self.sampler = sampler_type()
+
+    def build_intersectables(self, object_params_list, compiled_arrays: dict = None):
+        """
+        @param object_params_list the objects of the scene description
+        @param compiled_arrays arrays of a scene bundle, used instead of reading the meshes and
+          building the hierarchies.
+        """
+
+        for sphere_params in object_params_list.get("spheres", []):
             material_type = list(sphere_params["material"])[0]
             material_params = sphere_params["material"][material_type]
             sphere = Sphere(
@@ -89,7 +194,7 @@ class Scene:
             )
             self.intersectable_list.append(sphere)
 
-        for plane_params in object_params_list["planes"]:
+        for plane_params in object_params_list.get("planes", []):
             material_type = list(plane_params["material"])[0]
             material_params = plane_params["material"][material_type]
             plane = Plane(
@@ -99,26 +204,73 @@ class Scene:
             )
             self.intersectable_list.append(plane)
 
-        for object_params in object_params_list["triangles"]:
+        for face_id, object_params in enumerate(object_params_list.get("triangles", [])):
             material_type = list(object_params["material"])[0]
             material_params = object_params["material"][material_type]
             intersectable = Triangle(
                 material=MATERIALS[material_type](material_params),
                 a=Vec3(*object_params["a"]),
                 b=Vec3(*object_params["b"]),
-                c=Vec3(*object_params["c"])
+                c=Vec3(*object_params["c"]),
+                face_id=face_id
             )
             self.intersectable_list.append(intersectable)
 
-        for object_params in object_params_list["meshes"]:
+        for mesh_idx, object_params in enumerate(object_params_list.get("meshes", [])):
             material_type = list(object_params["material"])[0]
             material_params = object_params["material"][material_type]
-            intersectable = Mesh(
-                material=MATERIALS[material_type](material_params),
-                filepath=object_params["filepath"]
-            )
+            material = MATERIALS[material_type](material_params)
+            if compiled_arrays is not None:
+                intersectable = Mesh.from_arrays(material, SceneBundle.select(compiled_arrays, f"mesh{mesh_idx}."))
+            else:
+                intersectable = Mesh(material=material, filepath=self.resolve_filepath(object_params["filepath"]))
+
+            self.meshes.append(intersectable)
             self.intersectable_list.append(intersectable)
 
+        instance_meshes = {}
+        for object_params in object_params_list.get("instances", []):
+            material_type = list(object_params["material"])[0]
+            material_params = object_params["material"][material_type]
+            material = MATERIALS[material_type](material_params)
+            filepath = self.resolve_filepath(object_params["filepath"])
+            mesh = instance_meshes.get(filepath)
+            if mesh is None:
+                prefix = f"instance_mesh{len(self.instance_meshes)}."
+                if compiled_arrays is not None:
+                    mesh = Mesh.from_arrays(material, SceneBundle.select(compiled_arrays, prefix))
+                else:
+                    mesh = Mesh(material=material, filepath=filepath)
+
+                instance_meshes[filepath] = mesh
+                self.instance_meshes.append(mesh)
+
+            self.intersectable_list.append(
+                MeshInstance(mesh=mesh, transform=object_params.get("transform"), material=material)
+            )
+
+        if compiled_arrays is not None:
+            self.intersectable_list.restore(SceneBundle.select(compiled_arrays, "scene."))
+        else:
+            self.intersectable_list.build()
+
+    def resolve_filepath(self, filepath: str) -> str:
+        """
+        @param filepath path of a file referenced by the scene description, e.g. a mesh
+        @return the absolute path, relative paths refer to the directory of the scene file
+        """
+
+        return os.path.abspath(os.path.join(os.path.dirname(self.filepath), filepath))
+
+    def instance_filepaths(self, object_params_list) -> list:
+        """
+        @return the OBJ files shared by the instances of the scene description, in order of their first use
+        """
+
+        filepaths = [self.resolve_filepath(object_params["filepath"])
+                     for object_params in object_params_list.get("instances", [])]
+        return list(dict.fromkeys(filepaths))
+
     def build_light_sources(self, light_params_list):
         for light_params in light_params_list:
             light_type = list(light_params)[0]
@@ -0,0 +1,143 @@
+import hashlib
+import logging
+import os
+
+from typing import Optional, TYPE_CHECKING
+
+from pytracer.array_bundle import ArrayBundle
+
+if TYPE_CHECKING:
+    from pytracer import Scene
+
+
+class SceneBundle:
+    """
+    Compiled form of a scene, written next to its JSON file as <scene>.json.bundle
+    (see ArrayBundle). It stores what is expensive to compute when a scene is
+    loaded: the flattened hierarchy of the scene objects and, for every mesh
+    including the meshes shared by instances, its triangle buffer and flattened
+    hierarchy. Everything else is cheap to create from the JSON description.
+
+    A bundle is keyed by a content hash of the JSON file and the files of all
+    referenced meshes. Meshes whose size and modification time did not change
+    are not hashed again.
+    """
+
+    # 2: meshes store indexed triangle buffers, see TriangleBuffer
+    VERSION = 2
+    SUFFIX = ".bundle"
+
+    def __init__(self, scene_filepath: str, scene_data: bytes, mesh_filepaths: list):
+        """
+        @param scene_filepath path to the JSON scene description
+        @param scene_data content of the JSON file
+        @param mesh_filepaths the OBJ files referenced by the scene, in the order of the scene description
+          followed by the files shared by instances. Relative paths refer to the directory of the scene file.
+        """
+
+        self.filepath = scene_filepath + self.SUFFIX
+        self.scene_hash = hashlib.blake2b(scene_data, digest_size=20).hexdigest()
+        scene_directory = os.path.dirname(os.path.abspath(scene_filepath))
+        self.mesh_filepaths = [os.path.abspath(os.path.join(scene_directory, filepath)) for filepath in mesh_filepaths]
+
+    @staticmethod
+    def file_hash(filepath: str) -> str:
+        content_hash = hashlib.blake2b(digest_size=20)
+        with open(filepath, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 24), b""):
+                content_hash.update(chunk)
+
+        return content_hash.hexdigest()
+
+    def mesh_fingerprints(self, previous_fingerprints: list = None) -> list:
+        """
+        @param previous_fingerprints fingerprints of a bundle, their hashes are
+          reused for mesh files whose size and modification time did not change.
+        @return a fingerprint {filepath, size, mtime_ns, hash} of every mesh file
+        @raise OSError if a mesh file cannot be read
+        """
+
+        previous = {fingerprint["filepath"]: fingerprint for fingerprint in previous_fingerprints or []}
+
+        fingerprints = []
+        for filepath in self.mesh_filepaths:
+            stat = os.stat(filepath)
+            fingerprint = {"filepath": filepath, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+            previous_fingerprint = previous.get(filepath, {})
+            if (previous_fingerprint.get("size"), previous_fingerprint.get("mtime_ns")) == (stat.st_size, stat.st_mtime_ns):
+                fingerprint["hash"] = previous_fingerprint["hash"]
+            else:
+                fingerprint["hash"] = self.file_hash(filepath)
+
+            fingerprints.append(fingerprint)
+
+        return fingerprints
+
+    def load(self) -> Optional[dict]:
+        """
+        @return the memory-mapped arrays of the bundle or None if there is no
+          bundle for the current content of the scene and mesh files.
+        """
+
+        try:
+            metadata = ArrayBundle.read_metadata(self.filepath)
+        except (OSError, ValueError):
+            return None
+
+        if metadata.get("version") != self.VERSION or metadata.get("scene_hash") != self.scene_hash:
+            return None
+
+        try:
+            fingerprints = self.mesh_fingerprints(metadata["meshes"])
+        except OSError as error:
+            logging.info(f"Scene bundle {self.filepath} is stale: {error}")
+            return None
+
+        if [fingerprint["hash"] for fingerprint in fingerprints] != [fingerprint["hash"] for fingerprint in metadata["meshes"]]:
+            return None
+
+        arrays, _ = ArrayBundle.read(self.filepath)
+        if fingerprints != metadata["meshes"]:
+            # touched but unchanged mesh files, store their new modification times to avoid hashing them again
+            metadata["meshes"] = fingerprints
+            self.write(arrays, metadata)
+
+        return arrays
+
+    def save(self, scene: 'Scene') -> None:
+        """
+        @param scene a scene built from the scene and mesh files of this bundle
+        """
+
+        arrays = {f"scene.{name}": array for name, array in scene.intersectable_list.arrays().items()}
+        for mesh_idx, mesh in enumerate(scene.meshes):
+            arrays.update({f"mesh{mesh_idx}.{name}": array for name, array in mesh.arrays().items()})
+        for mesh_idx, mesh in enumerate(scene.instance_meshes):
+            arrays.update({f"instance_mesh{mesh_idx}.{name}": array for name, array in mesh.arrays().items()})
+
+        try:
+            metadata = {
+                "version": self.VERSION,
+                "scene_hash": self.scene_hash,
+                "meshes": self.mesh_fingerprints()
+            }
+        except OSError as error:
+            logging.warning(f"Could not write scene bundle {self.filepath}: {error}")
+            return
+
+        self.write(arrays, metadata)
+
+    def write(self, arrays: dict, metadata: dict) -> None:
+        try:
+            ArrayBundle.write(self.filepath, arrays, metadata)
+        except OSError as error:
+            logging.warning(f"Could not write scene bundle {self.filepath}: {error}")
+
+    @staticmethod
+    def select(arrays: dict, prefix: str) -> dict:
+        """
+        @return the arrays whose name starts with the given prefix, without the prefix
+        """
+
+        return {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
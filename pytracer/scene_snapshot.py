@@ -0,0 +1,112 @@
+import pickle
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pytracer import Scene
+
+
+class SceneSnapshot:
+    """
+    A scene frozen into a single block of shared memory, such that the render
+    workers do not receive their own pickled copy of the scene with every task.
+
+    The scene is pickled once with protocol 5. Large contiguous numpy arrays
+    (BVH nodes, triangle buffers, ...) are not copied into the pickle stream but
+    stored next to it as out-of-band buffers. Attaching to the snapshot only
+    unpickles the remaining object graph, the arrays are read-only views into
+    the shared memory.
+
+    Layout of the shared memory block:
+
+        [0, 8)               number n of segments
+        [8, 8 + 16 * n)      (offset, size) of every segment as int64. The first
+                             segment is the pickle stream, all others are the
+                             out-of-band buffers in pickling order.
+        [8 + 16 * n, ...)    the segments, each aligned to ALIGNMENT bytes
+    """
+
+    ALIGNMENT = 64
+    MIN_OUT_OF_BAND_SIZE = 4096
+    HEADER_SIZE = 8
+
+    def __init__(self, memory: shared_memory.SharedMemory, scene: 'Scene' = None):
+        self.memory = memory
+        self.scene = scene
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @property
+    def size(self) -> int:
+        return self.memory.size
+
+    @classmethod
+    def create(cls, scene: 'Scene') -> 'SceneSnapshot':
+        """
+        @param scene the scene to freeze
+        @return a snapshot owning a new shared memory block. The creator is
+          responsible for calling unlink once all workers are done.
+        """
+
+        buffers = []
+
+        def collect_buffer(buffer: pickle.PickleBuffer) -> bool:
+            # returning a true value serializes the buffer in-band
+            if buffer.raw().nbytes < cls.MIN_OUT_OF_BAND_SIZE:
+                return True
+
+            buffers.append(buffer)
+            return False
+
+        payload = pickle.dumps(scene, protocol=5, buffer_callback=collect_buffer)
+        segments = [memoryview(payload)] + [buffer.raw() for buffer in buffers]
+
+        layout = np.zeros((len(segments), 2), dtype=np.int64)
+        offset = cls.align(cls.HEADER_SIZE + layout.nbytes)
+        for idx, segment in enumerate(segments):
+            layout[idx] = offset, segment.nbytes
+            offset = cls.align(offset + segment.nbytes)
+
+        memory = shared_memory.SharedMemory(create=True, size=offset)
+        memory.buf[:cls.HEADER_SIZE] = len(segments).to_bytes(cls.HEADER_SIZE, "little")
+        memory.buf[cls.HEADER_SIZE:cls.HEADER_SIZE + layout.nbytes] = layout.tobytes()
+        for (begin, size), segment in zip(layout.tolist(), segments):
+            memory.buf[begin:begin + size] = segment.cast("B")
+
+        for buffer in buffers:
+            buffer.release()
+
+        return SceneSnapshot(memory)
+
+    @classmethod
+    def attach(cls, name: str) -> 'SceneSnapshot':
+        """
+        @param name name of the shared memory block, see SceneSnapshot.name
+        @return a snapshot holding the unpickled scene. The snapshot has to be
+          kept alive as long as the scene is used, its arrays live in the
+          shared memory block.
+        """
+
+        memory = shared_memory.SharedMemory(name=name)
+        segment_count = int.from_bytes(memory.buf[:cls.HEADER_SIZE], "little")
+        layout = np.frombuffer(memory.buf, dtype=np.int64, count=2 * segment_count,
+                               offset=cls.HEADER_SIZE).reshape((-1, 2)).tolist()
+
+        segments = [memory.buf[begin:begin + size].toreadonly() for begin, size in layout]
+        scene = pickle.loads(segments[0], buffers=segments[1:])
+        return SceneSnapshot(memory, scene)
+
+    @classmethod
+    def align(cls, offset: int) -> int:
+        return -(-offset // cls.ALIGNMENT) * cls.ALIGNMENT
+
+    def close(self) -> None:
+        self.memory.close()
+
+    def unlink(self) -> None:
+        self.memory.unlink()
@@ -0,0 +1,92 @@
+import http.client
+import io
+import json
+import socket
+
+import numpy as np
+
+from pytracer.distributed.protocol import parse_address
+from pytracer.service.render_service import SERVICE_PORT, UNIX_PREFIX
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class RenderClient:
+    """
+    Posts jobs to a RenderService, see RenderJob for the job parameters:
+
+        client = RenderClient("unix:/tmp/pytracer.sock")
+        png = client.render({"scene": "scenes/box1.json", "width": 160, "height": 120})
+        radiance = client.render_radiance({"scene": "scenes/box1.json", "width": 160, "height": 120})
+    """
+
+    def __init__(self, address: str, timeout: float = None):
+        """
+        @param address HOST:PORT or unix:PATH of the service
+        @param timeout seconds to wait for a response, including the time the job is queued
+        """
+
+        self.address = address
+        self.timeout = timeout
+
+    def connection(self) -> http.client.HTTPConnection:
+        if self.address.startswith(UNIX_PREFIX):
+            return UnixHTTPConnection(self.address[len(UNIX_PREFIX):], self.timeout)
+
+        host, port = parse_address(self.address, SERVICE_PORT)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def request(self, method: str, path: str, content: dict = None) -> tuple:
+        """
+        @return (body, headers) of the response
+        @raise RuntimeError if the service rejected the request
+        """
+
+        connection = self.connection()
+        try:
+            body = None if content is None else json.dumps(content)
+            connection.request(method, path, body=body, headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            data = response.read()
+            headers = dict(response.getheaders())
+        finally:
+            connection.close()
+
+        if response.status != 200:
+            try:
+                message = json.loads(data)["error"]
+            except (ValueError, KeyError, TypeError):
+                message = data.decode("utf8", errors="replace")
+            raise RuntimeError(f"Render service answered {response.status}: {message}")
+
+        return data, headers
+
+    def render(self, job: dict) -> bytes:
+        """
+        @param job parameters of a RenderJob
+        @return the image encoded in the format of the job, png by default
+        """
+
+        data, _ = self.request("POST", "/render", job)
+        return data
+
+    def render_radiance(self, job: dict) -> np.ndarray:
+        """
+        @return (height, width, 3) float32 linear radiance of the job
+        """
+
+        return np.load(io.BytesIO(self.render({**job, "format": "npy"})))
+
+    def status(self) -> dict:
+        data, _ = self.request("GET", "/status")
+        return json.loads(data)
@@ -0,0 +1,383 @@
+import asyncio
+import gc
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+
+from pytracer.distributed.protocol import parse_address
+from pytracer.framebuffer import Framebuffer
+from pytracer.image_writer import ImageWriter
+from pytracer.renderer import Renderer, TILE_SIZE, render_tile
+from pytracer.scene import BACKENDS, SAMPLERS
+from pytracer.scene_snapshot import SceneSnapshot
+from pytracer.service.scene_cache import CACHE_SIZE, SceneCache
+
+SERVICE_PORT = 7879
+UNIX_PREFIX = "unix:"
+
+# largest accepted request body in bytes, a job is a small JSON object
+MAX_REQUEST_SIZE = 1 << 20
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "npy": "application/x-npy",
+    "pfm": "image/x-portable-floatmap"
+}
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error"
+}
+
+# the scene snapshot a worker process of the service is attached to
+worker_snapshot = None
+
+
+def detach_snapshot() -> None:
+    global worker_snapshot
+
+    if worker_snapshot is None:
+        return
+
+    snapshot, worker_snapshot = worker_snapshot, None
+    snapshot.scene = None
+    # the arrays of the scene are views into the shared memory, they have to be collected before it is closed
+    gc.collect()
+    try:
+        snapshot.close()
+    except BufferError:
+        # still referenced, the memory is released together with the last array
+        pass
+
+
+def render_snapshot_tile(arguments: tuple) -> tuple:
+    """
+    Render a tile in a worker process of the service. A worker stays attached
+    to the scene of its last task, such that it attaches once per job. The
+    cached scene is shared by the jobs of all image sizes and samplers, they
+    are applied to the scene of the worker per task.
+
+    @param arguments (snapshot_name, height, sampler, render_task), see RenderJob
+    @return (tile, pixels), see render_tile
+    """
+
+    global worker_snapshot
+
+    snapshot_name, height, sampler, render_task = arguments
+    if worker_snapshot is None or worker_snapshot.name != snapshot_name:
+        detach_snapshot()
+        worker_snapshot = SceneSnapshot.attach(snapshot_name)
+
+    scene = worker_snapshot.scene
+    scene.set_resolution(render_task.width, height)
+    scene.set_sampler(sampler)
+    return render_task.tile, render_tile(scene, render_task)
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class RenderJob:
+    """
+    A render request to the RenderService, created from the JSON body of a
+    POST /render request:
+
+        {
+          "scene": "scenes/box1.json",   required, relative to the working directory of the service
+          "width": 160,                  required
+          "height": 120,                 required
+          "spp": 1,
+          "format": "png",               one of ImageWriter.IMAGE_FORMATS
+          "priority": 0,                 jobs with a higher priority are rendered first
+          "sampler": null,               see Scene
+          "backend": "numpy",            see Scene
+          "tone_mapping": "clamp",       see ImageWriter.tone_map, only applies to png
+          "tile_size": 32
+        }
+    """
+
+    def __init__(self, scene_filepath: str, width: int, height: int, spp: int = 1, image_format: str = "png",
+                 priority: int = 0, sampler: str = None, backend: str = "numpy", tone_mapping: str = "clamp",
+                 tile_size: int = TILE_SIZE):
+        self.scene_filepath = scene_filepath
+        self.width = width
+        self.height = height
+        self.spp = spp
+        self.image_format = image_format
+        self.priority = priority
+        self.sampler = sampler
+        self.backend = backend
+        self.tone_mapping = tone_mapping
+        self.tile_size = tile_size
+
+    @classmethod
+    def from_dict(cls, params: dict) -> 'RenderJob':
+        """
+        @raise ValueError if a parameter is missing or invalid
+        """
+
+        if not isinstance(params, dict):
+            raise ValueError("A job has to be a JSON object")
+
+        missing = [name for name in ("scene", "width", "height") if name not in params]
+        if missing:
+            raise ValueError(f"Missing job parameters {', '.join(missing)}")
+
+        def positive_int(name: str, default=None) -> int:
+            value = params.get(name, default)
+            # bool is a subclass of int, but true is no image size
+            if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+                raise ValueError(f"'{name}' has to be a positive integer")
+            return value
+
+        def choice(name: str, choices, default):
+            value = params.get(name, default)
+            if value not in choices:
+                raise ValueError(f"'{name}' has to be one of {', '.join(map(str, choices))}")
+            return value
+
+        priority = params.get("priority", 0)
+        if isinstance(priority, bool) or not isinstance(priority, int):
+            raise ValueError("'priority' has to be an integer")
+
+        return RenderJob(
+            scene_filepath=str(params["scene"]),
+            width=positive_int("width"),
+            height=positive_int("height"),
+            spp=positive_int("spp", 1),
+            image_format=choice("format", ImageWriter.IMAGE_FORMATS, "png"),
+            priority=priority,
+            sampler=choice("sampler", (None,) + tuple(SAMPLERS), None),
+            backend=choice("backend", BACKENDS, "numpy"),
+            tone_mapping=choice("tone_mapping", ImageWriter.TONE_MAPPINGS, "clamp"),
+            tile_size=positive_int("tile_size", TILE_SIZE)
+        )
+
+
+class RenderService:
+    """
+    Long-lived render daemon for many small jobs, e.g. previews. It keeps a
+    pool of warm worker processes and a SceneCache of loaded scenes, such that
+    a job neither pays for starting Python and its imports nor for loading a
+    scene it rendered before.
+
+    Jobs are posted as JSON over HTTP, either on a TCP port or on a Unix socket:
+
+        POST /render    render a RenderJob, answers with the image in the requested format
+        GET /status     JSON with the queued jobs and the cached scenes
+
+    Jobs wait in a priority queue and are rendered one after another, every
+    job uses all worker processes. The service renders any scene file it can
+    read, it should only be reachable by trusted clients.
+    """
+
+    def __init__(self, process_count: int = None, cache_size: int = CACHE_SIZE):
+        """
+        @param process_count the number of worker processes, the number of available threads by default
+        @param cache_size memory limit of the cached scenes in bytes, see SceneCache
+        """
+
+        self.process_count = process_count or multiprocessing.cpu_count()
+        self.scene_cache = SceneCache(cache_size)
+        self.pool = None
+        # jobs are rendered by a thread, the event loop keeps accepting requests meanwhile
+        self.executor = None
+        self.queue = None
+        self.sequence = itertools.count()
+        self.job_count = 0
+
+    def render_job(self, job: RenderJob) -> tuple:
+        """
+        @return (data, headers) the encoded image and additional response headers
+        """
+
+        start_time = time.time()
+        snapshot, is_cached = self.scene_cache.get(job.scene_filepath, job.width, job.height, job.backend)
+
+        framebuffer = Framebuffer(job.width, job.height)
+        tiles = Renderer.compute_tiles(width=job.width, height=job.height, tile_size=job.tile_size)
+        tasks = [(snapshot.name, job.height, job.sampler, task) for task in Renderer.frame_tasks(tiles, job.width, job.spp, job.spp)]
+        for (row_begin, row_end, col_begin, col_end), pixels in self.pool.imap_unordered(render_snapshot_tile, tasks):
+            framebuffer.pixels[row_begin:row_end, col_begin:col_end] += pixels
+
+        data = ImageWriter.encode(framebuffer.radiance(), job.image_format, job.tone_mapping)
+        seconds = time.time() - start_time
+        logging.info(f"Rendered {job.scene_filepath} at {job.width} x {job.height} pixels with {job.spp} samples "
+                     f"per pixel in {seconds} seconds, {'cached' if is_cached else 'loaded'} scene")
+        return data, {"X-Render-Seconds": f"{seconds:.6f}", "X-Scene-Cached": str(is_cached).lower()}
+
+    async def submit(self, job: RenderJob) -> tuple:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((-job.priority, next(self.sequence), job, future))
+        return await future
+
+    async def run_jobs(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, job, future = await self.queue.get()
+            if future.cancelled():
+                continue
+
+            try:
+                result = await loop.run_in_executor(self.executor, self.render_job, job)
+            except Exception as error:
+                if not future.cancelled():
+                    future.set_exception(error)
+            else:
+                if not future.cancelled():
+                    future.set_result(result)
+            self.job_count += 1
+
+    def status(self) -> dict:
+        return {
+            "processes": self.process_count,
+            "queued_jobs": self.queue.qsize(),
+            "rendered_jobs": self.job_count,
+            "cache": self.scene_cache.to_dict()
+        }
+
+    @staticmethod
+    async def read_request(reader: asyncio.StreamReader) -> tuple:
+        """
+        @return (method, path, body) of an HTTP request
+        """
+
+        request_line = (await reader.readline()).decode("latin-1")
+        parts = request_line.split()
+        if len(parts) != 3:
+            raise HTTPError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            content_length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(400, "Malformed Content-Length")
+        if content_length > MAX_REQUEST_SIZE:
+            raise HTTPError(413, f"Requests are limited to {MAX_REQUEST_SIZE} bytes")
+
+        body = await reader.readexactly(content_length)
+        return parts[0], parts[1], body
+
+    @staticmethod
+    def http_response(status: int, body: bytes, content_type: str, headers: dict = None) -> bytes:
+        lines = [f"HTTP/1.1 {status} {HTTP_REASONS[status]}",
+                 f"Content-Type: {content_type}",
+                 f"Content-Length: {len(body)}",
+                 "Connection: close"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+    @staticmethod
+    def json_response(status: int, content: dict) -> bytes:
+        return RenderService.http_response(status, json.dumps(content).encode("utf8"), "application/json")
+
+    async def handle_request(self, reader: asyncio.StreamReader) -> bytes:
+        method, path, body = await self.read_request(reader)
+        if path == "/status":
+            if method != "GET":
+                raise HTTPError(405, "Use GET /status")
+            return self.json_response(200, self.status())
+
+        if path != "/render":
+            raise HTTPError(404, f"Unknown path {path}, expected POST /render or GET /status")
+        if method != "POST":
+            raise HTTPError(405, "Use POST /render")
+
+        try:
+            job = RenderJob.from_dict(json.loads(body))
+        except ValueError as error:
+            raise HTTPError(400, str(error))
+
+        try:
+            data, headers = await self.submit(job)
+        except (OSError, KeyError, ValueError) as error:
+            # unreadable or invalid scene descriptions
+            raise HTTPError(400, f"Cannot render {job.scene_filepath}: {type(error).__name__}: {error}")
+
+        return self.http_response(200, data, CONTENT_TYPES[job.image_format], headers)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            response = await self.handle_request(reader)
+        except HTTPError as error:
+            response = self.json_response(error.status, {"error": str(error)})
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        except Exception as error:
+            logging.exception("Render job failed")
+            response = self.json_response(500, {"error": f"{type(error).__name__}: {error}"})
+
+        try:
+            writer.write(response)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, address: str) -> None:
+        """
+        @param address HOST:PORT to listen for HTTP requests on, or unix:PATH to listen on a Unix socket
+        """
+
+        self.queue = asyncio.PriorityQueue()
+        if address.startswith(UNIX_PREFIX):
+            server = await asyncio.start_unix_server(self.handle_connection, address[len(UNIX_PREFIX):])
+        else:
+            host, port = parse_address(address, SERVICE_PORT)
+            server = await asyncio.start_server(self.handle_connection, host, port)
+
+        stop = asyncio.Event()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                asyncio.get_running_loop().add_signal_handler(signal_number, stop.set)
+            except NotImplementedError:
+                # not supported on Windows, an interrupt raises KeyboardInterrupt there
+                pass
+
+        logging.info(f"Render service with {self.process_count} worker processes listening on {address}")
+        async with server:
+            jobs = asyncio.create_task(self.run_jobs())
+            await stop.wait()
+            # the job being rendered is finished by the executor, queued jobs are dropped
+            jobs.cancel()
+
+    def run(self, address: str) -> None:
+        """
+        Serve render jobs until the process is interrupted or terminated.
+        """
+
+        self.pool = Pool(processes=self.process_count)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            asyncio.run(self.serve(address))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            logging.info("Stopping the render service")
+            self.executor.shutdown()
+            self.pool.terminate()
+            self.scene_cache.clear()
+            if address.startswith(UNIX_PREFIX) and os.path.exists(address[len(UNIX_PREFIX):]):
+                os.remove(address[len(UNIX_PREFIX):])
@@ -0,0 +1,134 @@
+import collections
+import logging
+import os
+import threading
+import time
+
+from pytracer import Scene
+from pytracer.scene_snapshot import SceneSnapshot
+
+# default memory limit of the cached scenes in bytes
+CACHE_SIZE = 1 << 30
+
+
+class SceneCache:
+    """
+    Least recently used cache of loaded scenes for the RenderService. Scenes are
+    kept as SceneSnapshots, i.e. frozen into shared memory, such that the warm
+    worker processes of the service attach to them without receiving a copy.
+
+    A scene is identified by its file and backend. Its geometry does not depend
+    on the image size or the sampler, the workers apply them per job, see
+    Scene.set_resolution and Scene.set_sampler. Cached
+    scenes are loaded again once their JSON file or one of their OBJ files
+    changed. Scenes are evicted, least recently used first, while the total
+    size of all snapshots exceeds max_size. The scene requested last is never
+    evicted, even if it alone exceeds max_size.
+
+    The service loads scenes on its job thread and reports the cache on its
+    event loop, the entries are therefore only accessed while holding the lock.
+    Scenes are loaded without holding it, such that reporting does not wait for
+    a scene to load.
+    """
+
+    def __init__(self, max_size: int = CACHE_SIZE):
+        """
+        @param max_size memory limit of all cached snapshots in bytes
+        """
+
+        self.max_size = max_size
+        # key -> (fingerprint, snapshot), least recently used first
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        """
+        @return the total size of the cached snapshots in bytes, the lock has to be held
+        """
+
+        return sum(snapshot.size for _, snapshot in self.entries.values())
+
+    @staticmethod
+    def fingerprint(filepaths: list) -> tuple:
+        """
+        @return (filepath, size, modification time) of every file, changes whenever one of the files is written
+        """
+
+        fingerprint = []
+        for filepath in filepaths:
+            stat = os.stat(filepath)
+            fingerprint.append((filepath, stat.st_size, stat.st_mtime_ns))
+
+        return tuple(fingerprint)
+
+    def get(self, scene_filepath: str, width: int, height: int, backend: str = "numpy") -> tuple:
+        """
+        @param scene_filepath path to the JSON scene description
+        @param width image width in pixels a scene that is not cached yet is loaded with
+        @param height image height in pixels a scene that is not cached yet is loaded with
+        @param backend see Scene
+        @return (snapshot, is_cached) the snapshot of the scene and whether it was
+          taken from the cache. The snapshot stays valid until the next call.
+        """
+
+        scene_filepath = os.path.abspath(scene_filepath)
+        key = (scene_filepath, backend)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                fingerprint, snapshot = entry
+                try:
+                    is_current = self.fingerprint([filepath for filepath, _, _ in fingerprint]) == fingerprint
+                except OSError:
+                    is_current = False
+
+                if is_current:
+                    self.entries.move_to_end(key)
+                    return snapshot, True
+
+                logging.info(f"Scene {scene_filepath} changed since it was cached")
+                self.remove(key)
+
+        start_time = time.time()
+        scene = Scene(scene_filepath=scene_filepath, width=width, height=height, backend=backend)
+        fingerprint = self.fingerprint([scene.filepath] + scene.mesh_filepaths)
+        snapshot = SceneSnapshot.create(scene)
+        logging.info(f"Cached scene {scene_filepath} with the {scene.backend} backend, {snapshot.size / 2 ** 20:.2f} MiB "
+                     f"loaded in {time.time() - start_time} seconds")
+
+        with self.lock:
+            self.entries[key] = (fingerprint, snapshot)
+            self.evict()
+
+        return snapshot, False
+
+    def evict(self) -> None:
+        """
+        Remove the least recently used scenes until the cache fits into max_size again,
+        the lock has to be held.
+        """
+
+        while len(self.entries) > 1 and self.size > self.max_size:
+            key = next(iter(self.entries))
+            logging.info(f"Evicting scene {key[0]} with the {key[1]} backend from the cache")
+            self.remove(key)
+
+    def remove(self, key: tuple) -> None:
+        _, snapshot = self.entries.pop(key)
+        snapshot.close()
+        snapshot.unlink()
+
+    def clear(self) -> None:
+        with self.lock:
+            for key in list(self.entries):
+                self.remove(key)
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                "size": self.size,
+                "max_size": self.max_size,
+                "scenes": [{"filepath": filepath, "backend": backend, "size": snapshot.size}
+                           for (filepath, backend), (_, snapshot) in self.entries.items()]
+            }
@@ -1,3 +1,5 @@
+import numpy as np
+
 from pytracer.math.vec3 import Vec3
 
 
@@ -20,3 +22,36 @@ class ShadingSample:
             p=0,
             is_valid=False
         )
+
+
+class ShadingSampleBatch:
+    """
+    Structure-of-arrays counterpart of ShadingSample, one entry per hit of a HitBatch.
+    """
+
+    def __init__(self, brdf: np.ndarray, w: np.ndarray, is_valid: np.ndarray):
+        """
+        @param brdf (N, 3) sampled brdf values
+        @param w (N, 3) sampled directions
+        @param is_valid (N,) boolean, false for hits without a sample
+        """
+
+        self.brdf = brdf
+        self.w = w
+        self.is_valid = is_valid
+
+    @classmethod
+    def make_empty(cls, n: int) -> 'ShadingSampleBatch':
+        return ShadingSampleBatch(
+            brdf=np.zeros((n, 3)),
+            w=np.zeros((n, 3)),
+            is_valid=np.zeros(n, dtype=bool)
+        )
+
+    @classmethod
+    def from_samples(cls, samples: list) -> 'ShadingSampleBatch':
+        return ShadingSampleBatch(
+            brdf=np.array([sample.brdf for sample in samples], dtype=np.float64).reshape((-1, 3)),
+            w=np.array([sample.w for sample in samples], dtype=np.float64).reshape((-1, 3)),
+            is_valid=np.array([sample.is_valid for sample in samples], dtype=bool)
+        )
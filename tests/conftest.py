@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+ROOT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT_PATH)
+
+from pytracer import Scene  # noqa: E402
+
+SCENES_PATH = os.path.join(ROOT_PATH, "scenes")
+
+# the bundled scenes, see scenes/
+SCENE_NAMES = sorted(os.path.splitext(filename)[0] for filename in os.listdir(SCENES_PATH)
+                     if filename.endswith(".json"))
+
+
+@pytest.fixture
+def load_scene():
+    """
+    @return a function loading a bundled scene by name at a small resolution,
+      further keyword arguments are passed to Scene
+    """
+
+    def load(name: str, width: int = 32, height: int = 24, **kwargs) -> Scene:
+        return Scene(os.path.join(SCENES_PATH, f"{name}.json"), width, height, use_bundle=False, **kwargs)
+
+    return load
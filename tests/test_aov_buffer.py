@@ -0,0 +1,19 @@
+import numpy as np
+
+from pytracer.aov_buffer import AovBuffer
+
+
+def test_missing_samples_keep_the_ids_of_earlier_hits():
+    aov_buffer = AovBuffer(2, 1)
+    samples = AovBuffer.empty_samples(3)
+    samples[0, AovBuffer.DEPTH] = 2.0
+    samples[0, AovBuffer.MATERIAL_ID] = 1.0
+    samples[0, AovBuffer.PRIMITIVE_ID] = 5.0
+
+    # the first pixel is hit by its first sample only, the second pixel is missed
+    aov_buffer.accumulate(np.array([0, 0, 1]), samples)
+
+    images = aov_buffer.images()
+    assert images["material_id"].tolist() == [[1.0, -1.0]]
+    assert images["primitive_id"].tolist() == [[5.0, -1.0]]
+    assert images["depth"].tolist() == [[2.0, np.inf]]
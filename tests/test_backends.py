@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+from conftest import SCENE_NAMES
+from pytracer.benchmarks.benchmark import BACKEND_TOLERANCE
+from pytracer.integrators.whitted_numba_integrator import WhittedNumbaIntegrator
+
+pytest.importorskip("numba")
+
+
+@pytest.mark.parametrize("scene_name", SCENE_NAMES)
+def test_numba_backend_renders_the_numpy_image(load_scene, scene_name):
+    numpy_scene = load_scene(scene_name)
+    numba_scene = load_scene(scene_name, backend="numba")
+    assert isinstance(numba_scene.integrator, WhittedNumbaIntegrator)
+
+    pixel_indices = np.arange(numpy_scene.width * numpy_scene.height)
+    rays = numpy_scene.camera.make_worldspace_rays(pixel_indices // numpy_scene.width,
+                                                   pixel_indices % numpy_scene.width, [[0.5, 0.5]])
+    np.testing.assert_allclose(numba_scene.integrator.integrate_batch(rays),
+                               numpy_scene.integrator.integrate_batch(rays), rtol=0.0, atol=BACKEND_TOLERANCE)
@@ -0,0 +1,30 @@
+import os
+
+import numpy as np
+
+from pytracer.checkpoint import Checkpoint
+
+
+def test_resume_maps_the_saved_pixels(load_scene, tmp_path):
+    scene = load_scene("teapot", width=4, height=3)
+    directory = str(tmp_path / "checkpoint")
+
+    checkpoint = Checkpoint(directory, scene)
+    framebuffer, spp = checkpoint.open_framebuffer(scene.width, scene.height, resume=False)
+    assert spp == 0 and checkpoint.scene_fingerprint is None
+
+    framebuffer.accumulate(np.arange(scene.width * scene.height), np.ones((scene.width * scene.height, 3)))
+    checkpoint.save(framebuffer, 1)
+    # samples of an unfinished pass are not part of the checkpoint
+    framebuffer.accumulate(np.array([0]), np.ones((1, 3)))
+
+    resumed = Checkpoint(directory, scene)
+    resumed_framebuffer, resumed_spp = resumed.open_framebuffer(scene.width, scene.height, resume=True)
+    assert resumed_spp == 1
+    assert resumed_framebuffer.filepath == resumed.accumulation_filepath
+    assert not os.path.exists(os.path.join(directory, "pixels_1.npy"))
+    assert resumed_framebuffer.sample_counts().tolist() == np.ones((scene.height, scene.width)).tolist()
+
+    resumed.save(resumed_framebuffer, 2)
+    assert sorted(os.listdir(directory)) == [Checkpoint.ACCUMULATION_FILENAME, "pixels_2.npy",
+                                             Checkpoint.STATE_FILENAME]
@@ -0,0 +1,104 @@
+import socket
+import threading
+import time
+
+import numpy as np
+
+from pytracer import Renderer
+from pytracer.distributed.protocol import encode_message, receive_message
+from pytracer.distributed.render_coordinator import RenderCoordinator
+from pytracer.distributed.render_worker import RenderWorker
+from pytracer.framebuffer import Framebuffer
+from pytracer.renderer import trace_pixels
+
+HOST = "127.0.0.1"
+SPP = 2
+TIMEOUT = 120.0
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind((HOST, 0))
+        return probe.getsockname()[1]
+
+
+def local_radiance(scene) -> np.ndarray:
+    framebuffer = Framebuffer(scene.width, scene.height)
+    for rays, spectrum, _, _ in trace_pixels(scene, np.arange(scene.width * scene.height), scene.width, SPP):
+        framebuffer.accumulate(rays.pixel_indices, spectrum)
+
+    return framebuffer.radiance()
+
+
+def wait_until_listening(port: int) -> None:
+    """
+    Wait until the coordinator listens on the port. Workers that find no coordinator retry only every
+    CONNECT_RETRY_INTERVAL, one of them could render the whole frame before the other one connects.
+    """
+
+    deadline = time.monotonic() + TIMEOUT
+    while time.monotonic() < deadline:
+        with socket.socket() as probe:
+            try:
+                probe.bind((HOST, port))
+            except OSError:
+                return
+        time.sleep(0.01)
+
+    raise TimeoutError(f"The coordinator does not listen on {HOST}:{port}")
+
+
+def start_coordinator(scene, port: int) -> tuple:
+    tiles = Renderer.compute_tiles(width=scene.width, height=scene.height, tile_size=8)
+    coordinator = RenderCoordinator(scene, Renderer.frame_tasks(tiles, scene.width, SPP, 1), HOST, port)
+    thread = threading.Thread(target=coordinator.render, daemon=True)
+    thread.start()
+    wait_until_listening(port)
+    return coordinator, thread
+
+
+def start_workers(port: int, count: int) -> list:
+    threads = [threading.Thread(target=RenderWorker(HOST, port).run, daemon=True) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+
+    return threads
+
+
+def test_two_workers_render_the_local_image(load_scene):
+    scene = load_scene("box1")
+    port = free_port()
+    coordinator, coordinator_thread = start_coordinator(scene, port)
+    workers = start_workers(port, 2)
+
+    coordinator_thread.join(TIMEOUT)
+    for worker in workers:
+        worker.join(TIMEOUT)
+
+    assert not coordinator_thread.is_alive()
+    np.testing.assert_allclose(coordinator.framebuffer.radiance(), local_radiance(scene), rtol=1e-6, atol=1e-6)
+
+
+def test_tiles_of_a_worker_with_a_malformed_result_are_rendered_again(load_scene):
+    scene = load_scene("box1")
+    port = free_port()
+    coordinator, coordinator_thread = start_coordinator(scene, port)
+
+    worker = RenderWorker(HOST, port)
+    with worker.connect() as connection, connection.makefile("rwb") as stream:
+        stream.write(encode_message({"type": "hello", "name": "malformed"}))
+        stream.flush()
+        assert receive_message(stream)[0]["type"] == "scene"
+        assert receive_message(stream)[0]["type"] == "task"
+
+        # a result without the id of its task
+        stream.write(encode_message({"type": "result"}))
+        stream.flush()
+
+    workers = start_workers(port, 2)
+    coordinator_thread.join(TIMEOUT)
+    for worker_thread in workers:
+        worker_thread.join(TIMEOUT)
+
+    assert not coordinator_thread.is_alive()
+    np.testing.assert_allclose(coordinator.framebuffer.radiance(), local_radiance(scene), rtol=1e-6, atol=1e-6)
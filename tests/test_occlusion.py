@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from conftest import SCENE_NAMES
+from pytracer.ray import Ray
+from pytracer.ray_batch import RayBatch
+
+# the light source is at t = 1 - Ray.ESP along a shadow ray, see WhittedIntegrator.is_occluded
+T_MAX = 1.0 - Ray.ESP
+
+
+def shadow_rays(scene) -> list:
+    """
+    @return the rays from the primary hits of the pixel centers to every light source of the scene
+    """
+
+    rays = []
+    for k in range(scene.width * scene.height):
+        ray = scene.camera.make_worldspace_ray(k // scene.width, k % scene.width, (0.5, 0.5))
+        hit_record = scene.intersectable_list.intersect(ray)
+        if not hit_record.is_valid():
+            continue
+
+        for light_source in scene.light_sources:
+            light_direction = light_source.sample().position - hit_record.position
+            rays.append(Ray(origin=hit_record.position, direction=light_direction))
+
+    return rays
+
+
+def closest_hit_occluded(scene, ray: Ray) -> bool:
+    """
+    @return true if one of the surfaces casting shadows has a closest hit in front of the light source
+    """
+
+    return any(item.material.does_cast_shadows() and item.closest_hit(ray, T_MAX) is not None
+               for item in scene.intersectable_list.container)
+
+
+@pytest.mark.parametrize("scene_name", SCENE_NAMES)
+def test_any_hit_query_matches_the_closest_hit_shadow_test(load_scene, scene_name):
+    scene = load_scene(scene_name)
+    rays = shadow_rays(scene)
+    assert rays
+
+    is_occluded = [scene.intersectable_list.occluded(ray, T_MAX) for ray in rays]
+    assert is_occluded == [closest_hit_occluded(scene, ray) for ray in rays]
+
+    for ray, ray_is_occluded in zip(rays, is_occluded):
+        # the closest hit of the whole scene occludes the light unless its surface casts no shadows, e.g. glass
+        hit = scene.intersectable_list.closest_hit(ray, T_MAX)
+        if hit is None:
+            assert not ray_is_occluded
+        elif scene.intersectable_list.container[hit[1][0]].material.does_cast_shadows():
+            assert ray_is_occluded
+
+
+@pytest.mark.parametrize("scene_name", SCENE_NAMES)
+def test_batched_any_hit_query_matches_the_scalar_one(load_scene, scene_name):
+    scene = load_scene(scene_name)
+    rays = shadow_rays(scene)
+    batch = RayBatch(
+        origins=np.array([ray.origin for ray in rays], dtype=np.float64),
+        directions=np.array([ray.direction for ray in rays], dtype=np.float64),
+        pixel_indices=np.zeros(len(rays), dtype=np.int64)
+    )
+
+    is_occluded = scene.intersectable_list.occluded_batch(batch, np.full(len(rays), T_MAX))
+    assert is_occluded.tolist() == [scene.intersectable_list.occluded(ray, T_MAX) for ray in rays]
@@ -0,0 +1,22 @@
+import numpy as np
+
+from pytracer.render_features import CostScheduling, MIN_TILE_SIZE
+from pytracer.renderer import Renderer
+
+
+def test_cost_schedule_covers_every_pixel_once():
+    width, height = 40, 30
+    pixel_costs = np.ones((height, width))
+    pixel_costs[:10, :10] = 100.0
+    tiles = Renderer.compute_tiles(width, height, tile_size=16)
+
+    scheduled_tiles = CostScheduling.schedule_tiles(tiles, pixel_costs, task_count=8)
+    coverage = np.zeros((height, width), dtype=int)
+    for row_begin, row_end, col_begin, col_end in scheduled_tiles:
+        coverage[row_begin:row_end, col_begin:col_end] += 1
+
+    assert (coverage == 1).all()
+    # the expensive corner is split and scheduled first
+    row_begin, row_end, col_begin, col_end = scheduled_tiles[0]
+    assert row_end <= 10 and col_end <= 10
+    assert max(row_end - row_begin, col_end - col_begin) <= 2 * MIN_TILE_SIZE
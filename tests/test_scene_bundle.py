@@ -0,0 +1,49 @@
+import os
+import shutil
+
+from conftest import ROOT_PATH
+from pytracer import Scene
+from pytracer.scene_bundle import SceneBundle
+
+
+def copy_scene(directory, name: str) -> str:
+    """
+    @return the path of a copy of a bundled scene and its meshes in the given directory
+    """
+
+    os.makedirs(directory / "scenes")
+    shutil.copytree(os.path.join(ROOT_PATH, "meshes"), directory / "meshes",
+                    ignore=shutil.ignore_patterns("*.cache"))
+    return shutil.copy(os.path.join(ROOT_PATH, "scenes", f"{name}.json"), directory / "scenes")
+
+
+def load_bundle(scene_filepath: str):
+    with open(scene_filepath, "rb") as file:
+        scene_data = file.read()
+
+    scene = Scene(scene_filepath, 8, 6, use_bundle=False)
+    return SceneBundle(scene_filepath, scene_data, scene.mesh_filepaths).load()
+
+
+def test_bundle_does_not_depend_on_the_working_directory(tmp_path, monkeypatch):
+    scene_filepath = copy_scene(tmp_path, "teapot_instances")
+
+    monkeypatch.chdir(tmp_path)
+    Scene(scene_filepath, 8, 6)
+    assert os.path.exists(scene_filepath + SceneBundle.SUFFIX)
+
+    monkeypatch.chdir(tmp_path / "scenes")
+    assert load_bundle(os.path.basename(scene_filepath)) is not None
+
+
+def test_bundle_of_a_missing_mesh_is_stale(tmp_path):
+    scene_filepath = copy_scene(tmp_path, "teapot")
+    Scene(scene_filepath, 8, 6)
+
+    with open(scene_filepath, "rb") as file:
+        scene_data = file.read()
+    bundle = SceneBundle(scene_filepath, scene_data, ["../meshes/teapot.obj"])
+    assert bundle.load() is not None
+
+    os.remove(tmp_path / "meshes" / "teapot.obj")
+    assert bundle.load() is None
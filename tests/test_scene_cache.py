@@ -0,0 +1,36 @@
+import os
+import threading
+
+from conftest import SCENES_PATH
+from pytracer.service.scene_cache import SceneCache
+
+
+def test_cache_can_be_reported_while_scenes_are_loaded_and_evicted():
+    # every scene evicts the previous one
+    scene_cache = SceneCache(max_size=1)
+    errors = []
+    is_loading = True
+
+    def report():
+        while is_loading:
+            try:
+                for scene in scene_cache.to_dict()["scenes"]:
+                    assert scene["size"] > 0
+            except Exception as error:
+                errors.append(error)
+                return
+
+    reporter = threading.Thread(target=report)
+    reporter.start()
+    try:
+        for _ in range(10):
+            for name in ("box1", "refractive", "triangle"):
+                _, is_cached = scene_cache.get(os.path.join(SCENES_PATH, f"{name}.json"), 8, 6)
+                assert not is_cached
+    finally:
+        is_loading = False
+        reporter.join()
+        scene_cache.clear()
+
+    assert errors == []
+    assert scene_cache.to_dict()["scenes"] == []
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from conftest import SCENE_NAMES
+from pytracer.integrators.whitted_integrator import WhittedIntegrator
+from pytracer.integrators.whitted_wavefront_integrator import WhittedWavefrontIntegrator
+from pytracer.ray_batch import RayBatch
+
+
+def primary_rays(scene) -> RayBatch:
+    """
+    @return the rays through the centers of all pixels of the scene
+    """
+
+    pixel_indices = np.arange(scene.width * scene.height)
+    return scene.camera.make_worldspace_rays(pixel_indices // scene.width, pixel_indices % scene.width, [[0.5, 0.5]])
+
+
+@pytest.mark.parametrize("scene_name", SCENE_NAMES)
+def test_batched_intersection_finds_the_scalar_hits(load_scene, scene_name):
+    scene = load_scene(scene_name)
+    rays = primary_rays(scene)
+
+    t, u, v, primitive_ids, item_ids = scene.intersectable_list.intersect_batch_items(rays)
+    for k in range(len(rays)):
+        hit = scene.intersectable_list.closest_hit(rays.ray_at(k))
+        if hit is None:
+            assert item_ids[k] == -1 and t[k] == np.inf
+        else:
+            hit_t, (item_id, primitive_id), hit_u, hit_v = hit
+            assert (item_ids[k], primitive_ids[k]) == (item_id, primitive_id)
+            assert (t[k], u[k], v[k]) == pytest.approx((hit_t, hit_u, hit_v), rel=1e-9, abs=1e-9)
+
+
+@pytest.mark.parametrize("scene_name", SCENE_NAMES)
+def test_wavefront_integrator_renders_the_recursive_image(load_scene, scene_name):
+    scene = load_scene(scene_name, width=16, height=12)
+    rays = primary_rays(scene)
+
+    radiance = WhittedWavefrontIntegrator(scene).integrate_batch(rays)
+    np.testing.assert_allclose(radiance, WhittedIntegrator(scene).integrate_batch(rays), rtol=1e-6, atol=1e-6)